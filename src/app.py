@@ -6,7 +6,7 @@ import sys
 import io
 import uuid
 from contextlib import redirect_stdout, redirect_stderr
-from typing import Tuple
+from typing import Iterator, List
 
 import streamlit as st
 
@@ -47,8 +47,22 @@ if not st.user.is_logged_in:
 # ================================
 # IMPORT (setelah login aman)
 # ================================
-from src.history_store_sheets import get_user_id, save_history, load_history, clear_history
-from src.controller import controller
+from src.history_store import get_user_id, save_history, load_history, clear_history
+from src.controller import controller_stream, warm_ayat_cache
+
+
+@st.cache_resource
+def _warm_ayat_cache_once() -> int:
+    # opsional (AYAT_CACHE_WARM=1): isi cache record ayat sekali per proses
+    try:
+        return warm_ayat_cache()
+    except Exception as e:
+        print(f"[WARN] Warm ayat cache gagal: {e}")
+        return 0
+
+
+if os.getenv("AYAT_CACHE_WARM", "0") == "1":
+    _warm_ayat_cache_once()
 
 # ambil identitas user yang sedang login
 user_id = get_user_id()
@@ -100,16 +114,9 @@ with st.sidebar:
 # ================================
 # Helpers
 # ================================
-def _split_debug(text: str) -> Tuple[str, str]:
-    debug_lines = []
-    content_lines = []
-    for line in text.splitlines():
-        stripped = line.strip()
-        if stripped.startswith("[") and "]" in stripped[:30]:
-            debug_lines.append(line)
-        else:
-            content_lines.append(line)
-    return "\n".join(content_lines).strip(), "\n".join(debug_lines).strip()
+def _is_debug_line(line: str) -> bool:
+    stripped = line.strip()
+    return stripped.startswith("[") and "]" in stripped[:30]
 
 
 def _beautify_output(text: str) -> str:
@@ -130,31 +137,43 @@ def _beautify_output(text: str) -> str:
     return text
 
 
-def _capture_controller_output(user_text: str, session_id: str) -> Tuple[str, str]:
+def _stream_controller_output(user_text: str, session_id: str, debug_sink: List[str]) -> Iterator[str]:
+    """
+    Stream jawaban controller blok per blok (untuk st.write_stream).
+    Baris debug & print stdout dipisah ke debug_sink, stderr ditempel di akhir.
+    """
     buf_out = io.StringIO()
     buf_err = io.StringIO()
+    stream = controller_stream(user_text, session_id=session_id, stream_conclusion=True)
 
-    try:
-        with redirect_stdout(buf_out), redirect_stderr(buf_err):
-            ret = controller(user_text, session_id=session_id)
-    except Exception as e:
-        return f"❌ Terjadi error saat memproses:\n\n```text\n{e}\n```", ""
+    while True:
+        # redirect hanya selama controller jalan, bukan saat Streamlit me-render chunk
+        try:
+            with redirect_stdout(buf_out), redirect_stderr(buf_err):
+                chunk = next(stream, None)
+        except Exception as e:
+            yield f"\n\n❌ Terjadi error saat memproses:\n\n```text\n{e}\n```"
+            break
+        if chunk is None:
+            break
+
+        lines = chunk.split("\n")
+        debug = [line for line in lines if _is_debug_line(line)]
+        if debug:
+            debug_sink.extend(debug)
+            content = "\n".join(line for line in lines if not _is_debug_line(line))
+            if not content.strip():
+                continue
+        else:
+            # token kesimpulan (spasi/newline saja) tetap diteruskan
+            content = chunk
+        if content:
+            yield _beautify_output(content)
 
-    raw = (buf_out.getvalue() or "").strip()
+    debug_sink.extend((buf_out.getvalue() or "").strip().splitlines())
     err = (buf_err.getvalue() or "").strip()
-    ret_text = (ret or "").strip()
-
-    if not raw and ret_text:
-        raw = ret_text
-    elif raw and ret_text and (ret_text not in raw):
-        raw = raw + "\n\n" + ret_text
-
     if err:
-        raw = raw + "\n\n```text\n" + err + "\n```"
-
-    content, debug = _split_debug(raw)
-    content = _beautify_output(content)
-    return content, debug
+        yield "\n\n```text\n" + err + "\n```"
 
 
 # ================================
@@ -215,8 +234,20 @@ if prompt:
         st.markdown(prompt)
 
     with st.chat_message("assistant", avatar="🕌"):
-        with st.spinner("Mencari ayat & menyusun jawaban..."):
-            content, debug = _capture_controller_output(prompt, st.session_state.session_id)
+        # tampilkan tiap blok (header, ayat, kesimpulan) begitu siap, dengan wrapper
+        # chat-output yang sama seperti render history
+        debug_lines: List[str] = []
+        placeholder = st.empty()
+        content = ""
+        for chunk in _stream_controller_output(prompt, st.session_state.session_id, debug_lines):
+            content += chunk
+            placeholder.markdown(f"<div class='chat-output'>{content}</div>", unsafe_allow_html=True)
+        content = content.strip()
+        placeholder.markdown(f"<div class='chat-output'>{content}</div>", unsafe_allow_html=True)
+
+        if st.session_state.show_debug and debug_lines:
+            with st.expander("Debug"):
+                st.code("\n".join(debug_lines), language="text")
 
         # simpan history SETELAH dapat jawaban
         try:
@@ -230,6 +261,4 @@ if prompt:
         except Exception as e:
             st.warning(f"History gagal disimpan: {e}")
 
-        st.markdown(f"<div class='chat-output'>{content}</div>", unsafe_allow_html=True)
-
     st.session_state.messages.append({"role": "assistant", "content": content})
@@ -0,0 +1,283 @@
+# src/cache_utils.py
+from __future__ import annotations
+
+import os
+import sqlite3
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Hashable, Optional
+
+
+# =========================
+# Helpers
+# =========================
+def normalize_cache_text(text: str) -> str:
+    """
+    Normalisasi teks untuk key cache:
+    - Unicode NFKC
+    - lowercase (casefold)
+    - spasi berlebih dirapikan
+    """
+    t = unicodedata.normalize("NFKC", text or "")
+    return " ".join(t.casefold().split())
+
+
+# =========================
+# In-process LRU
+# =========================
+class LRUCache:
+    """
+    LRU thread-safe dengan batas jumlah item, batas byte (opsional), dan TTL (opsional).
+    `sizeof(value)` dipakai untuk menghitung byte per item kalau max_bytes diset.
+    """
+
+    def __init__(
+        self,
+        max_items: int = 1024,
+        max_bytes: Optional[int] = None,
+        ttl: Optional[float] = None,
+        sizeof: Optional[Callable[[Any], int]] = None,
+    ):
+        self.max_items = max(1, int(max_items))
+        self.max_bytes = int(max_bytes) if max_bytes else None
+        self.ttl = float(ttl) if ttl else None
+        self._sizeof = sizeof or (lambda v: 0)
+
+        self._data: "OrderedDict[Hashable, tuple]" = OrderedDict()  # key -> (value, size, stored_at)
+        self._bytes = 0
+        self._lock = threading.RLock()
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expired = 0
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def __contains__(self, key: Hashable) -> bool:
+        return self.get(key, _MISSING, count=False) is not _MISSING
+
+    def get(self, key: Hashable, default: Any = None, count: bool = True) -> Any:
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                if count:
+                    self.misses += 1
+                return default
+
+            value, size, stored_at = item
+            if self.ttl is not None and (time.time() - stored_at) > self.ttl:
+                self._remove(key)
+                self.expired += 1
+                if count:
+                    self.misses += 1
+                return default
+
+            self._data.move_to_end(key)
+            if count:
+                self.hits += 1
+            return value
+
+    def set(self, key: Hashable, value: Any) -> None:
+        size = int(self._sizeof(value) or 0) if self.max_bytes else 0
+        with self._lock:
+            if key in self._data:
+                self._remove(key)
+
+            # item yang lebih besar dari seluruh budget tidak disimpan
+            if self.max_bytes is not None and size > self.max_bytes:
+                return
+
+            self._data[key] = (value, size, time.time())
+            self._bytes += size
+            self._evict()
+
+    def pop(self, key: Hashable, default: Any = None) -> Any:
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                return default
+            self._remove(key)
+            return item[0]
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+            self._bytes = 0
+
+    def purge_expired(self) -> int:
+        """Buang semua item yang TTL-nya lewat (tanpa menunggu di-get). Return jumlah yang dibuang."""
+        if self.ttl is None:
+            return 0
+        cutoff = time.time() - self.ttl
+        with self._lock:
+            old = [k for k, (_, _, stored_at) in self._data.items() if stored_at < cutoff]
+            for k in old:
+                self._remove(k)
+            self.expired += len(old)
+            return len(old)
+
+    def sizes(self) -> Dict[Hashable, int]:
+        """Ukuran (byte) per key, sesuai sizeof saat terakhir di-set."""
+        with self._lock:
+            return {k: size for k, (_, size, _) in self._data.items()}
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "items": len(self._data),
+                "bytes": self._bytes,
+                "max_items": self.max_items,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / total, 4) if total else 0.0,
+                "evictions": self.evictions,
+                "expired": self.expired,
+            }
+
+    def _remove(self, key: Hashable) -> None:
+        _, size, _ = self._data.pop(key)
+        self._bytes -= size
+
+    def _evict(self) -> None:
+        while len(self._data) > self.max_items or (
+            self.max_bytes is not None and self._bytes > self.max_bytes
+        ):
+            old_key = next(iter(self._data))
+            self._remove(old_key)
+            self.evictions += 1
+
+
+_MISSING = object()
+
+
+# =========================
+# On-disk tier (SQLite)
+# =========================
+class SQLiteCache:
+    """
+    Key-value cache di SQLite (value = BLOB), bertahan setelah restart.
+    - Eviksi LRU berdasarkan last_used kalau jumlah item > max_items.
+      Jumlah item dilacak di memori (tanpa COUNT(*) per set); COUNT(*) hanya saat eviksi.
+    - TTL opsional berdasarkan created_at.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        table: str = "cache",
+        max_items: int = 100_000,
+        ttl: Optional[float] = None,
+    ):
+        self.path = path
+        self.table = table
+        self.max_items = max(1, int(max_items))
+        self.ttl = float(ttl) if ttl else None
+        self._lock = threading.Lock()
+
+        folder = os.path.dirname(os.path.abspath(path))
+        os.makedirs(folder, exist_ok=True)
+
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            f"""
+            CREATE TABLE IF NOT EXISTS {table} (
+                key TEXT PRIMARY KEY,
+                value BLOB NOT NULL,
+                created_at REAL NOT NULL,
+                last_used REAL NOT NULL
+            )
+            """
+        )
+        self._conn.execute(f"CREATE INDEX IF NOT EXISTS idx_{table}_last_used ON {table}(last_used)")
+
+        self._count = int(self._conn.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0])
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key: str) -> Optional[bytes]:
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                f"SELECT value, created_at FROM {self.table} WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+
+            value, created_at = row
+            if self.ttl is not None and (now - created_at) > self.ttl:
+                cur = self._conn.execute(f"DELETE FROM {self.table} WHERE key = ?", (key,))
+                self._count -= cur.rowcount
+                self.misses += 1
+                return None
+
+            self._conn.execute(f"UPDATE {self.table} SET last_used = ? WHERE key = ?", (now, key))
+            self.hits += 1
+            return bytes(value)
+
+    def set(self, key: str, value: bytes) -> None:
+        now = time.time()
+        with self._lock:
+            cur = self._conn.execute(
+                f"UPDATE {self.table} SET value = ?, created_at = ?, last_used = ? WHERE key = ?",
+                (sqlite3.Binary(value), now, now, key),
+            )
+            if cur.rowcount:
+                return  # key lama ditimpa → jumlah item tetap
+            cur = self._conn.execute(
+                f"INSERT OR REPLACE INTO {self.table} (key, value, created_at, last_used) VALUES (?, ?, ?, ?)",
+                (key, sqlite3.Binary(value), now, now),
+            )
+            self._count += cur.rowcount
+            if self._count > self.max_items:
+                self._evict()
+
+    def delete(self, key: str) -> None:
+        with self._lock:
+            cur = self._conn.execute(f"DELETE FROM {self.table} WHERE key = ?", (key,))
+            self._count -= cur.rowcount
+
+    def clear(self) -> None:
+        with self._lock:
+            self._conn.execute(f"DELETE FROM {self.table}")
+            self._count = 0
+
+    def count(self) -> int:
+        with self._lock:
+            return int(self._conn.execute(f"SELECT COUNT(*) FROM {self.table}").fetchone()[0])
+
+    def stats(self) -> Dict[str, Any]:
+        total = self.hits + self.misses
+        return {
+            "path": self.path,
+            "items": self.count(),
+            "max_items": self.max_items,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / total, 4) if total else 0.0,
+            "evictions": self.evictions,
+        }
+
+    def _evict(self) -> None:
+        # hitung ulang yang pasti (proses lain bisa berbagi file cache yang sama)
+        self._count = int(self._conn.execute(f"SELECT COUNT(*) FROM {self.table}").fetchone()[0])
+        over = self._count - self.max_items
+        if over <= 0:
+            return
+        self._conn.execute(
+            f"DELETE FROM {self.table} WHERE key IN "
+            f"(SELECT key FROM {self.table} ORDER BY last_used ASC LIMIT ?)",
+            (over,),
+        )
+        self._count -= over
+        self.evictions += over
@@ -1,9 +1,10 @@
 # src/chatbot.py
 from __future__ import annotations
 
+from array import array
 from typing import Dict, Any, List, Optional
 
-from state import get_state
+from state import get_state, save_state
 
 from query_utils import (
     enrich_topic_with_terminology,
@@ -14,8 +15,9 @@ from query_utils import (
 )
 
 from embeddings import embed_query
-from neo4j_client import graphrag_search
+from neo4j_client import graphrag_search_ids
 from search_flow import format_many
+from result_cursor import ResultCursor
 
 # router_chain, RouteDecision, fallback_extract_more_n:
 from router import router_chain, RouteDecision, fallback_extract_more_n
@@ -34,54 +36,39 @@ def _ensure_state_defaults(state: Dict[str, Any]) -> None:
         "last_focus": [],
         "active_topic": None,
         "score_threshold": 0.70,  # dipakai graphrag_search
+        "result_cursor": None,    # ResultCursor.to_dict() dari query terakhir
     }
     for k, v in defaults.items():
         state.setdefault(k, v)
 
 
-def deduplicate_ayat(ayat_list: List[Dict[str, Any]], debug_label: str = "") -> List[Dict[str, Any]]:
-    """
-    Deduplikasi ayat berdasarkan identifier unik.
-    Prioritas: ayat_id / IdAyat → (nama_surat.upper(), ayat_ke)
-    """
-    unique: List[Dict[str, Any]] = []
-    seen = set()
-    duplicates_found = 0
-
-    for rec in ayat_list or []:
-        ayat_id = rec.get("ayat_id") or rec.get("IdAyat")
-        if ayat_id is not None:
-            key = f"ID:{ayat_id}"
-        else:
-            surat = str(rec.get("nama_surat", "UNKNOWN")).strip().upper()
-            ayat_ke = rec.get("ayat_ke", 0)
-            key = (surat, ayat_ke)
-
-        if key not in seen:
-            seen.add(key)
-            unique.append(rec)
-        else:
-            duplicates_found += 1
-            if debug_label:
-                print(f"[DUPLIKAT {debug_label}] {key} → dilewati")
-
-    if debug_label:
-        print(f"[DEDUP {debug_label}] input={len(ayat_list)} unik={len(unique)} duplikat={duplicates_found}")
-
-    return unique
-
-
 def _safe_getattr(obj: Any, name: str, default: Any = None) -> Any:
     """Biar aman kalau field di RouteDecision beda-beda."""
     return getattr(obj, name, default)
 
 
+def _make_search_fn(vec, score_threshold: float):
+    """search_fn(limit) untuk ResultCursor: vector search id+skor mentah (dedup di ResultCursor)."""
+    # embedding di session disimpan sebagai array float32 → driver Neo4j butuh list
+    vec = list(vec)
+    def _search(limit: int) -> List[Dict[str, Any]]:
+        return graphrag_search_ids(vec, limit=limit, score_threshold=score_threshold)
+    return _search
+
+
 def run_chatbot(user_text: str, session_id: str = "default") -> str:
     user_text = (user_text or "").strip()
     if not user_text:
         return "Pertanyaan kosong."
 
     state = get_state(session_id)
+    try:
+        return _run_chatbot(user_text, state)
+    finally:
+        save_state(session_id, state)
+
+
+def _run_chatbot(user_text: str, state: Dict[str, Any]) -> str:
     _ensure_state_defaults(state)
 
     # =========================
@@ -121,32 +108,32 @@ def run_chatbot(user_text: str, session_id: str = "default") -> str:
         # smart limit: pertanyaan "beda/vs/semua" bisa naik limit otomatis
         limit = get_smart_search_limit(user_text, default=int(state["last_limit"] or state["page_size"]))
 
+        # hasil ringan (nama_surat, ayat_ke, score); isi ayat di-fetch format_many per halaman
         vec = embed_query(enriched_topic)
-        results = graphrag_search(
-            vec,
+        cursor = ResultCursor.open(
+            _make_search_fn(vec, float(state["score_threshold"])),
             limit=limit,
-            score_threshold=float(state["score_threshold"]),
+            # perkiraan jumlah tampil hanya untuk ukuran over-fetch
+            show=get_smart_ayat_count(user_text, available=limit, default=int(state["page_size"])),
         )
-        results = deduplicate_ayat(results, debug_label="NEW")
 
-        # smart jumlah ayat yang ditampilkan awal
-        shown = min(
-            get_smart_ayat_count(user_text, available=len(results), default=int(state["page_size"])),
-            len(results),
-        )
+        # smart jumlah ayat yang ditampilkan awal, dibatasi jumlah hasil yang benar-benar ada
+        want = get_smart_ayat_count(user_text, available=len(cursor.candidates), default=int(state["page_size"]))
+        page = cursor.take(want)
 
-        state["last_query_embedding"] = vec
+        state["last_query_embedding"] = array("f", vec)
         state["last_query_text"] = enriched_topic
-        state["last_results"] = results
-        state["shown"] = shown
-        state["last_limit"] = limit
+        state["last_results"] = cursor.candidates
+        state["shown"] = cursor.shown
+        state["last_limit"] = cursor.fetched_limit
+        state["result_cursor"] = cursor.to_dict(include_candidates=False)
         state["last_focus"] = focus
         state["active_topic"] = enriched_topic
 
-        if not results:
+        if not page:
             return "Tidak ada hasil yang cocok."
 
-        return format_many(results[:shown], focus=focus)
+        return format_many(page, focus=focus)
 
     # ======================
     # 3) TAMBAH HASIL (MORE)
@@ -154,22 +141,22 @@ def run_chatbot(user_text: str, session_id: str = "default") -> str:
     if action == "MORE":
         # kalau user bilang "tambah 10", tampilkan 10 (bukan cuma page_size)
         step = int(add_k) if add_k else int(state["page_size"])
-        state["last_limit"] = int(state["last_limit"]) + step
 
-        results = graphrag_search(
-            state["last_query_embedding"],
-            limit=int(state["last_limit"]),
-            score_threshold=float(state["score_threshold"]),
+        # lanjut dari cursor kandidat yang sudah ada; query ulang hanya kalau kandidat habis
+        cursor = ResultCursor.from_dict(state.get("result_cursor"), candidates=state["last_results"]) or ResultCursor(
+            candidates=state["last_results"],
+            fetched_limit=int(state["last_limit"]),
+            shown=int(state["shown"]),
+        )
+        tambahan = cursor.take(
+            step,
+            search_fn=_make_search_fn(state["last_query_embedding"], float(state["score_threshold"])),
         )
-        results = deduplicate_ayat(results, debug_label="MORE")
-
-        old_shown = int(state["shown"])
-        new_shown = min(len(results), old_shown + step)
-
-        tambahan = results[old_shown:new_shown]
 
-        state["last_results"] = results
-        state["shown"] = new_shown
+        state["last_results"] = cursor.candidates
+        state["shown"] = cursor.shown
+        state["last_limit"] = cursor.fetched_limit
+        state["result_cursor"] = cursor.to_dict(include_candidates=False)
         state["last_focus"] = focus
 
         return (
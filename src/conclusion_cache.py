@@ -0,0 +1,231 @@
+# src/conclusion_cache.py
+from __future__ import annotations
+
+import os
+import json
+import math
+import base64
+import hashlib
+from array import array
+from typing import Any, Dict, Iterable, List, Optional, Set, Tuple
+
+from cache_utils import LRUCache, SQLiteCache, normalize_cache_text
+from query_utils import resolve_surat_key
+from record_cache import AYAT_CACHE
+
+# =========================
+# Cache kesimpulan (LRU + TTL in-process, SQLite di disk)
+# =========================
+# Kesimpulan dibuat dengan temperature=0 → untuk (prompt, topik, ayat, sumber, is_final)
+# yang sama, hasilnya boleh dipakai ulang.
+CONCLUSION_CACHE_ENABLED = os.getenv("CONCLUSION_CACHE_ENABLED", "1") != "0"
+CONCLUSION_CACHE_TTL = float(os.getenv("CONCLUSION_CACHE_TTL", str(7 * 24 * 3600)))
+CONCLUSION_CACHE_MEMORY_ITEMS = int(os.getenv("CONCLUSION_CACHE_MEMORY_ITEMS", "512"))
+CONCLUSION_CACHE_DISK_ITEMS = int(os.getenv("CONCLUSION_CACHE_DISK_ITEMS", "20000"))
+CONCLUSION_CACHE_PATH = os.getenv("CONCLUSION_CACHE_PATH", ".cache/conclusions.sqlite3")
+
+# near-duplicate: topik beda redaksi ("gambaran hisab" vs "hisab itu apa") tapi set ayat sama
+CONCLUSION_NEAR_DUP = os.getenv("CONCLUSION_NEAR_DUP", "0") == "1"
+CONCLUSION_NEAR_DUP_THRESHOLD = float(os.getenv("CONCLUSION_NEAR_DUP_THRESHOLD", "0.92"))
+CONCLUSION_NEAR_DUP_MAX_TOPICS = int(os.getenv("CONCLUSION_NEAR_DUP_MAX_TOPICS", "16"))
+
+# (exact_key, set_key, topik ternormalisasi)
+ConclusionKeys = Tuple[str, str, str]
+
+
+def _hash(parts: List[Any]) -> str:
+    raw = json.dumps(parts, ensure_ascii=False, separators=(",", ":"))
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+def ayat_ids(records: Iterable[Dict[str, Any]]) -> List[Tuple[str, int]]:
+    """Id stabil (surat_key, ayat_ke) sesuai urutan record (urutan ikut menentukan prompt)."""
+    out = []
+    for r in records:
+        ayat = r.get("ayat_ke", r.get("ayat"))
+        out.append((resolve_surat_key(str(r.get("nama_surat", ""))), int(ayat or 0)))
+    return out
+
+
+def conclusion_keys(prompt_version: str, topic: str, records: List[Dict[str, Any]],
+                    sources: Set[str], is_final: bool) -> ConclusionKeys:
+    """
+    records = record yang benar-benar masuk prompt (sudah dipotong max_records).
+    set_key sama untuk semua topik dengan ayat/sumber/prompt yang sama (untuk near-dup).
+    Versi data ayat (AYAT_CACHE.version) ikut key: data Neo4j di-invalidate → kesimpulan lama tidak dipakai.
+    """
+    topic_norm = normalize_cache_text(topic or "")
+    base = [prompt_version, AYAT_CACHE.version, bool(is_final), sorted(sources or []), ayat_ids(records)]
+    return _hash(base + [topic_norm]), _hash(base), topic_norm
+
+
+def cosine_similarity(a: List[float], b: List[float]) -> float:
+    dot = sum(x * y for x, y in zip(a, b))
+    na = math.sqrt(sum(x * x for x in a))
+    nb = math.sqrt(sum(y * y for y in b))
+    return dot / (na * nb) if na and nb else 0.0
+
+
+class ConclusionCache:
+    """
+    Cache teks kesimpulan.
+    - Exact: key = hash(versi prompt, versi data ayat, topik, is_final, sumber, id ayat berurutan).
+    - Near-dup (opsional): per set_key simpan daftar (topik, exact_key, embedding topik).
+      Embedding disimpan saat put, jadi lookup cukup embed topik baru sekali lalu bandingkan
+      (cosine >= threshold) dengan vektor tersimpan.
+    """
+
+    def __init__(self, path: Optional[str] = CONCLUSION_CACHE_PATH, ttl: float = CONCLUSION_CACHE_TTL,
+                 memory_items: int = CONCLUSION_CACHE_MEMORY_ITEMS, disk_items: int = CONCLUSION_CACHE_DISK_ITEMS,
+                 near_dup: bool = CONCLUSION_NEAR_DUP, threshold: float = CONCLUSION_NEAR_DUP_THRESHOLD):
+        self.path = path
+        self.ttl = ttl
+        self.disk_items = disk_items
+        self.near_dup = near_dup
+        self.threshold = threshold
+        self._memory = LRUCache(max_items=memory_items, ttl=ttl)
+        self._topics = LRUCache(max_items=memory_items, ttl=ttl)
+        self._disk: Optional[SQLiteCache] = None
+        self._disk_topics: Optional[SQLiteCache] = None
+        self._disk_failed = False
+        self.near_dup_hits = 0
+
+    def _get_disk(self) -> Tuple[Optional[SQLiteCache], Optional[SQLiteCache]]:
+        if self._disk is None and self.path and not self._disk_failed:
+            try:
+                self._disk = SQLiteCache(self.path, table="conclusions", max_items=self.disk_items, ttl=self.ttl)
+                self._disk_topics = SQLiteCache(self.path, table="conclusion_topics",
+                                                max_items=self.disk_items, ttl=self.ttl)
+            except Exception as e:
+                self._disk_failed = True
+                print(f"[WARN] Cache kesimpulan disk tidak bisa dibuka ({e}) → hanya pakai memori")
+        return self._disk, self._disk_topics
+
+    # ---------- exact ----------
+    def _get_exact(self, key: str) -> Optional[str]:
+        text = self._memory.get(key)
+        if text is not None:
+            return text
+        disk, _ = self._get_disk()
+        if disk is not None:
+            blob = disk.get(key)
+            if blob is not None:
+                text = blob.decode("utf-8")
+                self._memory.set(key, text)
+                return text
+        return None
+
+    def get(self, keys: ConclusionKeys) -> Optional[str]:
+        if not CONCLUSION_CACHE_ENABLED:
+            return None
+        exact_key, set_key, topic_norm = keys
+        text = self._get_exact(exact_key)
+        if text is not None or not self.near_dup:
+            return text
+        return self._get_near_dup(set_key, topic_norm)
+
+    def put(self, keys: ConclusionKeys, text: str) -> None:
+        if not CONCLUSION_CACHE_ENABLED or not text:
+            return
+        exact_key, set_key, topic_norm = keys
+        self._memory.set(exact_key, text)
+        disk, _ = self._get_disk()
+        if disk is not None:
+            try:
+                disk.set(exact_key, text.encode("utf-8"))
+            except Exception as e:
+                print(f"[WARN] Gagal simpan kesimpulan ke disk cache: {e}")
+        if self.near_dup:
+            self._remember_topic(set_key, topic_norm, exact_key)
+
+    # ---------- near-duplicate ----------
+    @staticmethod
+    def _embed(topic_norm: str) -> List[float]:
+        from embeddings import embed_query  # lazy: modul ini tidak wajib butuh OpenAI
+        return embed_query(topic_norm)
+
+    def _load_topics(self, set_key: str) -> List[Tuple[str, str, array]]:
+        """Daftar (topik, exact_key, embedding float32) untuk set_key."""
+        topics = self._topics.get(set_key)
+        if topics is not None:
+            return list(topics)
+        _, disk_topics = self._get_disk()
+        if disk_topics is not None:
+            blob = disk_topics.get(set_key)
+            if blob is not None:
+                topics = []
+                for entry in json.loads(blob.decode("utf-8")):
+                    if len(entry) < 3:
+                        continue  # format lama tanpa embedding → dilewati
+                    vec = array("f")
+                    vec.frombytes(base64.b64decode(entry[2]))
+                    topics.append((entry[0], entry[1], vec))
+                self._topics.set(set_key, topics)
+                return list(topics)
+        return []
+
+    def _remember_topic(self, set_key: str, topic_norm: str, exact_key: str) -> None:
+        try:
+            vec = array("f", self._embed(topic_norm))
+        except Exception as e:
+            print(f"[WARN] Embedding topik kesimpulan gagal ({e}) → topik tidak diindex untuk near-dup")
+            return
+        topics = [t for t in self._load_topics(set_key) if t[0] != topic_norm]
+        topics.append((topic_norm, exact_key, vec))
+        topics = topics[-CONCLUSION_NEAR_DUP_MAX_TOPICS:]
+        self._topics.set(set_key, topics)
+        _, disk_topics = self._get_disk()
+        if disk_topics is not None:
+            try:
+                payload = [[t, k, base64.b64encode(v.tobytes()).decode("ascii")] for t, k, v in topics]
+                disk_topics.set(set_key, json.dumps(payload, ensure_ascii=False).encode("utf-8"))
+            except Exception as e:
+                print(f"[WARN] Gagal simpan index topik kesimpulan: {e}")
+
+    def _get_near_dup(self, set_key: str, topic_norm: str) -> Optional[str]:
+        topics = self._load_topics(set_key)
+        if not topics:
+            return None
+        try:
+            query_vec = self._embed(topic_norm)  # satu-satunya embed per lookup
+        except Exception as e:
+            print(f"[WARN] Near-dup kesimpulan gagal: {e}")
+            return None
+        best_key, best_sim = None, self.threshold
+        for _, other_key, other_vec in topics:
+            sim = cosine_similarity(query_vec, other_vec)
+            if sim >= best_sim:
+                best_key, best_sim = other_key, sim
+
+        if best_key is None:
+            return None
+        text = self._get_exact(best_key)
+        if text is not None:
+            self.near_dup_hits += 1
+            print(f"[CACHE] Kesimpulan near-dup dipakai (cosine={best_sim:.3f})")
+        return text
+
+    def clear(self) -> None:
+        self._memory.clear()
+        self._topics.clear()
+        disk, disk_topics = self._get_disk()
+        if disk is not None:
+            disk.clear()
+        if disk_topics is not None:
+            disk_topics.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        disk, _ = self._get_disk()
+        return {
+            "memory": self._memory.stats(),
+            "disk": disk.stats() if disk is not None else None,
+            "near_dup": self.near_dup,
+            "near_dup_hits": self.near_dup_hits,
+        }
+
+
+CONCLUSION_CACHE = ConclusionCache()
+
+
+def get_conclusion_cache_stats() -> Dict[str, Any]:
+    return CONCLUSION_CACHE.stats()
@@ -0,0 +1,216 @@
+# src/context_builder.py
+from __future__ import annotations
+
+import os
+import threading
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+
+from cache_utils import normalize_cache_text
+
+# =========================
+# Konfigurasi budget token
+# =========================
+CONCLUSION_TOKEN_BUDGET = int(os.getenv("CONCLUSION_TOKEN_BUDGET", "6000"))
+CONCLUSION_FINAL_TOKEN_BUDGET = int(os.getenv("CONCLUSION_FINAL_TOKEN_BUDGET", "12000"))
+QA_CONTEXT_TOKEN_BUDGET = int(os.getenv("QA_CONTEXT_TOKEN_BUDGET", "4000"))
+# potongan lebih kecil dari ini tidak berguna → lebih baik dibuang
+CONTEXT_MIN_CHUNK_TOKENS = int(os.getenv("CONTEXT_MIN_CHUNK_TOKENS", "64"))
+# paragraf pendek (judul, "Allah berfirman:") tidak di-dedup
+CONTEXT_DEDUP_MIN_CHARS = int(os.getenv("CONTEXT_DEDUP_MIN_CHARS", "40"))
+TOKENIZER_MODEL = os.getenv("TOKENIZER_MODEL", "gpt-4o")
+
+# (key field di record, label di prompt; "" → tanpa label)
+Field = Tuple[str, str]
+
+_ENCODER = None
+_ENCODER_LOADED = False
+
+_STATS_LOCK = threading.Lock()
+_STATS = {
+    "requests": 0,
+    "tokens_total": 0,
+    "max_tokens": 0,
+    "chunks_trimmed": 0,
+    "chunks_dropped": 0,
+    "paragraphs_deduped": 0,
+}
+
+
+# =========================
+# Hitung token
+# =========================
+def _get_encoder():
+    """tiktoken kalau terpasang; kalau tidak → None (pakai perkiraan len/4)."""
+    global _ENCODER, _ENCODER_LOADED
+    if not _ENCODER_LOADED:
+        _ENCODER_LOADED = True
+        try:
+            import tiktoken
+            try:
+                _ENCODER = tiktoken.encoding_for_model(TOKENIZER_MODEL)
+            except KeyError:
+                _ENCODER = tiktoken.get_encoding("o200k_base")
+        except Exception as e:
+            print(f"[WARN] tiktoken tidak tersedia ({e}) → hitung token pakai perkiraan len/4")
+            _ENCODER = None
+    return _ENCODER
+
+
+def count_tokens(text: str) -> int:
+    if not text:
+        return 0
+    enc = _get_encoder()
+    if enc is not None:
+        return len(enc.encode(text))
+    return (len(text) + 3) // 4
+
+
+def trim_to_tokens(text: str, max_tokens: int) -> str:
+    """Potong teks ke max_tokens, diusahakan berhenti di akhir kalimat."""
+    if max_tokens <= 0:
+        return ""
+    if count_tokens(text) <= max_tokens:
+        return text
+
+    enc = _get_encoder()
+    if enc is not None:
+        cut = enc.decode(enc.encode(text)[:max_tokens])
+    else:
+        cut = text[:max_tokens * 4]
+
+    end = cut.rfind(". ")
+    if end > len(cut) // 2:
+        cut = cut[:end + 1]
+    return cut.rstrip() + " …"
+
+
+# =========================
+# Susun konteks
+# =========================
+def _dedup_paragraphs(text: str, seen: set) -> Tuple[str, int]:
+    kept, dup = [], 0
+    for para in str(text).split("\n"):
+        p = para.strip()
+        if not p:
+            continue
+        if len(p) >= CONTEXT_DEDUP_MIN_CHARS:
+            key = normalize_cache_text(p)
+            if key in seen:
+                dup += 1
+                continue
+            seen.add(key)
+        kept.append(p)
+    return "\n".join(kept), dup
+
+
+def _format_line(label: str, text: str) -> str:
+    return f"- {label}: {text}" if label else f"- {text}"
+
+
+def build_context(
+    records: Sequence[Dict[str, Any]],
+    fields: Sequence[Field],
+    budget: int,
+    label: str = "context",
+    ref: Optional[Callable[[Dict[str, Any]], str]] = None,
+) -> Tuple[str, Dict[str, Any]]:
+    """
+    Rakit konteks prompt dari record dengan batas token.
+    1) Potongan (record × field) diurut berdasarkan relevansi: score desc, lalu urutan record.
+    2) Paragraf yang sudah muncul di potongan lebih relevan dibuang (tafsir sering berulang).
+    3) Budget dibagi rata dulu (jatah minimal per potongan), sisanya untuk potongan
+       teratas yang masih terpotong. Potongan < CONTEXT_MIN_CHUNK_TOKENS dibuang.
+    4) Hasil ditulis lagi dalam urutan asli (record, field) supaya prompt tetap runtut.
+    ref(record) opsional → ditaruh di depan label (mis. "[An-Naba' 17]") untuk rujukan.
+    Return: (teks konteks "- LABEL: ..." per baris, laporan token).
+    """
+    cands: List[Dict[str, Any]] = []
+    for rec_idx, r in enumerate(records):
+        score = float(r.get("score") or 0.0)
+        prefix = ref(r) if ref is not None else ""
+        for field_idx, (key, field_label) in enumerate(fields):
+            txt = r.get(key)
+            if txt:
+                chunk_label = f"{prefix} {field_label}".strip() if prefix else field_label
+                cands.append({"rec": rec_idx, "field": field_idx, "score": score,
+                              "label": chunk_label, "text": str(txt)})
+
+    cands.sort(key=lambda c: (-c["score"], c["rec"], c["field"]))
+
+    seen: set = set()
+    deduped = 0
+    for c in cands:
+        c["text"], dup = _dedup_paragraphs(c["text"], seen)
+        deduped += dup
+        c["tokens"] = count_tokens(_format_line(c["label"], c["text"])) if c["text"] else 0
+        c["alloc"] = 0
+    cands = [c for c in cands if c["tokens"] > 0]
+
+    budget = max(0, int(budget))
+    share = max(CONTEXT_MIN_CHUNK_TOKENS, budget // max(1, len(cands)))
+    remaining = budget
+
+    # putaran 1: jatah rata
+    for c in cands:
+        alloc = min(c["tokens"], share, remaining)
+        if alloc < c["tokens"] and alloc < CONTEXT_MIN_CHUNK_TOKENS:
+            alloc = 0
+        c["alloc"] = alloc
+        remaining -= alloc
+
+    # putaran 2: sisa budget untuk potongan paling relevan yang masih terpotong
+    for c in cands:
+        if remaining <= 0:
+            break
+        extra = min(c["tokens"] - c["alloc"], remaining)
+        if extra <= 0 or (c["alloc"] == 0 and extra < CONTEXT_MIN_CHUNK_TOKENS):
+            continue
+        c["alloc"] += extra
+        remaining -= extra
+
+    lines: List[str] = []
+    used = trimmed = dropped = 0
+    for c in sorted(cands, key=lambda c: (c["rec"], c["field"])):
+        if c["alloc"] <= 0:
+            dropped += 1
+            continue
+        line = _format_line(c["label"], c["text"])
+        if c["alloc"] < c["tokens"]:
+            line = trim_to_tokens(line, c["alloc"])
+            trimmed += 1
+        lines.append(line)
+        used += count_tokens(line)
+
+    report = {
+        "label": label,
+        "budget": budget,
+        "tokens": used,
+        "chunks": len(lines),
+        "trimmed": trimmed,
+        "dropped": dropped,
+        "deduped_paragraphs": deduped,
+        "exact_tokens": _get_encoder() is not None,
+    }
+    with _STATS_LOCK:
+        _STATS["requests"] += 1
+        _STATS["tokens_total"] += used
+        _STATS["max_tokens"] = max(_STATS["max_tokens"], used)
+        _STATS["chunks_trimmed"] += trimmed
+        _STATS["chunks_dropped"] += dropped
+        _STATS["paragraphs_deduped"] += deduped
+    print(f"[CONTEXT] {label}: {used}/{budget} token, {len(lines)} potongan "
+          f"(dipotong={trimmed}, dibuang={dropped}, paragraf duplikat={deduped})")
+    return "\n".join(lines), report
+
+
+def get_context_stats() -> Dict[str, Any]:
+    with _STATS_LOCK:
+        out = dict(_STATS)
+    out["avg_tokens"] = round(out["tokens_total"] / out["requests"], 1) if out["requests"] else 0.0
+    return out
+
+
+def source_fields(sources, fields: Sequence[Tuple[str, str, Optional[str]]]) -> List[Field]:
+    """Saring field berdasarkan sumber tafsir; source=None → selalu ikut (mis. terjemahan)."""
+    return [(key, field_label) for key, field_label, src in fields
+            if src is None or "all" in sources or src in sources]
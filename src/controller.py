@@ -1,10 +1,22 @@
+import os
 import re
-from typing import List, Dict, Any, Optional, Set
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Dict, Any, Callable, Iterator, Optional, Set, Tuple
 
-from state import get_state
+from ranked_results import RankedResults
+from state import get_session_metrics, get_state, save_state  # get_session_metrics: re-export untuk /metrics
 from embeddings import embed_query
-from neo4j_client import graphrag_search, run_cypher  # pastikan run_cypher ada
-from langchain_openai import ChatOpenAI
+from neo4j_client import (  # get_neo4j_metrics: re-export untuk /metrics
+    get_neo4j_metrics, graphrag_search_ids, hydrate_results, run_read, warm_ayat_cache,
+)
+from llm import (  # get_*: re-export untuk /metrics
+    build_planner_chain, conclusion_records, generate_contextual_conclusion, get_planner_stats,
+    get_stream_metrics, invoke_conclusion, safe_parse_plan, stream_conclusion_prompt,
+    stream_contextual_conclusion,
+)
+from context_builder import get_context_stats  # re-export untuk /metrics
+from conclusion_cache import CONCLUSION_CACHE, ConclusionKeys, conclusion_keys, get_conclusion_cache_stats
+from llm_clients import get_llm_client_metrics  # re-export untuk /metrics
 
 
 # =========================
@@ -14,6 +26,21 @@ def is_lanjut_cmd(text: str) -> bool:
     t = (text or "").strip().lower()
     return t.startswith("lanjut") or t in {"lanjut", "next", "lebih", "tambah"}
 
+def detect_lanjut(text: str) -> bool:
+    """
+    Intent lanjut/baru lewat planner bertingkat (aturan → cache → LLM untuk input ambigu).
+    Planner tidak yakin / gagal → heuristik lama is_lanjut_cmd.
+    """
+    try:
+        plan = safe_parse_plan(build_planner_chain().invoke({"user_text": text}))
+    except Exception as e:
+        print(f"[WARN] Planner gagal: {e} → fallback is_lanjut_cmd")
+        plan = {}
+    intent = plan.get("intent")
+    if intent in ("more", "search", "detail"):
+        return intent == "more"
+    return is_lanjut_cmd(text)
+
 def extract_number_natural(text: str) -> Optional[int]:
     text = (text or "").lower().strip()
 
@@ -136,97 +163,238 @@ def _dedup_by_surat_ayat(rows: List[Dict[str, Any]], label: str = "") -> List[Di
 # =========================
 # Manual search by category
 # =========================
-def manual_category_search(cid: int) -> List[Dict[str, Any]]:
-    # NOTE: ini sudah versi aman (no DISTINCT akses a di ORDER BY)
+def manual_category_keys(cid: int) -> List[Dict[str, Any]]:
+    """Ayat dalam kategori cid, hanya key ringan: nama_surat, ayat_ke, score."""
     cypher = """
     MATCH (a:Ayat)-[:`masuk Ke`|masuk_ke]->(k:Kategori {IdKategori: $cid})
     OPTIONAL MATCH (s:Surat)-[:beradadi|terdapat]-(a)
-    OPTIONAL MATCH (a)-[:memiliki_arti|untuk]-(tr:Terjemahan)
-    OPTIONAL MATCH (a)-[:pada|masuk_ke]-(k2:Kategori)
-    OPTIONAL MATCH (a)-[:terdapat|memiliki]-(th:TafsirKemenagTahlili)
-    OPTIONAL MATCH (a)-[:terdapat|memiliki]-(wz:TafsirKemenagWajiz)
-    OPTIONAL MATCH (a)-[:terdapat|memiliki]-(bh:TafsirBuyaHamka)
-
-    WITH
-      s.Surat AS nama_surat,
-      toInteger(a.AyatKe) AS ayat_ke,
-      a.Ayat AS arab_ayat,
-      head(collect(DISTINCT tr.Terjemahan)) AS terjemahan,
-      collect(DISTINCT k2.Kategori) AS kategori,
-      head(collect(DISTINCT th.TafsirKemenagTahlili)) AS tafsir_tahlili,
-      head(collect(DISTINCT wz.TafsirKemenagWajiz)) AS tafsir_wajiz,
-      head(collect(DISTINCT bh.TafsirBuyaHamka)) AS tafsir_hamka
-
-    RETURN
-      nama_surat, ayat_ke, arab_ayat, terjemahan, kategori,
-      tafsir_tahlili, tafsir_wajiz, tafsir_hamka,
-      3.0 AS score
+
+    WITH DISTINCT s.Surat AS nama_surat, toInteger(a.AyatKe) AS ayat_ke
+    WHERE nama_surat IS NOT NULL AND ayat_ke IS NOT NULL
+
+    RETURN nama_surat, ayat_ke, 3.0 AS score
     ORDER BY nama_surat ASC, ayat_ke ASC
     """
-    return run_cypher(cypher, cid=cid)
+    return run_read(cypher, cid=cid)
+
+
+def manual_category_search(cid: int) -> List[Dict[str, Any]]:
+    # isi record lewat hydrate_results (get_ayat_many, cache-backed)
+    return hydrate_results(manual_category_keys(cid))
 
 
 # =========================
-# Kesimpulan panjang (bisa pakai yang aku kasih sebelumnya)
+# Kesimpulan Akhir map-reduce
 # =========================
-_CONCLUSION_LLM = None
-def _get_llm():
-    global _CONCLUSION_LLM
-    if _CONCLUSION_LLM is None:
-        _CONCLUSION_LLM = ChatOpenAI(model="gpt-4o", temperature=0)
-    return _CONCLUSION_LLM
-
-def generate_contextual_conclusion(topic: str, records: List[Dict[str, Any]], sources: Set[str], is_final: bool = False) -> str:
-    if not records:
-        return "Belum ada data untuk kesimpulan."
-
-    # ambil bahan
-    max_records = 12 if not is_final else 30
-    chunks = []
-    for r0 in records[:max_records]:
-        r = _normalize_record_keys(r0)
-        if r.get("terjemahan"):
-            chunks.append(f"- TERJ: {r['terjemahan']}")
-        if ("all" in sources or "tahlili" in sources) and r.get("tafsir_tahlili"):
-            chunks.append(f"- TAHLILI: {r['tafsir_tahlili']}")
-        if ("all" in sources or "wajiz" in sources) and r.get("tafsir_wajiz"):
-            chunks.append(f"- WAJIZ: {r['tafsir_wajiz']}")
-        if ("all" in sources or "hamka" in sources) and r.get("tafsir_hamka"):
-            chunks.append(f"- HAMKA: {r['tafsir_hamka']}")
-
-    if not chunks:
-        return "Tidak cukup data tafsir/terjemahan untuk menyusun kesimpulan."
-
-    prompt = f"""
-Berdasarkan potongan terjemahan & tafsir berikut tentang "{topic}":
-{chr(10).join(chunks)}
-
-Tulis kesimpulan yang BENAR-BENAR merangkum isi ayat yang ditampilkan.
+# map: kesimpulan per batch (pakai ulang "Kesimpulan Sementara" yang sudah dibuat saat paging),
+# reduce: satu panggilan kecil yang merangkum ringkasan batch.
+CONCLUSION_MAP_REDUCE = os.getenv("CONCLUSION_MAP_REDUCE", "1") != "0"
+CONCLUSION_MAP_BATCH_SIZE = max(1, int(os.getenv("CONCLUSION_MAP_BATCH_SIZE", "10")))
+CONCLUSION_MAP_WORKERS = max(1, int(os.getenv("CONCLUSION_MAP_WORKERS", "4")))
+
+_REDUCE_PROMPT_VERSION = "controller-reduce-v1"
+
+# pesan pengganti (bukan hasil LLM) → tidak disimpan sebagai ringkasan batch
+_CONCLUSION_NOTICES = (
+    "Belum ada data untuk kesimpulan.",
+    "Tidak cukup data tafsir/terjemahan untuk menyusun kesimpulan.",
+    "Kesimpulan gagal dibuat.",
+    "Kesimpulan gagal dibuat karena error teknis.",
+)
+
+
+def _is_usable_conclusion(text: str) -> bool:
+    text = (text or "").strip()
+    return bool(text) and text not in _CONCLUSION_NOTICES
+
+
+def _remember_batch_summary(state: Dict[str, Any], start: int, end: int, sources: Set[str], text: str) -> None:
+    """Simpan kesimpulan batch [start, end) di state untuk dipakai ulang oleh Kesimpulan Akhir."""
+    if not _is_usable_conclusion(text):
+        return
+    summaries = [
+        x for x in state.setdefault("batch_summaries", [])
+        if not (x["start"] == start and x["end"] == end)
+    ]
+    summaries.append({"start": start, "end": end, "sources": sorted(sources), "text": text.strip()})
+    summaries.sort(key=lambda x: x["start"])
+    state["batch_summaries"] = summaries
+
+
+def _map_batch_summaries(
+    topic: str,
+    rows: List[Dict[str, Any]],
+    sources: Set[str],
+    summaries: List[Dict[str, Any]],
+) -> List[Tuple[int, int, str]]:
+    """
+    Ringkasan untuk seluruh rows: pakai yang sudah ada, sisanya (celah) dibagi per
+    CONCLUSION_MAP_BATCH_SIZE dan diringkas paralel (dibatasi CONCLUSION_MAP_WORKERS).
+    """
+    total = len(rows)
+    wanted = sorted(sources)
+    known = {x["start"]: x for x in summaries if x.get("sources") == wanted and 0 <= x["start"] < x["end"] <= total}
+
+    parts: List[Tuple[int, int, Optional[str]]] = []
+    pos = 0
+    while pos < total:
+        if pos in known:
+            parts.append((pos, known[pos]["end"], known[pos]["text"]))
+            pos = known[pos]["end"]
+            continue
+        nxt = min([k for k in known if k > pos] + [total])
+        for s in range(pos, nxt, CONCLUSION_MAP_BATCH_SIZE):
+            parts.append((s, min(s + CONCLUSION_MAP_BATCH_SIZE, nxt), None))
+        pos = nxt
+
+    todo = [(i, s, e) for i, (s, e, text) in enumerate(parts) if text is None]
+    print(f"[MAP-REDUCE] batch={len(parts)} pakai ulang={len(parts) - len(todo)} ringkas baru={len(todo)}")
+    if todo:
+        with ThreadPoolExecutor(max_workers=min(CONCLUSION_MAP_WORKERS, len(todo))) as pool:
+            futures = {
+                i: pool.submit(generate_contextual_conclusion, topic, rows[s:e], sources, False)
+                for i, s, e in todo
+            }
+        for i, s, e in todo:
+            parts[i] = (s, e, futures[i].result())
+
+    return [(s, e, text) for s, e, text in parts if _is_usable_conclusion(text)]
+
+
+def _build_reduce_prompt(topic: str, parts: List[Tuple[int, int, str]]) -> str:
+    sections = [f"[Bagian {n} – hasil ke-{s + 1} s.d. {e}]\n{text}" for n, (s, e, text) in enumerate(parts, 1)]
+    return f"""
+Berikut kesimpulan per bagian dari seluruh ayat yang sudah ditampilkan tentang "{topic}":
+
+{chr(10).join(sections)}
+
+Tulis KESIMPULAN AKHIR yang merangkum seluruh bagian di atas.
 - 2 paragraf, total 8–12 kalimat.
-- Paragraf 1: benang merah tema & makna utama.
+- Paragraf 1: benang merah tema & makna utama dari semua bagian.
 - Paragraf 2: implikasi perilaku manusia di dunia (tetap berbasis teks).
+- Jangan menambah informasi yang tidak ada di ringkasan.
 - Hindari pengulangan.
 - Bahasa Indonesia formal dan jelas.
 """.strip()
 
-    try:
-        llm = _get_llm()
-        resp = llm.invoke(prompt)
-        return (resp.content or "").strip() or "Kesimpulan gagal dibuat."
-    except Exception as e:
-        print(f"[ERROR] Kesimpulan gagal: {e}")
-        return "Kesimpulan gagal dibuat karena error teknis."
+
+def _reduce_keys(topic: str, rows: List[Dict[str, Any]], sources: Set[str]) -> ConclusionKeys:
+    return conclusion_keys(_REDUCE_PROMPT_VERSION, topic, rows, sources, True)
+
+
+def _prepare_final(topic: str, rows: List[Dict[str, Any]], sources: Set[str], summaries: List[Dict[str, Any]]):
+    """Return (prompt, keys, None), atau (None, None, teks) kalau cache hit / tidak ada bahan."""
+    if not rows:
+        return None, None, "Belum ada data untuk kesimpulan."
+    keys = _reduce_keys(topic, rows, sources)
+    cached = CONCLUSION_CACHE.get(keys)
+    if cached is not None:
+        return None, None, cached
+
+    parts = _map_batch_summaries(topic, rows, sources, summaries)
+    if not parts:
+        return None, None, "Kesimpulan gagal dibuat karena error teknis."
+    if len(parts) == 1:
+        return None, None, parts[0][2]
+    return _build_reduce_prompt(topic, parts), keys, None
+
+
+def generate_final_conclusion(topic: str, rows: List[Dict[str, Any]], sources: Set[str],
+                              summaries: List[Dict[str, Any]]) -> str:
+    """Kesimpulan Akhir hierarkis atas seluruh rows (bukan hanya 30 record pertama)."""
+    prompt, keys, text = _prepare_final(topic, rows, sources, summaries)
+    if prompt is None:
+        return text
+    return invoke_conclusion(prompt, keys)
+
+
+def stream_final_conclusion(topic: str, rows: List[Dict[str, Any]], sources: Set[str],
+                            summaries: List[Dict[str, Any]]) -> Iterator[str]:
+    """Versi streaming generate_final_conclusion (map tetap blocking, reduce di-stream)."""
+    prompt, keys, text = _prepare_final(topic, rows, sources, summaries)
+    if prompt is None:
+        yield text
+        return
+    yield from stream_conclusion_prompt(prompt, keys)
 
 
 # =========================
-# CONTROLLER (return full text)
+# CONTROLLER (streaming + full text)
 # =========================
-def controller(user_text: str, session_id: str = "default") -> str:
+class _BlockJoiner:
+    """Gabung baris jadi blok stream; "".join(semua blok) == "\n".join(semua baris)."""
+
+    def __init__(self):
+        self.started = False
+
+    def block(self, lines: List[str]) -> str:
+        text = "\n".join(lines)
+        if self.started:
+            text = "\n" + text
+        self.started = True
+        return text
+
+
+def _conclusion_blocks(
+    joiner: _BlockJoiner,
+    head: str,
+    tail: str,
+    blocking: Callable[[], str],
+    streaming: Callable[[], Iterator[str]],
+    stream: bool,
+    on_text: Optional[Callable[[str], None]] = None,
+) -> Iterator[str]:
+    """
+    Blok kesimpulan: head + isi + tail. Mode stream → isi dikirim per token.
+    on_text(teks lengkap) dipanggil setelah selesai (mis. simpan ringkasan batch);
+    kalau pemanggil close() generator di tengah stream, on_text tidak dipanggil.
+    """
+    if not stream:
+        concl = blocking()
+        if on_text is not None:
+            on_text(concl)
+        yield joiner.block([f"{head}{concl}{tail}"])
+        return
+
+    yield joiner.block([head])
+    tokens: List[str] = []
+    for token in streaming():
+        tokens.append(token)
+        yield token
+    if on_text is not None:
+        on_text("".join(tokens))
+    yield tail
+
+
+def controller_stream(
+    user_text: str,
+    session_id: str = "default",
+    stream_conclusion: bool = False,
+) -> Iterator[str]:
+    """
+    Versi streaming controller: yield blok teks begitu siap
+    (header → tiap ayat → kesimpulan → petunjuk lanjut).
+    Blok bisa langsung digabung: "".join(controller_stream(...)) == controller(...).
+    stream_conclusion=True → kesimpulan di-yield per token (close() generator untuk menghentikan).
+    """
     user_text = (user_text or "").strip()
     if not user_text:
-        return "Masukkan pertanyaan atau perintah."
+        yield "Masukkan pertanyaan atau perintah."
+        return
 
     state = get_state(session_id)
+    try:
+        yield from _controller_stream(user_text, state, stream_conclusion)
+    finally:
+        # backend bersama (sqlite): simpan cursor/last_results supaya "lanjut" di worker lain tetap jalan
+        save_state(session_id, state)
+
+
+def _controller_stream(
+    user_text: str,
+    state: Dict[str, Any],
+    stream_conclusion: bool,
+) -> Iterator[str]:
     state.setdefault("last_results", [])
     state.setdefault("cursor", 0)
     state.setdefault("page_size", 5)
@@ -234,8 +402,9 @@ def controller(user_text: str, session_id: str = "default") -> str:
 
     sources = detect_sources(user_text)
     lower = user_text.lower()
-    is_lanjut = is_lanjut_cmd(user_text)
+    is_lanjut = detect_lanjut(user_text)
 
+    joiner = _BlockJoiner()
     out: List[str] = []
 
     # ---------------------------
@@ -245,6 +414,7 @@ def controller(user_text: str, session_id: str = "default") -> str:
         state["last_results"] = []
         state["cursor"] = 0
         state["active_topic"] = user_text
+        state["batch_summaries"] = []
 
         out.append("[DEBUG] === RESET TOTAL STATE UNTUK QUERY BARU ===")
         out.append(f"[DEBUG] Topic setelah enrich: {user_text}")
@@ -284,7 +454,7 @@ def controller(user_text: str, session_id: str = "default") -> str:
             cid = category_id_map.get(cat)
             if cid is None:
                 continue
-            rows = manual_category_search(cid)
+            rows = manual_category_keys(cid)
             manual_results.extend(rows)
             out.append(f"[✅ MANUAL] Ditemukan {len(rows)} ayat dari '{cat}' (ID {cid})")
 
@@ -292,25 +462,27 @@ def controller(user_text: str, session_id: str = "default") -> str:
         if manual_results:
             out.append(f"[DEBUG] Total manual setelah dedup multi: {len(manual_results)} ayat")
 
-        # VECTOR
+        # VECTOR (tahap 1: id + skor saja)
         vec = embed_query(user_text)
-        vector_results = graphrag_search(vec, limit=50, score_threshold=0.72)
+        vector_results = graphrag_search_ids(vec, limit=50, score_threshold=0.72)
 
         filtered_vector: List[Dict[str, Any]] = []
-        for r0 in vector_results:
-            r = _normalize_record_keys(r0)
-            text_all = (
-                (r.get("terjemahan") or "")
-                + (r.get("tafsir_tahlili") or "")
-                + (r.get("tafsir_wajiz") or "")
-                + (r.get("tafsir_hamka") or "")
-            ).lower()
-
-            if "dunia" in lower or "di dunia" in lower:
+        if "dunia" in lower or "di dunia" in lower:
+            # filter konteks dunia butuh isi teks → hydrate kandidat (dari cache record)
+            for r in hydrate_results(vector_results):
+                text_all = (
+                    (r.get("terjemahan") or "")
+                    + (r.get("tafsir_tahlili") or "")
+                    + (r.get("tafsir_wajiz") or "")
+                    + (r.get("tafsir_hamka") or "")
+                ).lower()
+
                 if "kiamat" in text_all or "akhirat" in text_all:
                     if not any(kw in text_all for kw in ["dunia", "dilarang", "maksiat", "tamak", "kikir", "ghibah"]):
                         continue
-            filtered_vector.append(r)
+                filtered_vector.append({"nama_surat": r["nama_surat"], "ayat_ke": r["ayat_ke"], "score": r.get("score", 0)})
+        else:
+            filtered_vector = list(vector_results)
 
         out.append(f"[DEBUG] Vector setelah filter: {len(filtered_vector)} ayat")
 
@@ -319,46 +491,62 @@ def controller(user_text: str, session_id: str = "default") -> str:
         all_results = _dedup_by_surat_ayat(all_results, label="ALL")
         all_results.sort(key=lambda x: (-float(x.get("score", 0)), str(x.get("nama_surat", "")), int(x.get("ayat_ke", 0))))
 
-        state["last_results"] = all_results
+        state["last_results"] = RankedResults(all_results)  # ringkas: (surat, ayat, score) saja
         out.append(f"[DEBUG] Total ayat unik: {len(all_results)}")
         out.append(f"Berikut ayat-ayat terkait '{user_text}' beserta terjemahan dan tafsir yang tersedia:\n")
 
-        # BATCH sesuai page_size / angka request
-        batch = all_results[:page_size]
-        state["cursor"] = len(batch)
+        # BATCH sesuai page_size / angka request (tahap 2: hydrate payload halaman ini saja).
+        # cursor & range ringkasan dihitung dari baris ringan, bukan dari hasil hydrate
+        # (ayat yang tidak ketemu di DB dibuang hydrate → posisi tidak boleh ikut bergeser)
+        page = all_results[:page_size]
+        batch = hydrate_results(page)
+        state["cursor"] = len(page)
 
         if not batch:
             # kalau kosong, jelaskan biar tidak “silent”
             out.append("Tidak ada ayat yang bisa ditampilkan pada batch pertama (batch kosong).")
             out.append("Cek: page_size, hasil query Neo4j, atau mapping key record.")
             out.append("\nOutput selesai (cek tampilan di atas).")
-            return "\n".join(out)
+            yield joiner.block(out)
+            return
 
+        # header dulu, lalu tiap ayat begitu siap
+        yield joiner.block(out)
         for r in batch:
-            out.append(format_ayat_record(r, sources))
-            out.append("\n" + ("═" * 60) + "\n")
-
-        concl = generate_contextual_conclusion(user_text, batch, sources, is_final=False)
-        out.append(f"📌 **Kesimpulan:**\n{concl}\n")
-
+            yield joiner.block([format_ayat_record(r, sources), "\n" + ("═" * 60) + "\n"])
+
+        # kesimpulan hanya membaca conclusion_records(page) → itu saja yang dianggap teringkas
+        first_end = len(conclusion_records(page, False))
+        yield from _conclusion_blocks(
+            joiner, "📌 **Kesimpulan:**\n", "\n",
+            blocking=lambda: generate_contextual_conclusion(user_text, page, sources, is_final=False),
+            streaming=lambda: stream_contextual_conclusion(user_text, page, sources, is_final=False),
+            stream=stream_conclusion,
+            on_text=lambda t: _remember_batch_summary(state, 0, first_end, sources, t),
+        )
+
+        out = []
         remaining = len(all_results) - state["cursor"]
         if remaining > 0:
             out.append(f"📝 Ketik **lanjut** untuk lihat sisa {remaining} ayat.")
 
         out.append("Output selesai (cek tampilan di atas).")
-        return "\n".join(out)
+        yield joiner.block(out)
+        return
 
     # ---------------------------
     # MODE LANJUT
     # ---------------------------
     if not state.get("last_results"):
-        return "❌ Tidak ada hasil sebelumnya. Silakan ajukan pertanyaan baru."
+        yield "❌ Tidak ada hasil sebelumnya. Silakan ajukan pertanyaan baru."
+        return
 
     cursor = int(state.get("cursor", 0))
     total = len(state["last_results"])
     remaining = total - cursor
     if remaining <= 0:
-        return "✅ Semua ayat sudah ditampilkan."
+        yield "✅ Semua ayat sudah ditampilkan."
+        return
 
     n_req = extract_number_natural(user_text)
     if n_req is not None and n_req > 0:
@@ -368,21 +556,41 @@ def controller(user_text: str, session_id: str = "default") -> str:
 
     start = cursor
     end = start + n
-    batch = state["last_results"][start:end]
+    page = state["last_results"][start:end]
+    batch = hydrate_results(page)
     state["cursor"] = end
 
-    out.append("Melanjutkan hasil sebelumnya...\n")
+    yield joiner.block(["Melanjutkan hasil sebelumnya...\n"])
     for r in batch:
-        out.append(format_ayat_record(r, sources))
-        out.append("\n" + ("═" * 60) + "\n")
+        yield joiner.block([format_ayat_record(r, sources), "\n" + ("═" * 60) + "\n"])
 
     remaining_now = total - end
+    topic = state["active_topic"]
     if remaining_now <= 0:
-        concl = generate_contextual_conclusion(state["active_topic"], state["last_results"], sources, is_final=True)
-        out.append(f"\n📌 **Kesimpulan Akhir:**\n{concl}\n✅ Semua ayat telah ditampilkan.")
+        rows = state["last_results"]
+        summaries = state.get("batch_summaries") or []
+        if CONCLUSION_MAP_REDUCE:
+            blocking = lambda: generate_final_conclusion(topic, rows, sources, summaries)
+            streaming = lambda: stream_final_conclusion(topic, rows, sources, summaries)
+        else:
+            blocking = lambda: generate_contextual_conclusion(topic, rows, sources, is_final=True)
+            streaming = lambda: stream_contextual_conclusion(topic, rows, sources, is_final=True)
+        yield from _conclusion_blocks(
+            joiner, "\n📌 **Kesimpulan Akhir:**\n", "\n✅ Semua ayat telah ditampilkan.",
+            blocking=blocking, streaming=streaming, stream=stream_conclusion,
+        )
     else:
-        concl = generate_contextual_conclusion(state["active_topic"], batch, sources, is_final=False)
-        out.append(f"\n📌 **Kesimpulan Sementara:**\n{concl}\n")
-        out.append(f"📝 Masih ada {remaining_now} ayat. Ketik **lanjut** atau **lanjut [angka]** (misal: lanjut 5).")
+        batch_end = start + len(conclusion_records(page, False))
+        yield from _conclusion_blocks(
+            joiner, "\n📌 **Kesimpulan Sementara:**\n", "\n",
+            blocking=lambda: generate_contextual_conclusion(topic, page, sources, is_final=False),
+            streaming=lambda: stream_contextual_conclusion(topic, page, sources, is_final=False),
+            stream=stream_conclusion,
+            on_text=lambda t: _remember_batch_summary(state, start, batch_end, sources, t),
+        )
+        yield joiner.block([f"📝 Masih ada {remaining_now} ayat. Ketik **lanjut** atau **lanjut [angka]** (misal: lanjut 5)."])
 
-    return "\n".join(out)
+
+def controller(user_text: str, session_id: str = "default") -> str:
+    """Controller versi lama: kembalikan seluruh jawaban sebagai 1 string."""
+    return "".join(controller_stream(user_text, session_id=session_id))
@@ -1,15 +1,99 @@
 import os
+import hashlib
+from array import array
+from typing import Any, Dict, List, Optional
+
 from dotenv import load_dotenv
-from openai import OpenAI
+
+from cache_utils import LRUCache, SQLiteCache, normalize_cache_text
+from llm_clients import get_openai_client
 
 load_dotenv()
 
-from openai import OpenAI
-client = OpenAI()
+EMBED_MODEL = "text-embedding-3-large"
 
-def embed_query(text: str):
-    resp = client.embeddings.create(
-        model="text-embedding-3-large",
+# =========================
+# Cache embedding (LRU in-process + SQLite di disk)
+# =========================
+EMBED_CACHE_ENABLED = os.getenv("EMBED_CACHE_ENABLED", "1") != "0"
+EMBED_CACHE_MEMORY_ITEMS = int(os.getenv("EMBED_CACHE_MEMORY_ITEMS", "2048"))
+EMBED_CACHE_DISK_ITEMS = int(os.getenv("EMBED_CACHE_DISK_ITEMS", "50000"))
+EMBED_CACHE_PATH = os.getenv("EMBED_CACHE_PATH", ".cache/embeddings.sqlite3")
+
+_MEMORY_CACHE = LRUCache(max_items=EMBED_CACHE_MEMORY_ITEMS)
+_DISK_CACHE: Optional[SQLiteCache] = None
+
+
+def _get_disk_cache() -> Optional[SQLiteCache]:
+    global _DISK_CACHE
+    if _DISK_CACHE is None and EMBED_CACHE_PATH:
+        try:
+            _DISK_CACHE = SQLiteCache(EMBED_CACHE_PATH, table="embeddings", max_items=EMBED_CACHE_DISK_ITEMS)
+        except Exception as e:
+            print(f"[WARN] Cache embedding disk tidak bisa dibuka ({e}) → hanya pakai memori")
+            return None
+    return _DISK_CACHE
+
+
+def _cache_key(norm_text: str) -> str:
+    """Key content-addressed: hash dari model + teks yang sudah dinormalisasi."""
+    raw = f"{EMBED_MODEL}\x00{norm_text}"
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+def _pack(vec: List[float]) -> bytes:
+    return array("f", vec).tobytes()
+
+
+def _unpack(blob: bytes) -> array:
+    arr = array("f")
+    arr.frombytes(blob)
+    return arr
+
+
+def _embed_remote(text: str) -> List[float]:
+    resp = get_openai_client().embeddings.create(
+        model=EMBED_MODEL,
         input=text
     )
-    return resp.data[0].embedding
\ No newline at end of file
+    return resp.data[0].embedding
+
+
+def embed_query(text: str):
+    # hanya key cache yang dinormalisasi; yang di-embed tetap teks asli
+    # (kapitalisasi bisa membawa makna untuk model embedding)
+    if not EMBED_CACHE_ENABLED:
+        return _embed_remote(text)
+
+    key = _cache_key(normalize_cache_text(text))
+
+    # tier memori simpan array float32 (±4x lebih hemat dari list float); caller dapat list baru
+    vec = _MEMORY_CACHE.get(key)
+    if vec is not None:
+        return list(vec)
+
+    disk = _get_disk_cache()
+    if disk is not None:
+        blob = disk.get(key)
+        if blob is not None:
+            vec = _unpack(blob)
+            _MEMORY_CACHE.set(key, vec)
+            return list(vec)
+
+    vec = _embed_remote(text)
+    _MEMORY_CACHE.set(key, array("f", vec))
+    if disk is not None:
+        try:
+            disk.set(key, _pack(vec))
+        except Exception as e:
+            print(f"[WARN] Gagal simpan embedding ke disk cache: {e}")
+    return list(vec)
+
+
+def get_embedding_cache_stats() -> Dict[str, Any]:
+    """Counter hit/miss untuk cache embedding (memori & disk)."""
+    disk = _get_disk_cache()
+    return {
+        "memory": _MEMORY_CACHE.stats(),
+        "disk": disk.stats() if disk is not None else None,
+    }
@@ -0,0 +1,338 @@
+# src/history_store.py
+from __future__ import annotations
+
+import os
+import sqlite3
+import threading
+from abc import ABC, abstractmethod
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional
+
+from cache_utils import LRUCache
+import history_store_sheets as sheets
+from history_store_sheets import HISTORY_HEADER, get_user_id  # get_user_id: re-export untuk app
+
+# =========================
+# Konfigurasi
+# =========================
+HISTORY_BACKEND = os.getenv("HISTORY_BACKEND", "sqlite").strip().lower()  # sqlite | sheets
+HISTORY_DB_PATH = os.getenv("HISTORY_DB_PATH", ".cache/history.sqlite3")
+# Google Sheets sebagai salinan/export (async lewat write-behind), bukan sumber baca
+HISTORY_SHEETS_EXPORT = os.getenv("HISTORY_SHEETS_EXPORT", "1") != "0"
+# DB lokal kosong (mis. container baru) → isi sekali dari Sheets
+HISTORY_BOOTSTRAP_FROM_SHEETS = os.getenv("HISTORY_BOOTSTRAP_FROM_SHEETS", "1") != "0"
+# cache history per user untuk sidebar (tiap rerun Streamlit memanggil load_history)
+HISTORY_CACHE_ITEMS = int(os.getenv("HISTORY_CACHE_ITEMS", "1000"))
+HISTORY_CACHE_TTL = float(os.getenv("HISTORY_CACHE_TTL", "300"))
+HISTORY_CACHE_ROWS = int(os.getenv("HISTORY_CACHE_ROWS", "50"))
+
+
+# =========================
+# Interface
+# =========================
+class HistoryBackend(ABC):
+    """
+    Interface penyimpanan history chat per user.
+    - save(row) → row dict dengan key HISTORY_HEADER
+    - load(user_id, limit) → list dict, paling baru dulu
+    - clear(user_id) → jumlah terhapus
+    """
+
+    name = "base"
+
+    @abstractmethod
+    def save(self, row: Dict[str, Any]) -> None:
+        ...
+
+    @abstractmethod
+    def load(self, user_id: str, limit: int = 20) -> List[Dict[str, Any]]:
+        ...
+
+    @abstractmethod
+    def clear(self, user_id: str) -> int:
+        ...
+
+    def stats(self) -> Dict[str, Any]:
+        return {"backend": self.name}
+
+
+class SQLiteHistoryStore(HistoryBackend):
+    """
+    History di SQLite lokal (WAL), index (user_id, created_at):
+    load_history = range scan index per user, O(limit) — tidak lagi download semua user.
+    """
+
+    name = "sqlite"
+
+    def __init__(self, path: str = HISTORY_DB_PATH):
+        self.path = path
+        self._lock = threading.Lock()
+
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None, timeout=10)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS history (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                created_at TEXT NOT NULL,
+                user_id TEXT NOT NULL,
+                email TEXT NOT NULL DEFAULT '',
+                query TEXT NOT NULL DEFAULT '',
+                answer TEXT NOT NULL DEFAULT '',
+                session_id TEXT NOT NULL DEFAULT ''
+            )
+            """
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_history_user_created ON history(user_id, created_at)")
+
+        self.saves = 0
+        self.loads = 0
+
+    @staticmethod
+    def _values(row: Dict[str, Any]) -> tuple:
+        return tuple(str(row.get(k) or "") for k in HISTORY_HEADER)
+
+    def save(self, row: Dict[str, Any]) -> None:
+        with self._lock:
+            self._conn.execute(
+                "INSERT INTO history (created_at, user_id, email, query, answer, session_id) VALUES (?, ?, ?, ?, ?, ?)",
+                self._values(row),
+            )
+            self.saves += 1
+
+    def save_many(self, rows: List[Dict[str, Any]]) -> int:
+        with self._lock:
+            self._conn.execute("BEGIN")
+            try:
+                self._conn.executemany(
+                    "INSERT INTO history (created_at, user_id, email, query, answer, session_id) "
+                    "VALUES (?, ?, ?, ?, ?, ?)",
+                    [self._values(r) for r in rows],
+                )
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+        return len(rows)
+
+    def load(self, user_id: str, limit: int = 20) -> List[Dict[str, Any]]:
+        with self._lock:
+            cur = self._conn.execute(
+                "SELECT created_at, user_id, email, query, answer, session_id FROM history "
+                "WHERE user_id = ? ORDER BY created_at DESC, id DESC LIMIT ?",
+                (str(user_id), max(0, int(limit))),
+            )
+            rows = cur.fetchall()
+            self.loads += 1
+        return [dict(zip(HISTORY_HEADER, r)) for r in rows]
+
+    def clear(self, user_id: str) -> int:
+        with self._lock:
+            cur = self._conn.execute("DELETE FROM history WHERE user_id = ?", (str(user_id),))
+            return cur.rowcount
+
+    def count(self) -> int:
+        with self._lock:
+            return int(self._conn.execute("SELECT COUNT(*) FROM history").fetchone()[0])
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "backend": self.name,
+            "path": self.path,
+            "items": self.count(),
+            "saves": self.saves,
+            "loads": self.loads,
+        }
+
+
+class SheetsHistoryStore(HistoryBackend):
+    """Mode lama: Google Sheets sebagai sumber baca & tulis (HISTORY_BACKEND=sheets)."""
+
+    name = "sheets"
+
+    def save(self, row: Dict[str, Any]) -> None:
+        sheets.save_history(row["user_id"], row["email"], row["query"], row["answer"], row["session_id"],
+                            created_at=row["created_at"])
+
+    def load(self, user_id: str, limit: int = 20) -> List[Dict[str, Any]]:
+        return sheets.load_history(user_id, limit=limit)
+
+    def clear(self, user_id: str) -> int:
+        return sheets.clear_history(user_id)
+
+    def stats(self) -> Dict[str, Any]:
+        return {"backend": self.name, "writer": sheets.get_history_writer_stats()}
+
+
+def create_history_store(backend: str = HISTORY_BACKEND) -> HistoryBackend:
+    if backend == "sheets":
+        return SheetsHistoryStore()
+    if backend not in ("sqlite", ""):
+        print(f"[WARN] HISTORY_BACKEND={backend} tidak dikenal → pakai sqlite")
+    try:
+        return SQLiteHistoryStore()
+    except Exception as e:
+        print(f"[WARN] History SQLite gagal dibuka ({e}) → pakai Google Sheets")
+        return SheetsHistoryStore()
+
+
+_STORE = create_history_store()
+_EXPORT = HISTORY_SHEETS_EXPORT and _STORE.name != "sheets"
+
+_BOOTSTRAP_LOCK = threading.Lock()
+_BOOTSTRAPPED = False
+
+
+def _bootstrap_from_sheets() -> None:
+    """
+    Sekali per proses: kalau DB lokal masih kosong, salin history dari Sheets
+    (satu kali get_all_records, bukan per rerun). Gagal → lanjut dengan DB kosong.
+    """
+    global _BOOTSTRAPPED
+    if _BOOTSTRAPPED:
+        return
+    with _BOOTSTRAP_LOCK:
+        if _BOOTSTRAPPED:
+            return
+        _BOOTSTRAPPED = True
+        if not (_EXPORT and HISTORY_BOOTSTRAP_FROM_SHEETS and isinstance(_STORE, SQLiteHistoryStore)):
+            return
+        try:
+            if _STORE.count() > 0:
+                return
+            rows = [r for r in sheets.load_all_history() if str(r.get("user_id", ""))]
+            n = _STORE.save_many(rows)
+            print(f"[HISTORY] Bootstrap {n} baris dari Google Sheets → {_STORE.path}")
+        except Exception as e:
+            print(f"[WARN] Bootstrap history dari Sheets gagal: {e}")
+
+
+# =========================
+# Cache per user
+# =========================
+class _HistoryCache:
+    """
+    user_id → {"rows": [...paling baru dulu], "complete": bool}.
+    complete=True → semua history user ada di rows (load dengan limit berapa pun bisa dilayani).
+    save_history menambah baris di depan (update in place), clear_history mengosongkan.
+    TTL membatasi basi kalau ada proses/worker lain yang menulis.
+    """
+
+    def __init__(self, max_items: int = HISTORY_CACHE_ITEMS, ttl: float = HISTORY_CACHE_TTL,
+                 max_rows: int = HISTORY_CACHE_ROWS):
+        self.max_rows = max(1, int(max_rows))
+        self._lru = LRUCache(max_items=max_items, ttl=ttl)
+        self._lock = threading.Lock()
+
+    def get(self, user_id: str, limit: int) -> Optional[List[Dict[str, Any]]]:
+        entry = self._lru.get(str(user_id))
+        if entry is None:
+            return None
+        if not entry["complete"] and len(entry["rows"]) < limit:
+            return None
+        return list(entry["rows"][:limit])
+
+    def fill(self, user_id: str, rows: List[Dict[str, Any]], limit: int) -> None:
+        with self._lock:
+            self._lru.set(str(user_id), {"rows": list(rows), "complete": len(rows) < limit})
+
+    def prepend(self, user_id: str, row: Dict[str, Any]) -> None:
+        with self._lock:
+            entry = self._lru.get(str(user_id), count=False)
+            if entry is None:
+                return
+            rows = [row] + entry["rows"]
+            complete = entry["complete"]
+            if len(rows) > self.max_rows:
+                rows, complete = rows[:self.max_rows], False
+            self._lru.set(str(user_id), {"rows": rows, "complete": complete})
+
+    def reset(self, user_id: str) -> None:
+        with self._lock:
+            self._lru.set(str(user_id), {"rows": [], "complete": True})
+
+    def drop(self, user_id: str) -> None:
+        with self._lock:
+            self._lru.pop(str(user_id))
+
+    def stats(self) -> Dict[str, Any]:
+        return self._lru.stats()
+
+
+_CACHE = _HistoryCache()
+
+
+# =========================
+# API untuk app
+# =========================
+def save_history(
+    user_id: str,
+    email: str,
+    query: str,
+    answer: str,
+    session_id: Optional[str] = None
+) -> None:
+    """Simpan 1 item history ke store lokal; salinan ke Sheets dikirim di background."""
+    row = {
+        "created_at": datetime.now(timezone.utc).isoformat(),
+        "user_id": user_id,
+        "email": email,
+        "query": query,
+        "answer": answer,
+        "session_id": session_id or "",
+    }
+    _bootstrap_from_sheets()
+    try:
+        _STORE.save(row)
+    except Exception:
+        _CACHE.drop(user_id)
+        raise
+    _CACHE.prepend(user_id, row)
+
+    if _EXPORT:
+        try:
+            sheets.save_history(user_id, email, query, answer, session_id, created_at=row["created_at"])
+        except Exception as e:
+            print(f"[WARN] Export history ke Sheets gagal: {e}")
+
+
+def load_history(user_id: str, limit: int = 20) -> List[Dict[str, Any]]:
+    """Ambil history milik user tertentu (paling baru dulu); dari cache kalau ada."""
+    cached = _CACHE.get(user_id, limit)
+    if cached is not None:
+        return cached
+
+    _bootstrap_from_sheets()
+    fetch = max(int(limit), _CACHE.max_rows)
+    rows = _STORE.load(user_id, limit=fetch)
+    _CACHE.fill(user_id, rows, fetch)
+    return rows[:limit]
+
+
+def clear_history(user_id: str) -> int:
+    """Hapus history user, return jumlah terhapus (di store lokal; Sheets ikut dibersihkan)."""
+    _bootstrap_from_sheets()
+    try:
+        n = _STORE.clear(user_id)
+    except Exception:
+        _CACHE.drop(user_id)
+        raise
+    _CACHE.reset(user_id)
+
+    if _EXPORT:
+        try:
+            sheets.clear_history(user_id)
+        except Exception as e:
+            print(f"[WARN] Hapus history di Sheets gagal: {e}")
+    return n
+
+
+def get_history_stats() -> Dict[str, Any]:
+    out = _STORE.stats()
+    out["sheets_export"] = _EXPORT
+    out["cache"] = _CACHE.stats()
+    if _EXPORT:
+        out["writer"] = sheets.get_history_writer_stats()
+    return out
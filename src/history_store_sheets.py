@@ -1,11 +1,26 @@
 # src/history_store_sheets.py
+import os
 import json
+import atexit
+import threading
+from collections import deque
+from contextlib import contextmanager
 from datetime import datetime, timezone
-from typing import List, Dict, Any, Optional
+from typing import List, Dict, Any, Iterator, Optional
 from collections.abc import Mapping
 
 import streamlit as st
 
+HISTORY_HEADER = ["created_at", "user_id", "email", "query", "answer", "session_id"]
+
+# write-behind: baris history di-buffer lalu dikirim batch (append_rows) di thread terpisah
+HISTORY_FLUSH_INTERVAL = float(os.getenv("HISTORY_FLUSH_INTERVAL", "2"))
+HISTORY_FLUSH_BATCH = int(os.getenv("HISTORY_FLUSH_BATCH", "20"))
+HISTORY_BUFFER_MAX = int(os.getenv("HISTORY_BUFFER_MAX", "5000"))
+HISTORY_MAX_BACKOFF = float(os.getenv("HISTORY_MAX_BACKOFF", "60"))
+# clear_history: berapa kali scan ulang kolom user_id kalau sheet bergeser di tengah hapus
+HISTORY_CLEAR_RETRIES = int(os.getenv("HISTORY_CLEAR_RETRIES", "3"))
+
 
 @st.cache_resource
 def _get_worksheet():
@@ -65,19 +80,146 @@ def get_user_id() -> str:
     return "anonymous"
 
 
-def ensure_header() -> None:
-    """Pastikan header baris pertama ada."""
-    ws = _get_worksheet()
-    expected = ["created_at", "user_id", "email", "query", "answer", "session_id"]
+_HEADER_LOCK = threading.Lock()
+_HEADER_OK = False
+
 
-    values = ws.get_all_values()
-    if values and values[0] == expected:
+def ensure_header() -> None:
+    """Pastikan header baris pertama ada (dicek sekali per proses, cukup baca baris 1)."""
+    global _HEADER_OK
+    if _HEADER_OK:
         return
+    with _HEADER_LOCK:
+        if _HEADER_OK:
+            return
+        ws = _get_worksheet()
+        first = ws.row_values(1)
+        if first != HISTORY_HEADER:
+            if not first:
+                ws.append_row(HISTORY_HEADER, value_input_option="RAW")
+            else:
+                ws.insert_row(HISTORY_HEADER, index=1)
+        _HEADER_OK = True
+
+
+class _HistoryWriter:
+    """
+    Buffer write-behind untuk history.
+    - save_history hanya menaruh baris di buffer (tanpa network di jalur jawaban).
+    - Thread flush: tiap HISTORY_FLUSH_INTERVAL detik atau begitu buffer >= HISTORY_FLUSH_BATCH,
+      kirim sekaligus pakai append_rows.
+    - Error API (quota/timeout): baris dikembalikan ke depan buffer, dicoba lagi dengan backoff
+      (selama backoff, buffer penuh tidak membangunkan thread flush lebih awal).
+    - Batch yang sedang dikirim tetap terlihat di pending() sampai append_rows berhasil.
+    """
+
+    def __init__(self):
+        self._rows: deque = deque()
+        self._inflight: List[List[str]] = []
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._ws = None
+        self._backoff = 0.0
+
+        self.flushed_rows = 0
+        self.flushes = 0
+        self.errors = 0
+        self.dropped = 0
+        self.last_error: Optional[str] = None
+
+    def add(self, ws, row: List[str]) -> None:
+        with self._lock:
+            self._ws = ws
+            self._rows.append(row)
+            while len(self._rows) > HISTORY_BUFFER_MAX:
+                self._rows.popleft()
+                self.dropped += 1
+            # sedang backoff → tunggu jadwal retry, jangan bangunkan thread tiap ada baris baru
+            full = len(self._rows) >= HISTORY_FLUSH_BATCH and self._backoff == 0
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name="history-writer", daemon=True)
+                self._thread.start()
+        if full:
+            self._wakeup.set()
+
+    def pending(self, user_id: Optional[str] = None) -> List[List[str]]:
+        with self._lock:
+            rows = self._inflight + list(self._rows)
+        if user_id is None:
+            return rows
+        return [r for r in rows if str(r[1]) == str(user_id)]
+
+    @contextmanager
+    def hold(self) -> Iterator[None]:
+        """
+        Tahan flush selama blok berjalan: batch yang sedang dikirim selesai dulu,
+        dan tidak ada batch baru yang menyelip (dipakai clear_history saat menghapus baris).
+        """
+        with self._flush_lock:
+            yield
+
+    def discard(self, user_id: str) -> int:
+        """Buang baris user tertentu yang masih di buffer. Return jumlah yang dibuang."""
+        with self._lock:
+            keep = [r for r in self._rows if str(r[1]) != str(user_id)]
+            n = len(self._rows) - len(keep)
+            self._rows = deque(keep)
+        return n
+
+    def flush(self) -> int:
+        """Kirim semua baris di buffer sekarang. Return jumlah baris terkirim (0 kalau gagal)."""
+        with self._flush_lock:
+            with self._lock:
+                if not self._rows or self._ws is None:
+                    return 0
+                batch = list(self._rows)
+                self._rows.clear()
+                self._inflight = batch
+                ws = self._ws
+            try:
+                ensure_header()
+                ws.append_rows(batch, value_input_option="RAW")
+            except Exception as e:
+                with self._lock:
+                    # kembalikan ke depan buffer (urutan tetap)
+                    self._rows.extendleft(reversed(batch))
+                    self._inflight = []
+                    self.errors += 1
+                    self.last_error = f"{type(e).__name__}: {e}"
+                    self._backoff = min(max(self._backoff * 2, HISTORY_FLUSH_INTERVAL), HISTORY_MAX_BACKOFF)
+                print(f"[WARN] Flush history gagal ({e}) → coba lagi {self._backoff:.0f}s")
+                return 0
+            with self._lock:
+                self._inflight = []
+                self.flushes += 1
+                self.flushed_rows += len(batch)
+                self._backoff = 0.0
+            return len(batch)
+
+    def _run(self) -> None:
+        while True:
+            self._wakeup.wait(timeout=max(HISTORY_FLUSH_INTERVAL, self._backoff))
+            self._wakeup.clear()
+            self.flush()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "pending": len(self._inflight) + len(self._rows),
+                "in_flight": len(self._inflight),
+                "flushes": self.flushes,
+                "flushed_rows": self.flushed_rows,
+                "errors": self.errors,
+                "dropped": self.dropped,
+                "backoff": self._backoff,
+                "last_error": self.last_error,
+            }
 
-    if not values:
-        ws.append_row(expected, value_input_option="RAW")
-    else:
-        ws.insert_row(expected, index=1)
+
+_WRITER = _HistoryWriter()
+atexit.register(_WRITER.flush)
 
 
 def save_history(
@@ -85,15 +227,23 @@ def save_history(
     email: str,
     query: str,
     answer: str,
-    session_id: Optional[str] = None
+    session_id: Optional[str] = None,
+    created_at: Optional[str] = None,
 ) -> None:
-    """Simpan 1 item history ke Google Sheets."""
-    ensure_header()
-    ws = _get_worksheet()
+    """Simpan 1 item history (masuk buffer, dikirim ke Google Sheets di background)."""
+    ws = _get_worksheet()  # resolve di thread Streamlit (cache_resource), thread flush cukup pakai objeknya
 
-    created_at = datetime.now(timezone.utc).isoformat()
+    created_at = created_at or datetime.now(timezone.utc).isoformat()
     row = [created_at, user_id, email, query, answer, session_id or ""]
-    ws.append_row(row, value_input_option="RAW")
+    _WRITER.add(ws, row)
+
+
+def flush_history() -> int:
+    return _WRITER.flush()
+
+
+def get_history_writer_stats() -> Dict[str, Any]:
+    return _WRITER.stats()
 
 
 def load_history(user_id: str, limit: int = 20) -> List[Dict[str, Any]]:
@@ -103,36 +253,78 @@ def load_history(user_id: str, limit: int = 20) -> List[Dict[str, Any]]:
 
     rows = ws.get_all_records()
     mine = [r for r in rows if str(r.get("user_id", "")) == str(user_id)]
+    # baris yang belum ter-flush tetap ikut tampil (read-your-writes)
+    mine += [dict(zip(HISTORY_HEADER, r)) for r in _WRITER.pending(user_id)]
     mine.sort(key=lambda r: r.get("created_at", ""), reverse=True)
     return mine[:limit]
 
 
-def clear_history(user_id: str) -> int:
-    """Hapus history user, return jumlah terhapus."""
+def load_all_history() -> List[Dict[str, Any]]:
+    """Semua baris history (semua user) — hanya untuk bootstrap store lokal."""
     ensure_header()
     ws = _get_worksheet()
+    return ws.get_all_records() + [dict(zip(HISTORY_HEADER, r)) for r in _WRITER.pending()]
 
-    values = ws.get_all_values()
-    if not values:
-        return 0
 
-    header = values[0]
-    data = values[1:]
+def _row_ranges(rows: List[int]) -> List[tuple]:
+    """[2,3,4,7,9,10] → [(2,4),(7,7),(9,10)] (nomor baris 1-based, inklusif)."""
+    ranges: List[tuple] = []
+    for r in sorted(rows):
+        if ranges and r == ranges[-1][1] + 1:
+            ranges[-1] = (ranges[-1][0], r)
+        else:
+            ranges.append((r, r))
+    return ranges
 
-    kept = []
-    removed = 0
-    user_id_str = str(user_id)
 
-    for row in data:
-        row_user_id = row[1] if len(row) > 1 else ""
-        if str(row_user_id) == user_id_str:
-            removed += 1
-        else:
-            kept.append(row)
+def _range_belongs_to(ws, start: int, end: int, user_id: str) -> bool:
+    """Baca ulang kolom user_id baris start..end: True kalau semuanya masih milik user_id."""
+    values = ws.get(f"B{start}:B{end}")
+    got = [str(r[0]) if r else "" for r in values]
+    return len(got) == end - start + 1 and all(v == user_id for v in got)
+
+
+def clear_history(user_id: str) -> int:
+    """
+    Hapus history user, return jumlah terhapus.
+    Hanya baca kolom user_id, lalu hapus range baris milik user (deleteDimension, dari bawah
+    ke atas supaya index range berikutnya tidak bergeser). Baris user lain tidak pernah ditulis ulang.
+
+    Index dari col_values bisa basi kalau proses/replica lain menghapus baris di sela-selanya,
+    jadi tiap range dicek ulang user_id-nya tepat sebelum dihapus. Kalau sudah tidak cocok,
+    kolom di-scan ulang (maks HISTORY_CLEAR_RETRIES kali) — index lama tidak pernah dipakai.
+    """
+    ensure_header()
+    ws = _get_worksheet()
+    user_id_str = str(user_id)
 
-    ws.clear()
-    ws.append_row(header, value_input_option="RAW")
-    if kept:
-        ws.append_rows(kept, value_input_option="RAW")
+    # tahan flush selama hapus: batch yang sedang dikirim tidak boleh menyelip di tengah
+    with _WRITER.hold():
+        # baris user ini yang belum ter-flush cukup dibuang dari buffer
+        removed = _WRITER.discard(user_id)
 
+        for _ in range(HISTORY_CLEAR_RETRIES):
+            col = ws.col_values(2)  # kolom user_id, baris 1 = header
+            rows = [i for i, v in enumerate(col, start=1) if i > 1 and str(v) == user_id_str]
+            stale = False
+            for start, end in reversed(_row_ranges(rows)):
+                if not _range_belongs_to(ws, start, end, user_id_str):
+                    stale = True
+                    break
+                ws.spreadsheet.batch_update({
+                    "requests": [{
+                        "deleteDimension": {
+                            "range": {
+                                "sheetId": ws.id,
+                                "dimension": "ROWS",
+                                "startIndex": start - 1,  # 0-based, end eksklusif
+                                "endIndex": end,
+                            }
+                        }
+                    }]
+                })
+                removed += end - start + 1
+            if not stale:
+                break
+            print(f"[WARN] Sheet history berubah saat clear_history({user_id_str}) → scan ulang")
     return removed
@@ -0,0 +1,378 @@
+# src/job_queue.py
+from __future__ import annotations
+
+import os
+import json
+import socket
+import sqlite3
+import threading
+import time
+import uuid
+from typing import Any, Callable, Dict, Iterable, List, Optional
+
+JOB_QUEUE_PATH = os.getenv("JOB_QUEUE_PATH", ".cache/jobs.sqlite3")
+JOB_MAX_ATTEMPTS = int(os.getenv("JOB_MAX_ATTEMPTS", "3"))
+JOB_RETENTION_SECONDS = int(os.getenv("JOB_RETENTION_SECONDS", str(24 * 3600)))
+# lease job 'running': diperpanjang heartbeat tiap LEASE/3 detik; worker mati → lease habis → diambil ulang
+JOB_LEASE_SECONDS = float(os.getenv("JOB_LEASE_SECONDS", "60"))
+JOB_MAX_BACKOFF = float(os.getenv("JOB_MAX_BACKOFF", "30"))
+# purge job selesai (> JOB_RETENTION_SECONDS) dijalankan berkala dari thread heartbeat
+JOB_PURGE_INTERVAL = float(os.getenv("JOB_PURGE_INTERVAL", "3600"))
+
+# compute(chat_id, text) -> iterable part pesan (boleh generator: part dikirim begitu siap)
+# send(chat_id, part) -> kirim 1 part
+ComputeFn = Callable[[str, str], Iterable[str]]
+SendFn = Callable[[str, str], Any]
+
+_JOB_COLS = ("id", "message_id", "chat_id", "text", "attempts", "reply", "sent_parts")
+
+
+class LeaseLost(Exception):
+    """Lease job sudah diambil worker lain (worker ini dianggap mati) → berhenti tanpa menulis."""
+
+
+class JobQueue:
+    """
+    Antrian pesan WhatsApp persisten (SQLite) dengan worker thread; aman dipakai
+    beberapa proses (mis. beberapa worker uvicorn) dengan file DB yang sama.
+    - Idempotent: message_id UNIQUE → retry webhook WAHA tidak diproses dua kali.
+    - Klaim atomik: UPDATE ... WHERE status = 'pending' + cek rowcount, dalam BEGIN IMMEDIATE.
+    - Urutan per chat_id ditegakkan di SQL: hanya job tertua yang belum selesai di tiap chat
+      yang boleh diklaim, jadi satu chat tidak pernah diproses dua worker sekaligus.
+    - Lease: job 'running' punya owner + lease_until (heartbeat). Job milik worker yang mati
+      diambil ulang setelah lease habis; job worker lain yang masih hidup tidak disentuh.
+    - Retry: backoff disimpan sebagai not_before di baris, worker tidak tidur.
+    - Part balasan dikirim begitu compute menghasilkannya (streaming) dan disimpan di job,
+      jadi retry tidak menjalankan controller lagi kalau balasan sudah tersimpan
+      (state "lanjut" tidak maju dua kali) dan part yang sudah terkirim tidak diulang.
+    - Koneksi SQLite per thread: transaksi klaim (yang bisa menunggu busy timeout kalau proses
+      lain memegang DB) tidak memakai lock in-process, jadi enqueue tidak ikut tertahan.
+      Lock hanya menjaga counter, _in_flight dan _wakeup.
+    """
+
+    def __init__(self, compute: ComputeFn, send: SendFn, workers: int = 4,
+                 path: str = JOB_QUEUE_PATH, max_attempts: int = JOB_MAX_ATTEMPTS,
+                 lease_seconds: float = JOB_LEASE_SECONDS, purge_interval: float = JOB_PURGE_INTERVAL):
+        self.compute = compute
+        self.send = send
+        self.workers = max(1, int(workers))
+        self.max_attempts = max(1, int(max_attempts))
+        self.lease_seconds = max(1.0, float(lease_seconds))
+        self.purge_interval = float(purge_interval)
+        self.path = path
+        self.owner = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._local = threading.local()
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS jobs (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                message_id TEXT NOT NULL UNIQUE,
+                chat_id TEXT NOT NULL,
+                text TEXT NOT NULL,
+                status TEXT NOT NULL DEFAULT 'pending',
+                attempts INTEGER NOT NULL DEFAULT 0,
+                reply TEXT,
+                sent_parts INTEGER NOT NULL DEFAULT 0,
+                error TEXT,
+                created_at REAL NOT NULL,
+                updated_at REAL NOT NULL
+            )
+            """
+        )
+        # kolom tambahan (DB lama dari versi sebelumnya di-upgrade di tempat)
+        cols = {r[1] for r in self._conn.execute("PRAGMA table_info(jobs)").fetchall()}
+        for col, ddl in (
+            ("owner", "TEXT"),
+            ("lease_until", "REAL NOT NULL DEFAULT 0"),
+            ("not_before", "REAL NOT NULL DEFAULT 0"),
+        ):
+            if col not in cols:
+                self._conn.execute(f"ALTER TABLE jobs ADD COLUMN {col} {ddl}")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_jobs_status_id ON jobs(status, id)")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_jobs_chat_status_id ON jobs(chat_id, status, id)")
+
+        self._lock = threading.Lock()
+        self._wakeup = threading.Condition(self._lock)
+        self._in_flight = 0
+        self._threads: List[threading.Thread] = []
+        self._stop = threading.Event()
+
+        self.enqueued = 0
+        self.duplicates = 0
+        self.done = 0
+        self.failed = 0
+        self.retried = 0
+        self.recovered = 0
+        self.lease_lost = 0
+        self.first_part_ms_total = 0.0
+        self.job_ms_total = 0.0
+        self.timed_jobs = 0
+        self.purged = 0
+
+    @property
+    def _conn(self) -> sqlite3.Connection:
+        """Koneksi SQLite milik thread pemanggil (dibuat saat pertama dipakai)."""
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, isolation_level=None, timeout=10)
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    # ---------- producer ----------
+    def enqueue(self, message_id: str, chat_id: str, text: str) -> bool:
+        """Masukkan pesan ke antrian. Return False kalau message_id sudah pernah masuk."""
+        now = time.time()
+        cur = self._conn.execute(
+            "INSERT OR IGNORE INTO jobs (message_id, chat_id, text, created_at, updated_at) "
+            "VALUES (?, ?, ?, ?, ?)",
+            (str(message_id), str(chat_id), text, now, now),
+        )
+        with self._lock:
+            if cur.rowcount == 0:
+                self.duplicates += 1
+                return False
+            self.enqueued += 1
+            self._wakeup.notify()
+            return True
+
+    # ---------- lifecycle ----------
+    def start(self) -> None:
+        # job 'running' milik proses yang mati diambil ulang lewat lease yang habis (lihat _claim),
+        # bukan di-reset semua di sini: proses lain yang berbagi DB mungkin sedang mengerjakannya
+        self.purge()
+        self._stop.clear()
+        for i in range(self.workers):
+            t = threading.Thread(target=self._worker, name=f"job-worker-{i}", daemon=True)
+            t.start()
+            self._threads.append(t)
+        t = threading.Thread(target=self._heartbeat, name="job-heartbeat", daemon=True)
+        t.start()
+        self._threads.append(t)
+
+    def stop(self, timeout: float = 5.0) -> None:
+        self._stop.set()
+        with self._lock:
+            self._wakeup.notify_all()
+        for t in self._threads:
+            t.join(timeout=timeout)
+        self._threads = []
+
+    # ---------- worker ----------
+    def _claim(self) -> Optional[Dict[str, Any]]:
+        """
+        Klaim atomik job berikutnya (koneksi thread ini, TANPA lock in-process). Satu transaksi BEGIN IMMEDIATE:
+        1) job 'running' yang lease-nya habis → 'pending' lagi (worker pemiliknya mati),
+        2) pilih job 'pending' tertua yang sudah lewat not_before DAN merupakan job
+           belum-selesai tertua di chat-nya (urutan per chat),
+        3) UPDATE ... WHERE status = 'pending' dan cek rowcount.
+        """
+        now = time.time()
+        recovered = 0
+        self._conn.execute("BEGIN IMMEDIATE")
+        try:
+            cur = self._conn.execute(
+                "UPDATE jobs SET status = 'pending', owner = NULL "
+                "WHERE status = 'running' AND lease_until < ?",
+                (now,),
+            )
+            recovered = cur.rowcount
+
+            row = self._conn.execute(
+                f"SELECT {', '.join(_JOB_COLS)} FROM jobs j "
+                "WHERE j.status = 'pending' AND j.not_before <= ? "
+                "AND NOT EXISTS ("
+                "  SELECT 1 FROM jobs e WHERE e.chat_id = j.chat_id AND e.id < j.id "
+                "  AND e.status IN ('pending', 'running')"
+                ") ORDER BY j.id LIMIT 1",
+                (now,),
+            ).fetchone()
+            if row is None:
+                self._conn.execute("COMMIT")
+                return None
+
+            job = dict(zip(_JOB_COLS, row))
+            cur = self._conn.execute(
+                "UPDATE jobs SET status = 'running', owner = ?, lease_until = ?, "
+                "attempts = attempts + 1, updated_at = ? WHERE id = ? AND status = 'pending'",
+                (self.owner, now + self.lease_seconds, now, job["id"]),
+            )
+            self._conn.execute("COMMIT")
+        except Exception:
+            self._conn.execute("ROLLBACK")
+            raise
+        finally:
+            if recovered:
+                with self._lock:
+                    self.recovered += recovered
+        if cur.rowcount != 1:
+            return None
+        job["attempts"] = int(job["attempts"]) + 1
+        return job
+
+    def _worker(self) -> None:
+        while not self._stop.is_set():
+            try:
+                job = self._claim()
+            except sqlite3.OperationalError as e:
+                print(f"[WARN] Klaim job gagal ({e}) → coba lagi")
+                job = None
+            with self._lock:
+                if job is None:
+                    self._wakeup.wait(timeout=1.0)
+                    continue
+                self._in_flight += 1
+            try:
+                self._process(job)
+            finally:
+                with self._lock:
+                    self._in_flight -= 1
+                    self._wakeup.notify_all()
+
+    def _heartbeat(self) -> None:
+        """Perpanjang lease semua job yang sedang dikerjakan proses ini + purge berkala."""
+        last_purge = time.time()
+        while not self._stop.wait(self.lease_seconds / 3):
+            try:
+                self._conn.execute(
+                    "UPDATE jobs SET lease_until = ? WHERE owner = ? AND status = 'running'",
+                    (time.time() + self.lease_seconds, self.owner),
+                )
+            except sqlite3.OperationalError as e:
+                print(f"[WARN] Heartbeat job gagal: {e}")
+            if self.purge_interval > 0 and time.time() - last_purge >= self.purge_interval:
+                last_purge = time.time()
+                try:
+                    self.purge()
+                except sqlite3.OperationalError as e:
+                    print(f"[WARN] Purge job gagal: {e}")
+
+    def _process(self, job: Dict[str, Any]) -> None:
+        job_id = job["id"]
+        chat_id = job["chat_id"]
+        sent = int(job["sent_parts"] or 0)
+        t0 = time.perf_counter()
+        first_ms: Optional[float] = None
+        try:
+            if job["reply"] is not None:
+                # retry: balasan sudah lengkap, lanjutkan kirim dari part yang belum terkirim
+                parts = self._load_parts(job["reply"])
+                for i in range(sent, len(parts)):
+                    self.send(chat_id, parts[i])
+                    self._update(job_id, sent_parts=i + 1)
+            else:
+                # streaming: kirim tiap part begitu siap.
+                # - Retry setelah crash di tengah (reply masih NULL): compute diulang — state session
+                #   belum tersimpan karena proses mati sebelum save_state — dan sent_parts pertama dilewati.
+                # - compute error setelah menghasilkan part: yang sudah ada disimpan sebagai reply,
+                #   retry hanya mengirim sisanya tanpa compute ulang (state sudah tersimpan).
+                # - Kirim gagal: compute tetap dihabiskan supaya balasan lengkap tersimpan untuk retry.
+                skip = sent
+                parts: List[str] = []
+                send_error: Optional[Exception] = None
+                try:
+                    for part in self.compute(chat_id, job["text"]):
+                        parts.append(part)
+                        if send_error is not None or len(parts) <= skip:
+                            continue
+                        try:
+                            self.send(chat_id, part)
+                        except Exception as e:
+                            send_error = e
+                            continue
+                        sent = len(parts)
+                        self._update(job_id, sent_parts=sent)
+                        if first_ms is None:
+                            first_ms = (time.perf_counter() - t0) * 1000
+                except LeaseLost:
+                    raise
+                except Exception:
+                    if parts:
+                        self._update(job_id, reply=json.dumps(parts, ensure_ascii=False))
+                    raise
+                self._update(job_id, reply=json.dumps(parts, ensure_ascii=False))
+                if send_error is not None:
+                    raise send_error
+
+            self._update(job_id, status="done", error=None, owner=None)
+            with self._lock:
+                self.done += 1
+                if first_ms is not None:
+                    self.timed_jobs += 1
+                    self.first_part_ms_total += first_ms
+                    self.job_ms_total += (time.perf_counter() - t0) * 1000
+        except LeaseLost:
+            with self._lock:
+                self.lease_lost += 1
+            print(f"[QUEUE] job {job['message_id']}: lease diambil worker lain → berhenti")
+        except Exception as e:
+            attempts = int(job["attempts"])
+            status = "pending" if attempts < self.max_attempts else "failed"
+            not_before = time.time() + min(2 ** attempts, JOB_MAX_BACKOFF) if status == "pending" else 0
+            try:
+                self._update(job_id, status=status, error=f"{type(e).__name__}: {e}",
+                             owner=None, not_before=not_before)
+            except LeaseLost:
+                return
+            with self._lock:
+                if status == "pending":
+                    self.retried += 1
+                else:
+                    self.failed += 1
+            print(f"[QUEUE] job {job['message_id']} gagal (attempt {attempts}): {e} → {status}")
+
+    @staticmethod
+    def _load_parts(reply: str) -> List[str]:
+        try:
+            parts = json.loads(reply)
+        except ValueError:
+            return [reply]
+        return [str(p) for p in parts] if isinstance(parts, list) else [str(parts)]
+
+    def _update(self, job_id: int, **fields: Any) -> None:
+        """Update job milik worker ini (+ perpanjang lease). Raise LeaseLost kalau sudah bukan miliknya."""
+        now = time.time()
+        fields["updated_at"] = now
+        fields["lease_until"] = now + self.lease_seconds
+        cols = ", ".join(f"{k} = ?" for k in fields)
+        cur = self._conn.execute(
+            f"UPDATE jobs SET {cols} WHERE id = ? AND owner = ? AND status = 'running'",
+            (*fields.values(), job_id, self.owner),
+        )
+        if cur.rowcount != 1:
+            raise LeaseLost(job_id)
+
+    # ---------- maintenance ----------
+    def purge(self, older_than: float = JOB_RETENTION_SECONDS) -> int:
+        """Hapus job selesai yang lebih tua dari retention (window idempotensi)."""
+        cutoff = time.time() - older_than
+        cur = self._conn.execute(
+            "DELETE FROM jobs WHERE status IN ('done', 'failed') AND updated_at < ?", (cutoff,)
+        )
+        with self._lock:
+            self.purged += cur.rowcount
+        return cur.rowcount
+
+    def stats(self) -> Dict[str, Any]:
+        counts = dict(self._conn.execute("SELECT status, COUNT(*) FROM jobs GROUP BY status").fetchall())
+        with self._lock:
+            in_flight = self._in_flight
+        return {
+            "workers": self.workers,
+            "owner": self.owner,
+            "in_flight": in_flight,
+            "by_status": counts,
+            "enqueued": self.enqueued,
+            "duplicates": self.duplicates,
+            "done": self.done,
+            "failed": self.failed,
+            "retried": self.retried,
+            "recovered": self.recovered,
+            "lease_lost": self.lease_lost,
+            "purged": self.purged,
+            "avg_first_part_ms": round(self.first_part_ms_total / self.timed_jobs, 1) if self.timed_jobs else 0.0,
+            "avg_job_ms": round(self.job_ms_total / self.timed_jobs, 1) if self.timed_jobs else 0.0,
+        }
@@ -1,27 +1,31 @@
-import os, re, json
-from typing import List, Dict, Any, Optional
+import os, re, json, time, threading
+from typing import List, Dict, Any, Optional, Callable, Iterator, Tuple
 
-from langchain_core.prompts import ChatPromptTemplate, FewShotChatMessagePromptTemplate, MessagesPlaceholder
+from functools import lru_cache
+
+from langchain_core.messages import AIMessage, BaseMessage, HumanMessage, SystemMessage
+from langchain_core.prompts import ChatPromptTemplate, MessagesPlaceholder
 from langchain_core.output_parsers import StrOutputParser
-from langchain_openai import ChatOpenAI
+from langchain_core.runnables import RunnablePassthrough
 from dotenv import load_dotenv
 from langchain_core.prompts import ChatPromptTemplate
 from typing import Set
 
+from conclusion_cache import CONCLUSION_CACHE, ConclusionKeys, conclusion_keys, cosine_similarity
+from llm_clients import get_chat_llm
+from neo4j_client import hydrate_results
+from cache_utils import normalize_cache_text
+from planner import TieredPlanner
+from context_builder import (
+    CONCLUSION_FINAL_TOKEN_BUDGET, CONCLUSION_TOKEN_BUDGET, QA_CONTEXT_TOKEN_BUDGET, build_context, source_fields,
+)
+
 
 load_dotenv()
 
 def get_llm():
-    api_key = os.getenv("OPENAI_API_KEY")
-    if not api_key:
-        raise RuntimeError("OPENAI_API_KEY belum diset. Cek file .env")
-
-    llm = ChatOpenAI(
-        model="gpt-4o",
-        api_key=api_key,
-        temperature=0,
-    )
-    return llm
+    # client bersama (pool HTTP + batas konkurensi) dari llm_clients
+    return get_chat_llm(model="gpt-4o", temperature=0)
 
 def get_prompt():
     return ChatPromptTemplate.from_messages([
@@ -65,13 +69,25 @@ JANGAN tambah penjelasan di luar JSON."""),
     ("human", "User input: {user_text}")
 ])
 
+_PLANNER: Optional[TieredPlanner] = None
+_PLANNER_LOCK = threading.Lock()
+
+
 def build_planner_chain():
-    api_key = os.getenv("OPENAI_API_KEY")
-    if not api_key:
-        raise RuntimeError("OPENAI_API_KEY belum diset (cek .env).")
+    """
+    Planner bertingkat (aturan → cache plan → LLM), API sama dengan chain lama:
+    .invoke({"user_text": ...}) → string JSON. Dibuat sekali per proses (metrik & cache bersama).
+    """
+    global _PLANNER
+    with _PLANNER_LOCK:
+        if _PLANNER is None:
+            llm = get_chat_llm(model="gpt-4o", temperature=0)
+            _PLANNER = TieredPlanner(planner_prompt | llm | StrOutputParser(), parse=safe_parse_plan)
+        return _PLANNER
 
-    llm = ChatOpenAI(model="gpt-4o", temperature=0, api_key=api_key)
-    return planner_prompt | llm | StrOutputParser()
+
+def get_planner_stats() -> Dict[str, Any]:
+    return _PLANNER.stats() if _PLANNER is not None else {}
 
 
 def safe_parse_plan(text: str) -> Dict[str, Any]:
@@ -221,225 +237,134 @@ examples = [
         "assistant":
         "Baik. Melanjutkan dari konteks sebelumnya berdasarkan CONTEXT."
     },
+]
 
-    {
-        "user": "gambaran hisab",
-        "assistant": "Baik. Saya akan mencari ayat-ayat yang membahas Hari Hisab (Yaum al-Ḥisāb), lalu menyajikannya berdasarkan CONTEXT yang tersedia, mencakup ayat Arab, terjemahan, kategori, serta tafsir yang ada."
-    },
-    {
-        "user": "apa yang terjadi pada hari kiamat?",
-        "assistant": "Baik. Saya akan menyajikan penjelasan tentang peristiwa Hari Kiamat berdasarkan ayat-ayat yang relevan di CONTEXT, dilengkapi dengan terjemahan, kategori, dan tafsir yang tersedia."
-    },
-    {
-        "user": "tafsir buya hamka tentang tamak",
-        "assistant": "Baik. Saya akan fokus menampilkan Tafsir Buya Hamka saja yang relevan dengan tema tamak atau kerakusan, berdasarkan data yang tersedia di CONTEXT."
-    },
-    {
-        "user": "tolong kemenag wajiz aja tentang hari pembalasan",
-        "assistant": "Siap. Saya akan menyajikan ayat yang membahas Hari Pembalasan berdasarkan CONTEXT, dengan menampilkan terjemahan, kategori, dan Tafsir Kemenag (Wajiz) saja."
-    },
-    {
-        "user": "kemenag tahlili tentang amal manusia",
-        "assistant": "Baik. Saya akan menampilkan penjelasan dari Tafsir Kemenag (Tahlili) yang membahas amal perbuatan manusia, berdasarkan ayat-ayat yang tersedia di CONTEXT."
-    },
-    {
-        "user": "hari penentuan itu gimana?",
-        "assistant": "Baik. Istilah 'hari penentuan' biasanya merujuk pada Hari Pemutusan Perkara. Saya akan mencari ayat yang relevan dan menyajikannya berdasarkan CONTEXT beserta tafsir yang tersedia."
-    },
-    {
-        "user": "tutup buku amal manusia",
-        "assistant": "Baik. Ungkapan tersebut biasanya berkaitan dengan perhitungan amal. Saya akan menyajikan ayat-ayat yang relevan berdasarkan CONTEXT beserta terjemahan dan tafsir yang tersedia."
-    },
-    {
-        "user": "berikan 5 lagi",
-        "assistant": "Baik. Saya akan menampilkan tambahan hasil dari pencarian sebelumnya, selama data tersebut tersedia di dalam CONTEXT."
-    },
-    {
-        "user": "lanjutkan",
-        "assistant": "Baik. Saya akan melanjutkan pembahasan berdasarkan hasil sebelumnya tanpa mengubah topik, sesuai data yang tersedia."
-    },
-    {
-        "user": "perbuatan apa yang membuat manusia masuk surga?",
-        "assistant": "Baik. Saya akan menyajikan ayat-ayat yang menjelaskan perbuatan yang menjadi sebab masuk surga berdasarkan CONTEXT, dilengkapi dengan terjemahan, kategori, dan tafsir yang tersedia."
-    },
-    {
-        "user": "sebutkan 10 surat lain di luar yang ada",
-        "assistant": "Maaf, permintaan tersebut tidak dapat dipenuhi karena data tersebut tidak tersedia di dalam dataset yang digunakan."
-    },
-    {
-        "user": "tambahkan ayat dari surat lain",
-        "assistant": "Maaf, saya hanya dapat menyajikan ayat dan tafsir yang tersedia di dalam CONTEXT sesuai dengan dataset."
-    },
-    {
-        "user": "jelaskan topik baru setelah yang lama",
-        "assistant": "Baik. Ini topik baru, saya akan fokus ke konteks baru berdasarkan CONTEXT, tanpa campur yang sebelumnya."
-    },
-    {
-        "user": "lanjutkan dari sebelumnya",
-        "assistant": "Baik. Melanjutkan dari konteks sebelumnya berdasarkan CONTEXT."
-    },
+# === FEW-SHOT QA ===
+QA_FEWSHOT_K = int(os.getenv("QA_FEWSHOT_K", "4"))  # 0 → pakai semua contoh (prefix 100% statis)
 
-    # =========================
-    # 1. Query umum / topik
-    # =========================
-    {
-        "user": "gambaran hisab",
-        "assistant":
-        "Baik. Saya akan mencari ayat-ayat yang membahas Hari Hisab (Yaum al-Ḥisāb), "
-        "lalu menyajikannya berdasarkan CONTEXT yang tersedia, mencakup ayat Arab, "
-        "terjemahan, kategori, serta tafsir yang ada."
-    },
+QA_SYSTEM_PROMPT = (
+    "Kamu adalah asisten tafsir Al-Qur'an berbasis GraphRAG (Neo4j).\n\n"
 
-    {
-        "user": "apa yang terjadi pada hari kiamat?",
-        "assistant":
-        "Baik. Saya akan menyajikan penjelasan tentang peristiwa Hari Kiamat "
-        "berdasarkan ayat-ayat yang relevan di CONTEXT, dilengkapi dengan "
-        "terjemahan, kategori, dan tafsir yang tersedia."
-    },
+    "ATURAN KERAS (WAJIB DIPATUHI):\n"
+    "- Jawaban HANYA BOLEH menggunakan informasi dari CONTEXT.\n"
+    "- DILARANG menambah ayat, tafsir, contoh, atau pengetahuan di luar CONTEXT.\n"
+    "- DILARANG menyebut surat atau ayat yang TIDAK ADA di CONTEXT.\n"
+    "- DILARANG menambah jumlah ayat melebihi yang tersedia di CONTEXT.\n"
+    "- Kamu BUKAN mesin pencari dan BUKAN pengetahuan umum.\n\n"
 
-    # =========================
-    # 2. Filter tafsir spesifik
-    # =========================
-    {
-        "user": "tafsir buya hamka tentang tamak",
-        "assistant":
-        "Baik. Saya akan fokus menampilkan Tafsir Buya Hamka saja yang relevan "
-        "dengan tema tamak atau kerakusan, berdasarkan data yang tersedia di CONTEXT."
-    },
+    "ATURAN REFERENSI:\n"
+    "- Setiap penjelasan HARUS menyebutkan surat dan ayat yang dirujuk.\n"
+    "- Jika tidak ada rujukan eksplisit dalam CONTEXT, jawab:\n"
+    "  'Tidak ditemukan rujukan eksplisit dalam konteks.'\n\n"
 
-    {
-        "user": "tolong kemenag wajiz aja tentang hari pembalasan",
-        "assistant":
-        "Siap. Saya akan menyajikan ayat yang membahas Hari Pembalasan "
-        "berdasarkan CONTEXT, dengan menampilkan terjemahan, kategori, dan "
-        "Tafsir Kemenag (Wajiz) saja."
-    },
+    "ATURAN FILTER:\n"
+    "- Jika user meminta 'hamka saja' → tampilkan hanya tafsir_buya_hamka.\n"
+    "- Jika user meminta 'kemenag wajiz' → tampilkan hanya tafsir_kemenag_wajiz.\n"
+    "- Jika user meminta 'kemenag tahlili' → tampilkan hanya tafsir_kemenag_tahlili.\n"
+    "- Jika tidak disebutkan, tampilkan semua tafsir yang tersedia di CONTEXT.\n\n"
 
-    {
-        "user": "kemenag tahlili tentang amal manusia",
-        "assistant":
-        "Baik. Saya akan menampilkan penjelasan dari Tafsir Kemenag (Tahlili) "
-        "yang membahas amal perbuatan manusia, berdasarkan ayat-ayat yang tersedia di CONTEXT."
-    },
+    "FORMAT JAWABAN:\n"
+    "- Jawaban rapi, terstruktur, dan faktual.\n"
+    "- Tanpa asumsi tambahan.\n\n"
 
-    # =========================
-    # 3. Istilah ambigu
-    # =========================
-    {
-        "user": "hari penentuan itu gimana?",
-        "assistant":
-        "Baik. Istilah 'hari penentuan' biasanya merujuk pada Hari Pemutusan Perkara. "
-        "Saya akan mencari ayat yang relevan dan menyajikannya berdasarkan CONTEXT "
-        "beserta tafsir yang tersedia."
-    },
+    "Jika konteks tidak cukup untuk menjawab pertanyaan user, jawab:\n"
+    "'Konteks tidak mencukupi.'"
+)
 
-    {
-        "user": "tutup buku amal manusia",
-        "assistant":
-        "Baik. Ungkapan tersebut biasanya berkaitan dengan perhitungan amal. "
-        "Saya akan menyajikan ayat-ayat yang relevan berdasarkan CONTEXT "
-        "beserta terjemahan dan tafsir yang tersedia."
-    },
 
-    # =========================
-    # 4. Pagination / lanjutan
-    # =========================
-    {
-        "user": "berikan 5 lagi",
-        "assistant":
-        "Baik. Saya akan menampilkan tambahan hasil dari pencarian sebelumnya, "
-        "selama data tersebut tersedia di dalam CONTEXT."
-    },
+def _dedupe_examples(items: List[Dict[str, str]]) -> List[Dict[str, str]]:
+    """Buang contoh few-shot duplikat (berdasarkan teks user ternormalisasi), urutan asli dipertahankan."""
+    seen = set()
+    out = []
+    for ex in items:
+        key = normalize_cache_text(ex.get("user", ""))
+        if key and key not in seen:
+            seen.add(key)
+            out.append(ex)
+    return out
 
-    {
-        "user": "lanjutkan",
-        "assistant":
-        "Baik. Saya akan melanjutkan pembahasan berdasarkan hasil sebelumnya "
-        "tanpa mengubah topik, sesuai data yang tersedia."
-    },
 
-    # =========================
-    # 5. Pertanyaan kompleks
-    # =========================
-    {
-        "user": "perbuatan apa yang membuat manusia masuk surga?",
-        "assistant":
-        "Baik. Saya akan menyajikan ayat-ayat yang menjelaskan perbuatan "
-        "yang menjadi sebab masuk surga berdasarkan CONTEXT, "
-        "dilengkapi dengan terjemahan, kategori, dan tafsir yang tersedia."
-    },
+FEWSHOT_EXAMPLES = _dedupe_examples(examples)
 
-    # =========================
-    # 6. Penolakan aman (ANTI HALUSINASI)
-    # =========================
-    {
-        "user": "sebutkan 10 surat lain di luar yang ada",
-        "assistant":
-        "Maaf, permintaan tersebut tidak dapat dipenuhi karena data tersebut "
-        "tidak tersedia di dalam dataset yang digunakan."
-    },
+_EXAMPLE_VECS: Optional[List[List[float]]] = None
+_EXAMPLE_VECS_LOCK = threading.Lock()
+_EXAMPLE_WARMUP: Optional[threading.Thread] = None
 
-    {
-        "user": "tambahkan ayat dari surat lain",
-        "assistant":
-        "Maaf, saya hanya dapat menyajikan ayat dan tafsir yang tersedia "
-        "di dalam CONTEXT sesuai dengan dataset."
-    },
 
-    # UBahan/Baru: Tambah buat handle new/followup lebih baik
-    {
-        "user": "jelaskan topik baru setelah yang lama",
-        "assistant":
-        "Baik. Ini topik baru, saya akan fokus ke konteks baru berdasarkan CONTEXT, tanpa campur yang sebelumnya."
-    },
-    {
-        "user": "lanjutkan dari sebelumnya",
-        "assistant":
-        "Baik. Melanjutkan dari konteks sebelumnya berdasarkan CONTEXT."
-    },
-]
+def warm_fewshot_vectors() -> int:
+    """Hitung embedding semua contoh (blocking; embed_query ber-cache di disk → proses berikutnya murah)."""
+    global _EXAMPLE_VECS
+    if _EXAMPLE_VECS is None:
+        from embeddings import embed_query
+        vecs = [embed_query(ex["user"]) for ex in FEWSHOT_EXAMPLES]
+        with _EXAMPLE_VECS_LOCK:
+            _EXAMPLE_VECS = vecs
+    return len(_EXAMPLE_VECS)
+
+
+def _start_fewshot_warmup() -> None:
+    """Precompute embedding contoh di thread background (sekali per proses)."""
+    global _EXAMPLE_WARMUP
+    with _EXAMPLE_VECS_LOCK:
+        if _EXAMPLE_VECS is not None or _EXAMPLE_WARMUP is not None:
+            return
+        _EXAMPLE_WARMUP = threading.Thread(target=_warmup_worker, name="fewshot-warmup", daemon=True)
+        _EXAMPLE_WARMUP.start()
+
+
+def _warmup_worker() -> None:
+    global _EXAMPLE_WARMUP
+    try:
+        n = warm_fewshot_vectors()
+        print(f"[FEWSHOT] Embedding {n} contoh siap")
+    except Exception as e:
+        print(f"[WARN] Precompute embedding few-shot gagal: {e}")
+        with _EXAMPLE_VECS_LOCK:
+            _EXAMPLE_WARMUP = None  # boleh dicoba lagi
+
+
+def select_fewshot(user_text: str, k: int = QA_FEWSHOT_K) -> Tuple[int, ...]:
+    """
+    Index k contoh paling mirip dengan user_text (embedding), dikembalikan dalam urutan
+    kanonik (urutan di FEWSHOT_EXAMPLES) supaya prefix yang sama selalu identik byte-per-byte.
+    Selama embedding contoh belum siap (precompute di background) → k contoh pertama,
+    tanpa menahan request untuk meng-embed 14 contoh.
+    """
+    n = len(FEWSHOT_EXAMPLES)
+    if k <= 0 or k >= n:
+        return tuple(range(n))
+    vecs = _EXAMPLE_VECS
+    if vecs is None:
+        _start_fewshot_warmup()
+        return tuple(range(k))
+    try:
+        from embeddings import embed_query
+        q = embed_query(user_text or "")
+        scores = [cosine_similarity(q, v) for v in vecs]
+    except Exception as e:
+        print(f"[WARN] Pemilihan few-shot gagal ({e}) → pakai {k} contoh pertama")
+        return tuple(range(k))
+    best = sorted(range(n), key=lambda i: -scores[i])[:k]
+    return tuple(sorted(best))
+
+
+@lru_cache(maxsize=256)
+def qa_prefix_messages(example_ids: Tuple[int, ...]) -> Tuple[BaseMessage, ...]:
+    """System + few-shot yang sudah dirender (memo per set contoh, immutable)."""
+    msgs: List[BaseMessage] = [SystemMessage(content=QA_SYSTEM_PROMPT)]
+    for i in example_ids:
+        ex = FEWSHOT_EXAMPLES[i]
+        msgs.append(HumanMessage(content=ex["user"]))
+        msgs.append(AIMessage(content=ex["assistant"]))
+    return tuple(msgs)
+
+
+def _qa_prefix(inputs: Dict[str, Any]) -> List[BaseMessage]:
+    return list(qa_prefix_messages(select_fewshot(inputs.get("user_text", ""))))
 
-fewshot = FewShotChatMessagePromptTemplate(
-    examples=examples,
-    input_variables=["user_text"],
-    example_prompt=ChatPromptTemplate.from_messages([
-        ("human", "{user}"),
-        ("ai", "{assistant}")
-    ])
-)
 
 qa_prompt = ChatPromptTemplate.from_messages([
-    ("system",
-     "Kamu adalah asisten tafsir Al-Qur'an berbasis GraphRAG (Neo4j).\n\n"
-
-     "ATURAN KERAS (WAJIB DIPATUHI):\n"
-     "- Jawaban HANYA BOLEH menggunakan informasi dari CONTEXT.\n"
-     "- DILARANG menambah ayat, tafsir, contoh, atau pengetahuan di luar CONTEXT.\n"
-     "- DILARANG menyebut surat atau ayat yang TIDAK ADA di CONTEXT.\n"
-     "- DILARANG menambah jumlah ayat melebihi yang tersedia di CONTEXT.\n"
-     "- Kamu BUKAN mesin pencari dan BUKAN pengetahuan umum.\n\n"
-
-     "ATURAN REFERENSI:\n"
-     "- Setiap penjelasan HARUS menyebutkan surat dan ayat yang dirujuk.\n"
-     "- Jika tidak ada rujukan eksplisit dalam CONTEXT, jawab:\n"
-     "  'Tidak ditemukan rujukan eksplisit dalam konteks.'\n\n"
-
-     "ATURAN FILTER:\n"
-     "- Jika user meminta 'hamka saja' → tampilkan hanya tafsir_buya_hamka.\n"
-     "- Jika user meminta 'kemenag wajiz' → tampilkan hanya tafsir_kemenag_wajiz.\n"
-     "- Jika user meminta 'kemenag tahlili' → tampilkan hanya tafsir_kemenag_tahlili.\n"
-     "- Jika tidak disebutkan, tampilkan semua tafsir yang tersedia di CONTEXT.\n\n"
-
-     "FORMAT JAWABAN:\n"
-     "- Jawaban rapi, terstruktur, dan faktual.\n"
-     "- Tanpa asumsi tambahan.\n\n"
-
-     "Jika konteks tidak cukup untuk menjawab pertanyaan user, jawab:\n"
-     "'Konteks tidak mencukupi.'"
-    ),
-
-    fewshot,
+    MessagesPlaceholder("prefix"),
     MessagesPlaceholder("history"),
 
     ("human",
@@ -449,42 +374,256 @@ qa_prompt = ChatPromptTemplate.from_messages([
     )
 ])
 
+_QA_FIELDS = [
+    ("terjemahan", "Terjemahan", None),
+    ("tafsir_tahlili", "Tafsir Tahlili", "tahlili"),
+    ("tafsir_wajiz", "Tafsir Wajiz", "wajiz"),
+    ("tafsir_hamka", "Tafsir Hamka", "hamka"),
+]
+
+
+def build_qa_context(records: List[Dict], sources: Set[str], budget: int = QA_CONTEXT_TOKEN_BUDGET) -> str:
+    """Isi {context} untuk build_answer_chain, dengan rujukan [Surat ayat] dan batas token."""
+    context, _ = build_context(
+        records, source_fields(sources or {"all"}, _QA_FIELDS), budget, label="qa",
+        ref=lambda r: f"[{r.get('nama_surat', '?')} {r.get('ayat_ke', '?')}]",
+    )
+    return context
+
+
+def _qa_context(inputs: Dict[str, Any]) -> str:
+    records = inputs.get("records")
+    if records is None:
+        return inputs.get("context") or ""
+    return build_qa_context(records, inputs.get("sources") or {"all"})
+
+
 #answer_chain = qa_prompt | llm | StrOutputParser()
 def build_answer_chain():
+    """
+    Input: {"user_text", "records", "sources", "history"} → {context} dirakit build_qa_context
+    (context_builder yang sama dengan kesimpulan: dedup, ranking, batas token).
+    "context" jadi (tanpa "records") tetap diterima apa adanya. Prefix system + few-shot diisi otomatis.
+    """
     llm = get_llm()
-    return qa_prompt | llm | StrOutputParser()
+    _start_fewshot_warmup()
+    return RunnablePassthrough.assign(prefix=_qa_prefix, context=_qa_context) | qa_prompt | llm | StrOutputParser()
+
+# === STREAMING ===
+_STREAM_LOCK = threading.Lock()
+_STREAM_METRICS = {
+    "streams": 0,
+    "fallbacks": 0,
+    "cancelled": 0,
+    "errors": 0,
+    "truncated": 0,
+    "ttft_ms_total": 0.0,
+    "ttft_count": 0,
+    "last_ttft_ms": None,
+}
+
+
+def get_stream_metrics() -> Dict[str, Any]:
+    """Metrik streaming LLM: time-to-first-token, fallback, pembatalan."""
+    with _STREAM_LOCK:
+        m = dict(_STREAM_METRICS)
+    m["avg_ttft_ms"] = round(m["ttft_ms_total"] / m["ttft_count"], 1) if m["ttft_count"] else None
+    return m
+
+
+def _bump(key: str, value: float = 1) -> None:
+    with _STREAM_LOCK:
+        _STREAM_METRICS[key] += value
+
+
+# ditambahkan ke jawaban kalau stream putus setelah sebagian teks terkirim
+STREAM_TRUNCATED_NOTICE = "\n\n⚠️ _Jawaban terpotong karena gangguan koneksi ke model. Silakan kirim ulang pertanyaannya._"
+
+
+def stream_with_fallback(
+    llm,
+    prompt: str,
+    blocking: Callable[[], str],
+    on_complete: Optional[Callable[[str], None]] = None,
+) -> Iterator[str]:
+    """
+    Stream token dari llm.stream(prompt) begitu datang.
+    - Kalau streaming gagal sebelum token pertama → pakai jalur blocking().
+    - Gagal setelah token pertama → STREAM_TRUNCATED_NOTICE dikirim (jawaban tidak berhenti diam-diam).
+    - Pembatalan: pemanggil cukup close() generator (mis. Streamlit rerun / user pindah halaman)
+      → stream LLM ikut ditutup dan on_complete tidak dipanggil.
+    - on_complete(teks lengkap): hanya dipanggil kalau stream selesai normal (mis. untuk cache).
+    """
+    _bump("streams")
+    t0 = time.perf_counter()
+    got_token = False
+    completed = False
+    truncated = False
+    parts: List[str] = []
+    stream = None
+    try:
+        stream = iter(llm.stream(prompt))
+        for chunk in stream:
+            text = getattr(chunk, "content", chunk) or ""
+            if not text:
+                continue
+            if not got_token:
+                got_token = True
+                ttft = (time.perf_counter() - t0) * 1000
+                with _STREAM_LOCK:
+                    _STREAM_METRICS["ttft_ms_total"] += ttft
+                    _STREAM_METRICS["ttft_count"] += 1
+                    _STREAM_METRICS["last_ttft_ms"] = round(ttft, 1)
+            parts.append(text)
+            yield text
+        completed = True
+    except GeneratorExit:
+        _bump("cancelled")
+        print("[LLM] Streaming dibatalkan")
+        raise
+    except Exception as e:
+        _bump("errors")
+        print(f"[ERROR] Streaming LLM gagal: {e}")
+        if got_token:
+            truncated = True
+    finally:
+        close = getattr(stream, "close", None)
+        if close is not None:
+            close()
+
+    if truncated:
+        _bump("truncated")
+        print(f"[WARN] Jawaban terpotong setelah {sum(len(p) for p in parts)} karakter")
+        yield STREAM_TRUNCATED_NOTICE
+    elif not got_token:
+        _bump("fallbacks")
+        yield blocking()
+    elif completed and on_complete is not None:
+        on_complete("".join(parts))
+
 
 # === KESIMPULAN ===
-def generate_contextual_conclusion(topic: str, records: List[Dict], sources: Set[str], is_final: bool = False) -> str:
-    if not records:
-        return "Belum ada data untuk kesimpulan."
+# satu-satunya implementasi kesimpulan (controller memakai ini juga)
+# naikkan kalau isi prompt kesimpulan berubah → cache kesimpulan lama tidak dipakai lagi
+_CONCLUSION_PROMPT_VERSION = "conclusion-2p-v3"
+
+_CONCLUSION_FIELDS = [
+    ("terjemahan", "TERJ", None),
+    ("tafsir_tahlili", "TAHLILI", "tahlili"),
+    ("tafsir_wajiz", "WAJIZ", "wajiz"),
+    ("tafsir_hamka", "HAMKA", "hamka"),
+]
+
+
+def _conclusion_budget(is_final: bool) -> int:
+    return CONCLUSION_FINAL_TOKEN_BUDGET if is_final else CONCLUSION_TOKEN_BUDGET
 
-    chunks = []
-    max_records = min(30 if is_final else 15, len(records))
-    for r in records[:max_records]:
-        for key in ["tafsir_tahlili", "tafsir_wajiz", "tafsir_hamka"]:
-            if ("all" in sources or key.split("_")[-1] in sources) and (txt := r.get(key)):
-                chunks.append(txt)
 
-    if not chunks:
-        return "Tidak cukup data tafsir untuk kesimpulan."
+def conclusion_records(records: List[Dict], is_final: bool) -> List[Dict]:
+    """Record yang benar-benar masuk prompt kesimpulan."""
+    max_records = 12 if not is_final else 30
+    return records[:max_records]
+
+
+def _conclusion_keys(topic: str, records: List[Dict], sources: Set[str], is_final: bool) -> ConclusionKeys:
+    # budget ikut versi: budget beda → isi prompt beda
+    version = f"{_CONCLUSION_PROMPT_VERSION}:{_conclusion_budget(is_final)}"
+    return conclusion_keys(version, topic, conclusion_records(records, is_final), sources, is_final)
+
+
+def _build_conclusion_prompt(topic: str, records: List[Dict], sources: Set[str], is_final: bool = False):
+    """Return (prompt, None), atau (None, pesan pengganti) kalau bahan tidak cukup."""
+    if not records:
+        return None, "Belum ada data untuk kesimpulan."
+
+    # ambil bahan (record ringan di-hydrate hanya untuk potongan yang dikirim ke LLM),
+    # lalu dirakit dalam batas token
+    batch = hydrate_results(conclusion_records(records, is_final))
+    context, _ = build_context(
+        batch, source_fields(sources, _CONCLUSION_FIELDS), _conclusion_budget(is_final),
+        label="kesimpulan akhir" if is_final else "kesimpulan",
+    )
+
+    if not context:
+        return None, "Tidak cukup data tafsir/terjemahan untuk menyusun kesimpulan."
 
-    prompt_type = "kesimpulan akhir (lebih mendalam, komprehensif, dan merangkum seluruh aspek)" if is_final else "kesimpulan sementara"
     prompt = f"""
-    Berdasarkan ayat-ayat dan tafsir berikut tentang "{topic}":
-    {chr(10).join("- " + c for c in chunks)}
-
-    Buat {prompt_type} yang panjang dan mendalam (6-10 kalimat), tetap objektif, akademis, dan berbasis isi ayat serta tafsir yang ada.
-    - Jelaskan makna utama dan kaitannya dengan perilaku manusia di dunia.
-    - Ringkas semua elemen penting dari seluruh batch.
-    - Gunakan bahasa formal, jelas.
-    - Jangan tambah opini pribadi, tetap setia pada teks Al-Qur'an dan tafsir yang disediakan.
-    """
+Berdasarkan potongan terjemahan & tafsir berikut tentang "{topic}":
+{context}
 
+Tulis kesimpulan yang BENAR-BENAR merangkum isi ayat yang ditampilkan.
+- 2 paragraf, total 8–12 kalimat.
+- Paragraf 1: benang merah tema & makna utama.
+- Paragraf 2: implikasi perilaku manusia di dunia (tetap berbasis teks).
+- Hindari pengulangan.
+- Bahasa Indonesia formal dan jelas.
+""".strip()
+    return prompt, None
+
+
+def invoke_conclusion(prompt: str, keys: Optional[ConclusionKeys] = None) -> str:
+    """Panggil LLM (blocking); hasil yang berhasil disimpan di cache kesimpulan."""
     try:
         llm = get_llm()
-        response = llm.invoke(prompt)
-        return response.content.strip()
+        resp = llm.invoke(prompt)
+        text = (resp.content or "").strip()
     except Exception as e:
         print(f"[ERROR] Kesimpulan gagal: {e}")
-        return "Kesimpulan gagal dibuat karena error teknis."
\ No newline at end of file
+        return "Kesimpulan gagal dibuat karena error teknis."
+    if text and keys is not None:
+        CONCLUSION_CACHE.put(keys, text)
+    return text or "Kesimpulan gagal dibuat."
+
+
+def stream_conclusion_prompt(prompt: str, keys: Optional[ConclusionKeys] = None) -> Iterator[str]:
+    """Stream kesimpulan dari prompt jadi; fallback blocking, cache hanya kalau stream selesai."""
+    try:
+        llm = get_llm()
+    except Exception as e:
+        print(f"[ERROR] Kesimpulan gagal: {e}")
+        yield "Kesimpulan gagal dibuat karena error teknis."
+        return
+    yield from stream_with_fallback(
+        llm, prompt,
+        blocking=lambda: invoke_conclusion(prompt, keys),
+        on_complete=(lambda text: CONCLUSION_CACHE.put(keys, text.strip())) if keys is not None else None,
+    )
+
+
+def generate_contextual_conclusion(topic: str, records: List[Dict], sources: Set[str], is_final: bool = False) -> str:
+    if not records:
+        return "Belum ada data untuk kesimpulan."
+
+    keys = _conclusion_keys(topic, records, sources, is_final)
+    cached = CONCLUSION_CACHE.get(keys)
+    if cached is not None:
+        return cached
+
+    prompt, message = _build_conclusion_prompt(topic, records, sources, is_final=is_final)
+    if prompt is None:
+        return message
+    return invoke_conclusion(prompt, keys)
+
+
+def stream_contextual_conclusion(topic: str, records: List[Dict], sources: Set[str],
+                                 is_final: bool = False) -> Iterator[str]:
+    """
+    Versi streaming generate_contextual_conclusion: yield token begitu datang.
+    Kalau streaming gagal sebelum token pertama → jatuh ke jalur blocking.
+    Cache hit → kesimpulan tersimpan di-yield sekaligus.
+    """
+    if not records:
+        yield "Belum ada data untuk kesimpulan."
+        return
+
+    keys = _conclusion_keys(topic, records, sources, is_final)
+    cached = CONCLUSION_CACHE.get(keys)
+    if cached is not None:
+        yield cached
+        return
+
+    prompt, message = _build_conclusion_prompt(topic, records, sources, is_final=is_final)
+    if prompt is None:
+        yield message
+        return
+    yield from stream_conclusion_prompt(prompt, keys)
@@ -0,0 +1,163 @@
+# src/llm_clients.py
+from __future__ import annotations
+
+import os
+import threading
+import time
+from typing import Any, Dict, Optional, Tuple
+
+import httpx
+from dotenv import load_dotenv
+from openai import OpenAI
+from langchain_openai import ChatOpenAI
+
+load_dotenv()
+
+# =========================
+# Konfigurasi pool & batas
+# =========================
+LLM_MAX_CONNECTIONS = int(os.getenv("LLM_MAX_CONNECTIONS", "20"))
+LLM_MAX_KEEPALIVE = int(os.getenv("LLM_MAX_KEEPALIVE", "10"))
+LLM_KEEPALIVE_EXPIRY = float(os.getenv("LLM_KEEPALIVE_EXPIRY", "30"))
+LLM_CONNECT_TIMEOUT = float(os.getenv("LLM_CONNECT_TIMEOUT", "10"))
+LLM_TIMEOUT = float(os.getenv("LLM_TIMEOUT", "60"))
+LLM_MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", "2"))
+# batas request keluar yang berjalan bersamaan (chat + embedding), di level transport
+LLM_MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", "8"))
+LLM_QUEUE_TIMEOUT = float(os.getenv("LLM_QUEUE_TIMEOUT", "120"))
+
+_LOCK = threading.Lock()
+_HTTP_CLIENT: Optional[httpx.Client] = None
+_OPENAI_CLIENT: Optional[OpenAI] = None
+_CHAT_MODELS: Dict[Tuple[str, float], ChatOpenAI] = {}
+
+_SLOTS = threading.BoundedSemaphore(max(1, LLM_MAX_CONCURRENCY))
+_METRICS_LOCK = threading.Lock()
+_METRICS = {
+    "requests": 0,
+    "in_flight": 0,
+    "max_in_flight": 0,
+    "queue_timeouts": 0,
+    "wait_ms_total": 0.0,
+    "max_wait_ms": 0.0,
+}
+
+
+def _release_slot() -> None:
+    with _METRICS_LOCK:
+        _METRICS["in_flight"] -= 1
+    _SLOTS.release()
+
+
+class _ReleasingStream(httpx.SyncByteStream):
+    """Lepas slot konkurensi saat body response selesai dibaca / ditutup (penting untuk streaming)."""
+
+    def __init__(self, stream: httpx.SyncByteStream):
+        self._stream = stream
+        self._released = False
+
+    def __iter__(self):
+        yield from self._stream
+
+    def close(self) -> None:
+        try:
+            self._stream.close()
+        finally:
+            if not self._released:
+                self._released = True
+                _release_slot()
+
+
+class _LimitedTransport(httpx.HTTPTransport):
+    """HTTPTransport yang membatasi jumlah request aktif dengan semaphore bersama."""
+
+    def handle_request(self, request: httpx.Request) -> httpx.Response:
+        t0 = time.perf_counter()
+        if not _SLOTS.acquire(timeout=LLM_QUEUE_TIMEOUT):
+            with _METRICS_LOCK:
+                _METRICS["queue_timeouts"] += 1
+            raise httpx.PoolTimeout(f"Antrian LLM penuh > {LLM_QUEUE_TIMEOUT}s", request=request)
+
+        wait_ms = (time.perf_counter() - t0) * 1000
+        with _METRICS_LOCK:
+            _METRICS["requests"] += 1
+            _METRICS["in_flight"] += 1
+            _METRICS["max_in_flight"] = max(_METRICS["max_in_flight"], _METRICS["in_flight"])
+            _METRICS["wait_ms_total"] += wait_ms
+            _METRICS["max_wait_ms"] = max(_METRICS["max_wait_ms"], wait_ms)
+
+        try:
+            response = super().handle_request(request)
+        except BaseException:
+            _release_slot()
+            raise
+
+        return httpx.Response(
+            status_code=response.status_code,
+            headers=response.headers,
+            stream=_ReleasingStream(response.stream),
+            extensions=response.extensions,
+        )
+
+
+def get_http_client() -> httpx.Client:
+    """httpx.Client tunggal (keep-alive pool) untuk semua panggilan OpenAI."""
+    global _HTTP_CLIENT
+    with _LOCK:
+        if _HTTP_CLIENT is None:
+            limits = httpx.Limits(
+                max_connections=LLM_MAX_CONNECTIONS,
+                max_keepalive_connections=LLM_MAX_KEEPALIVE,
+                keepalive_expiry=LLM_KEEPALIVE_EXPIRY,
+            )
+            _HTTP_CLIENT = httpx.Client(
+                transport=_LimitedTransport(limits=limits),
+                timeout=httpx.Timeout(LLM_TIMEOUT, connect=LLM_CONNECT_TIMEOUT),
+            )
+        return _HTTP_CLIENT
+
+
+def get_openai_client() -> OpenAI:
+    """Client OpenAI SDK tunggal (dipakai embeddings)."""
+    global _OPENAI_CLIENT
+    http_client = get_http_client()
+    with _LOCK:
+        if _OPENAI_CLIENT is None:
+            _OPENAI_CLIENT = OpenAI(
+                http_client=http_client,
+                max_retries=LLM_MAX_RETRIES,
+                timeout=LLM_TIMEOUT,
+            )
+        return _OPENAI_CLIENT
+
+
+def get_chat_llm(model: str = "gpt-4o", temperature: float = 0) -> ChatOpenAI:
+    """ChatOpenAI tunggal per (model, temperature), berbagi pool HTTP yang sama."""
+    api_key = os.getenv("OPENAI_API_KEY")
+    if not api_key:
+        raise RuntimeError("OPENAI_API_KEY belum diset. Cek file .env")
+
+    key = (model, float(temperature))
+    http_client = get_http_client()
+    with _LOCK:
+        llm = _CHAT_MODELS.get(key)
+        if llm is None:
+            llm = ChatOpenAI(
+                model=model,
+                temperature=temperature,
+                api_key=api_key,
+                timeout=LLM_TIMEOUT,
+                max_retries=LLM_MAX_RETRIES,
+                http_client=http_client,
+            )
+            _CHAT_MODELS[key] = llm
+        return llm
+
+
+def get_llm_client_metrics() -> Dict[str, Any]:
+    with _METRICS_LOCK:
+        m = dict(_METRICS)
+    m["max_concurrency"] = LLM_MAX_CONCURRENCY
+    m["avg_wait_ms"] = round(m["wait_ms_total"] / m["requests"], 1) if m["requests"] else 0.0
+    m["chat_models"] = len(_CHAT_MODELS)
+    return m
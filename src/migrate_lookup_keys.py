@@ -0,0 +1,67 @@
+# src/migrate_lookup_keys.py
+# Jalankan sekali (dan setiap kali data di-reload): python src/migrate_lookup_keys.py
+from typing import Dict, List
+
+from neo4j_client import run_cypher
+from query_utils import resolve_surat_key
+
+
+INDEX_QUERIES = [
+    "CREATE INDEX surat_key_idx IF NOT EXISTS FOR (s:Surat) ON (s.SuratKey)",
+    "CREATE INDEX ayat_key_idx IF NOT EXISTS FOR (a:Ayat) ON (a.AyatKey)",
+]
+
+
+def backfill_surat_keys() -> int:
+    """Isi Surat.SuratKey dari nama surat (pakai kamus alias yang sama dengan lookup)."""
+    names = run_cypher("MATCH (s:Surat) WHERE s.Surat IS NOT NULL RETURN DISTINCT s.Surat AS surat")
+    rows: List[Dict[str, str]] = [
+        {"surat": r["surat"], "key": resolve_surat_key(r["surat"])} for r in names
+    ]
+    if not rows:
+        return 0
+
+    res = run_cypher(
+        """
+        UNWIND $rows AS row
+        MATCH (s:Surat {Surat: row.surat})
+        SET s.SuratKey = row.key
+        RETURN count(s) AS n
+        """,
+        rows=rows,
+    )
+    return int(res[0]["n"]) if res else 0
+
+
+def backfill_ayat_keys() -> int:
+    """Isi Ayat.AyatKey = '<SuratKey>:<AyatKe>' dari relasi Surat-Ayat."""
+    res = run_cypher(
+        """
+        MATCH (s:Surat)-[:beradadi|terdapat]-(a:Ayat)
+        WHERE s.SuratKey IS NOT NULL AND a.AyatKe IS NOT NULL
+        WITH DISTINCT s, a
+        SET a.AyatKey = s.SuratKey + ":" + toString(toInteger(a.AyatKe))
+        RETURN count(a) AS n
+        """
+    )
+    return int(res[0]["n"]) if res else 0
+
+
+def create_indexes() -> None:
+    for q in INDEX_QUERIES:
+        run_cypher(q)
+
+
+def main():
+    n_surat = backfill_surat_keys()
+    print(f"[MIGRATE] SuratKey diisi untuk {n_surat} node Surat")
+
+    n_ayat = backfill_ayat_keys()
+    print(f"[MIGRATE] AyatKey diisi untuk {n_ayat} node Ayat")
+
+    create_indexes()
+    print("[MIGRATE] Index surat_key_idx & ayat_key_idx siap")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,88 +1,411 @@
 import os
-from typing import List, Dict, Any, Optional
+import threading
+import time
+from contextlib import contextmanager
+from typing import List, Dict, Any, Iterator, Optional, Tuple
 
 from dotenv import load_dotenv
-from neo4j import GraphDatabase
+from neo4j import GraphDatabase, Session
+
+from query_utils import ayat_lookup_key, resolve_surat_key
+from record_cache import AYAT_CACHE, AYAT_CACHE_ENABLED, cached_lookup
 
 load_dotenv()
 
 NEO4J_URI = os.getenv("NEO4J_URI")
 NEO4J_USER = os.getenv("NEO4J_USER")
 NEO4J_PASSWORD = os.getenv("NEO4J_PASSWORD")
+NEO4J_DATABASE = os.getenv("NEO4J_DATABASE") or None
+
+# =========================
+# Konfigurasi driver / pool
+# =========================
+# pool ≥ jumlah request paralel (WEBHOOK_WORKERS + CONCLUSION_MAP_WORKERS + Streamlit)
+NEO4J_MAX_POOL_SIZE = int(os.getenv("NEO4J_MAX_POOL_SIZE", "50"))
+NEO4J_ACQUISITION_TIMEOUT = float(os.getenv("NEO4J_ACQUISITION_TIMEOUT", "30"))
+# < idle timeout load balancer / Aura supaya koneksi tidak diputus diam-diam
+NEO4J_MAX_CONN_LIFETIME = float(os.getenv("NEO4J_MAX_CONN_LIFETIME", "1800"))
+NEO4J_CONNECTION_TIMEOUT = float(os.getenv("NEO4J_CONNECTION_TIMEOUT", "15"))
+NEO4J_MAX_RETRY_TIME = float(os.getenv("NEO4J_MAX_RETRY_TIME", "15"))
+NEO4J_FETCH_SIZE = int(os.getenv("NEO4J_FETCH_SIZE", "1000"))
+# status migrasi SuratKey dicek ulang tiap N detik (migrasi bisa dijalankan saat app hidup)
+LOOKUP_KEYS_RECHECK = float(os.getenv("LOOKUP_KEYS_RECHECK", "300"))
 
 driver = GraphDatabase.driver(
     NEO4J_URI,
-    auth=(NEO4J_USER, NEO4J_PASSWORD)
+    auth=(NEO4J_USER, NEO4J_PASSWORD),
+    max_connection_pool_size=NEO4J_MAX_POOL_SIZE,
+    connection_acquisition_timeout=NEO4J_ACQUISITION_TIMEOUT,
+    max_connection_lifetime=NEO4J_MAX_CONN_LIFETIME,
+    connection_timeout=NEO4J_CONNECTION_TIMEOUT,
+    max_transaction_retry_time=NEO4J_MAX_RETRY_TIME,
 )
 
+_METRICS_LOCK = threading.Lock()
+_METRICS = {
+    "sessions": 0,
+    "sessions_in_use": 0,
+    "max_sessions_in_use": 0,
+    "read_tx": 0,
+    "read_retries": 0,
+    "read_errors": 0,
+    "read_ms_total": 0.0,
+    "max_read_ms": 0.0,
+    "hydrate_missing": 0,
+    "lookup_name_fallback": 0,
+}
+
+
+def _bump(key: str, value: float = 1) -> None:
+    with _METRICS_LOCK:
+        _METRICS[key] += value
+
+
+@contextmanager
+def _session() -> Iterator[Session]:
+    """Session driver + hitung session aktif (semua jalur: read_session & run_cypher)."""
+    with _METRICS_LOCK:
+        _METRICS["sessions"] += 1
+        _METRICS["sessions_in_use"] += 1
+        _METRICS["max_sessions_in_use"] = max(_METRICS["max_sessions_in_use"], _METRICS["sessions_in_use"])
+    try:
+        with driver.session(database=NEO4J_DATABASE, fetch_size=NEO4J_FETCH_SIZE) as session:
+            yield session
+    finally:
+        _bump("sessions_in_use", -1)
+
+
+@contextmanager
+def read_session() -> Iterator[Session]:
+    """
+    Session baca dengan konfigurasi pool/fetch_size; pakai untuk beberapa query berurutan
+    supaya tidak buka-tutup session per query:
+
+        with read_session() as s:
+            ids = graphrag_search_ids(vec, session=s)
+            rows = hydrate_results(ids, session=s)
+    """
+    with _session() as session:
+        yield session
+
+
+def run_read(query: str, session: Optional[Session] = None, **params) -> List[Dict[str, Any]]:
+    """
+    Jalankan query read-only di managed read transaction (execute_read):
+    error transient (leader switch, koneksi putus) di-retry otomatis oleh driver
+    sampai NEO4J_MAX_RETRY_TIME. session=None → buka read_session sendiri.
+    """
+    if session is None:
+        with read_session() as s:
+            return run_read(query, session=s, **params)
+
+    attempts = 0
+
+    def _work(tx):
+        nonlocal attempts
+        attempts += 1
+        return [r.data() for r in tx.run(query, **params)]
+
+    t0 = time.perf_counter()
+    try:
+        return session.execute_read(_work)
+    except Exception:
+        _bump("read_errors")
+        raise
+    finally:
+        ms = (time.perf_counter() - t0) * 1000
+        with _METRICS_LOCK:
+            _METRICS["read_tx"] += 1
+            _METRICS["read_retries"] += max(0, attempts - 1)
+            _METRICS["read_ms_total"] += ms
+            _METRICS["max_read_ms"] = max(_METRICS["max_read_ms"], ms)
+
 
 def run_cypher(query: str, **params) -> List[Dict[str, Any]]:
-    """Helper umum untuk menjalankan cypher dan mengembalikan list of dict."""
-    with driver.session() as session:
+    """Helper umum (auto-commit, boleh untuk write) — query read-only sebaiknya pakai run_read."""
+    with _session() as session:
         rs = session.run(query, **params)
         return [r.data() for r in rs]
 
 
+def _pool_in_use() -> Optional[Dict[str, Any]]:
+    """
+    Koneksi pool per address (best effort: API internal driver._pool, bisa berubah antar versi).
+    Opsional: None kalau tidak tersedia; hanya untuk observasi, bukan dasar ukuran pool.
+    """
+    pool = getattr(driver, "_pool", None)
+    conns = getattr(pool, "connections", None)
+    if pool is None or conns is None:
+        return None
+    try:
+        out = {}
+        for address, items in dict(conns).items():
+            out[str(address)] = {
+                "total": len(items),
+                "in_use": int(pool.in_use_connection_count(address)),
+            }
+        return out
+    except Exception:
+        return None
+
+
+def get_neo4j_metrics() -> Dict[str, Any]:
+    """
+    pool_utilization = pemakaian SAAT INI / NEO4J_MAX_POOL_SIZE: koneksi in-use dari pool driver
+    kalau tersedia, kalau tidak jumlah session aktif. peak_session_utilization = puncak sejak start.
+    """
+    with _METRICS_LOCK:
+        m = dict(_METRICS)
+    m["avg_read_ms"] = round(m["read_ms_total"] / m["read_tx"], 1) if m["read_tx"] else 0.0
+    m["max_pool_size"] = NEO4J_MAX_POOL_SIZE
+
+    pool = _pool_in_use()
+    m["pool"] = pool
+    m["pool_in_use"] = sum(p["in_use"] for p in pool.values()) if pool else None
+    m["pool_open"] = sum(p["total"] for p in pool.values()) if pool else None
+    in_use = m["pool_in_use"] if m["pool_in_use"] is not None else m["sessions_in_use"]
+    size = NEO4J_MAX_POOL_SIZE
+    m["pool_utilization"] = round(in_use / size, 4) if size else 0.0
+    m["peak_session_utilization"] = round(m["max_sessions_in_use"] / size, 4) if size else 0.0
+    return m
+
+
+def get_ayat_many(keys: List[Tuple[str, int]], session: Optional[Session] = None) -> List[Optional[Dict[str, Any]]]:
+    """
+    Ambil banyak ayat lengkap sekaligus, urutan sama dengan input.
+    keys: [(nama_surat, ayat_ke), ...]
+    Return: list sepanjang keys, elemen None kalau ayat tidak ditemukan.
+    Keys tiap record sama dengan get_ayat.
+
+    Read-through ke AYAT_CACHE: hanya key yang belum ada di cache yang diambil
+    dari Neo4j (1 query UNWIND untuk semua yang miss).
+    """
+    if not keys:
+        return []
+
+    keys = [(str(s), int(a)) for s, a in keys]
+    out, missing = cached_lookup(keys)
+    if not missing:
+        return out
+
+    version = AYAT_CACHE.version
+    fetched = _fetch_ayat_many([keys[i] for i in missing], session=session)
+    AYAT_CACHE.record_fetch(len(missing))
+
+    for i, rec in zip(missing, fetched):
+        if rec is None:
+            continue
+        # SuratKey node = resolve_surat_key(nama di DB) = resolve_surat_key(nama dari caller),
+        # jadi record bisa disimpan dengan nama di DB dan tetap ketemu dari varian mana pun
+        if AYAT_CACHE_ENABLED:
+            AYAT_CACHE.put(rec, version=version)
+        out[i] = dict(rec)
+    return out
+
+
+# lookup key (SuratKey/AyatKey) sudah diisi migrate_lookup_keys.py? None = belum dicek
+_LOOKUP_KEYS_READY: Optional[bool] = None
+_LOOKUP_KEYS_CHECKED_AT = 0.0
+_LOOKUP_KEYS_LOCK = threading.Lock()
+
+
+def _lookup_keys_ready(session: Optional[Session] = None) -> bool:
+    """
+    Cek apakah node Surat sudah punya SuratKey (hasil di-cache LOOKUP_KEYS_RECHECK detik).
+    Belum (migrasi belum dijalankan) → lookup pakai pencocokan nama lama (CONTAINS, tanpa index).
+    """
+    global _LOOKUP_KEYS_READY, _LOOKUP_KEYS_CHECKED_AT
+    if _LOOKUP_KEYS_READY is not None and time.time() - _LOOKUP_KEYS_CHECKED_AT < LOOKUP_KEYS_RECHECK:
+        return _LOOKUP_KEYS_READY
+    with _LOOKUP_KEYS_LOCK:
+        if _LOOKUP_KEYS_READY is None or time.time() - _LOOKUP_KEYS_CHECKED_AT >= LOOKUP_KEYS_RECHECK:
+            rows = run_read(
+                "MATCH (s:Surat) WHERE s.SuratKey IS NOT NULL RETURN s.SuratKey AS k LIMIT 1",
+                session=session,
+            )
+            ready = bool(rows)
+            if not ready and _LOOKUP_KEYS_READY is not False:
+                print("[WARN] Surat.SuratKey belum ada (jalankan: python src/migrate_lookup_keys.py) "
+                      "→ lookup ayat pakai pencocokan nama (lambat)")
+            _LOOKUP_KEYS_READY = ready
+            _LOOKUP_KEYS_CHECKED_AT = time.time()
+        return _LOOKUP_KEYS_READY
+
+
+# exact match ber-index (setelah migrasi)
+_MATCH_BY_KEY = """
+      MATCH (a:Ayat {AyatKey: row.ayat_key})
+      MATCH (s:Surat {SuratKey: row.surat_key})-[:beradadi|terdapat]-(a)
+"""
+
+# fallback sebelum migrasi: pencocokan nama surat seperti versi lama
+_MATCH_BY_NAME = """
+      MATCH (s:Surat)-[:beradadi|terdapat]-(a:Ayat)
+      WHERE
+        (
+          toUpper(s.Surat) = toUpper(row.surat)
+          OR toUpper(replace(s.Surat, "'", "")) = toUpper(replace(row.surat, "'", ""))
+          OR toUpper(s.Surat) CONTAINS toUpper(row.surat)
+          OR toUpper(replace(s.Surat, "'", "")) CONTAINS toUpper(replace(row.surat, "'", ""))
+        )
+        AND toInteger(a.AyatKe) = toInteger(row.ayat_ke)
+"""
+
+
+def _fetch_ayat_many(keys: List[Tuple[str, int]], session: Optional[Session] = None) -> List[Optional[Dict[str, Any]]]:
+    """
+    Query Neo4j untuk banyak ayat sekaligus (UNWIND), tanpa cache.
+    Lookup memakai properti ber-index Surat.SuratKey & Ayat.AyatKey
+    (isi dulu dengan: python src/migrate_lookup_keys.py); sebelum migrasi → pencocokan nama.
+    Baris yang tidak ketemu lewat key (nama di luar kamus alias → key hanya hasil normalisasi)
+    dicoba ulang dengan pencocokan nama, supaya varian ejaan yang dulu ketemu tetap ketemu.
+    """
+    if not keys:
+        return []
+
+    # resolusi varian nama surat cukup sekali di Python (kamus alias), query pakai exact match ber-index
+    rows = [
+        {
+            "idx": i,
+            "surat": s,
+            "ayat_ke": int(a),
+            "surat_key": resolve_surat_key(s),
+            "ayat_key": ayat_lookup_key(s, a),
+        }
+        for i, (s, a) in enumerate(keys)
+    ]
+    by_key = _lookup_keys_ready(session)
+    out = _run_ayat_lookup(_MATCH_BY_KEY if by_key else _MATCH_BY_NAME, rows, session)
+    if by_key:
+        retry = [r for r in rows if out[r["idx"]] is None]
+        if retry:
+            _bump("lookup_name_fallback", len(retry))
+            fallback = _run_ayat_lookup(_MATCH_BY_NAME, retry, session)
+            for r in retry:
+                out[r["idx"]] = fallback[r["idx"]]
+    return [out[r["idx"]] for r in rows]
+
+
+def _run_ayat_lookup(match: str, rows: List[Dict[str, Any]],
+                     session: Optional[Session] = None) -> Dict[int, Optional[Dict[str, Any]]]:
+    """Jalankan satu query UNWIND dengan klausa MATCH tertentu; return {idx: record/None}."""
+    query = """
+    UNWIND $rows AS row
+    CALL {
+      WITH row""" + match + """      WITH s, a
+      LIMIT 1
+
+      OPTIONAL MATCH (a)-[:memiliki_arti|untuk]-(tr:Terjemahan)
+      OPTIONAL MATCH (a)-[:memiliki|terdapat]-(bh:TafsirBuyaHamka)
+      OPTIONAL MATCH (a)-[:memiliki|terdapat]-(th:TafsirKemenagTahlili)
+      OPTIONAL MATCH (a)-[:memiliki|terdapat]-(wz:TafsirKemenagWajiz)
+      OPTIONAL MATCH (a)-[:masuk_ke|pada]-(k:Kategori)
+
+      WITH
+        s, a,
+        head(collect(DISTINCT tr.Terjemahan)) AS terjemahan,
+        collect(DISTINCT k.Kategori) AS kategori,
+        collect(DISTINCT bh.TafsirBuyaHamka) AS hamka_parts,
+        collect(DISTINCT th.TafsirKemenagTahlili) AS tahlili_parts,
+        collect(DISTINCT wz.TafsirKemenagWajiz) AS wajiz_parts
+
+      RETURN
+        s.Surat AS nama_surat,
+        toInteger(a.AyatKe) AS ayat_ke,
+        a.Ayat AS arab_ayat,
+        terjemahan AS terjemahan,
+
+        reduce(out = "", x IN [p IN hamka_parts   WHERE p IS NOT NULL AND trim(p) <> "" | p]
+               | out + CASE WHEN out = "" THEN "" ELSE "\\n\\n" END + x) AS tafsir_hamka,
+
+        reduce(out = "", x IN [p IN tahlili_parts WHERE p IS NOT NULL AND trim(p) <> "" | p]
+               | out + CASE WHEN out = "" THEN "" ELSE "\\n\\n" END + x) AS tafsir_tahlili,
+
+        reduce(out = "", x IN [p IN wajiz_parts   WHERE p IS NOT NULL AND trim(p) <> "" | p]
+               | out + CASE WHEN out = "" THEN "" ELSE "\\n\\n" END + x) AS tafsir_wajiz,
+
+        [x IN kategori WHERE x IS NOT NULL AND trim(x) <> ""] AS kategori
+    }
+    RETURN row.idx AS idx, nama_surat, ayat_ke, arab_ayat, terjemahan,
+           tafsir_hamka, tafsir_tahlili, tafsir_wajiz, kategori
+    """
+
+    out: Dict[int, Optional[Dict[str, Any]]] = {r["idx"]: None for r in rows}
+    for rec in run_read(query, session=session, rows=rows):
+        idx = rec.pop("idx")
+        out[idx] = rec
+    return out
+
+
 def get_ayat(nama_surat: str, ayat_ke: int) -> Optional[Dict[str, Any]]:
     """
     Ambil 1 ayat lengkap (arab + terjemahan + kategori + tafsir).
     Return keys KONSISTEN:
       nama_surat, ayat_ke, arab_ayat, terjemahan, kategori, tafsir_tahlili, tafsir_wajiz, tafsir_hamka
     """
-    query = """
-    MATCH (s:Surat)-[:beradadi|terdapat]-(a:Ayat)
-    WHERE
-      (
-        toUpper(s.Surat) = toUpper($surat)
-        OR toUpper(replace(s.Surat, "'", "")) = toUpper(replace($surat, "'", ""))
-        OR toUpper(s.Surat) CONTAINS toUpper($surat)
-        OR toUpper(replace(s.Surat, "'", "")) CONTAINS toUpper(replace($surat, "'", ""))
-      )
-      AND toInteger(a.AyatKe) = toInteger($ayat_ke)
-
-    OPTIONAL MATCH (a)-[:memiliki_arti|untuk]-(tr:Terjemahan)
-    OPTIONAL MATCH (a)-[:memiliki|terdapat]-(bh:TafsirBuyaHamka)
-    OPTIONAL MATCH (a)-[:memiliki|terdapat]-(th:TafsirKemenagTahlili)
-    OPTIONAL MATCH (a)-[:memiliki|terdapat]-(wz:TafsirKemenagWajiz)
-    OPTIONAL MATCH (a)-[:masuk_ke|pada]-(k:Kategori)
-
-    WITH
-      s, a,
-      head(collect(DISTINCT tr.Terjemahan)) AS terjemahan,
-      collect(DISTINCT k.Kategori) AS kategori,
-      collect(DISTINCT bh.TafsirBuyaHamka) AS hamka_parts,
-      collect(DISTINCT th.TafsirKemenagTahlili) AS tahlili_parts,
-      collect(DISTINCT wz.TafsirKemenagWajiz) AS wajiz_parts
-
-    RETURN
-      s.Surat AS nama_surat,
-      toInteger(a.AyatKe) AS ayat_ke,
-      a.Ayat AS arab_ayat,
-      terjemahan AS terjemahan,
-
-      reduce(out = "", x IN [p IN hamka_parts   WHERE p IS NOT NULL AND trim(p) <> "" | p]
-             | out + CASE WHEN out = "" THEN "" ELSE "\\n\\n" END + x) AS tafsir_hamka,
-
-      reduce(out = "", x IN [p IN tahlili_parts WHERE p IS NOT NULL AND trim(p) <> "" | p]
-             | out + CASE WHEN out = "" THEN "" ELSE "\\n\\n" END + x) AS tafsir_tahlili,
-
-      reduce(out = "", x IN [p IN wajiz_parts   WHERE p IS NOT NULL AND trim(p) <> "" | p]
-             | out + CASE WHEN out = "" THEN "" ELSE "\\n\\n" END + x) AS tafsir_wajiz,
-
-      [x IN kategori WHERE x IS NOT NULL AND trim(x) <> ""] AS kategori
-    LIMIT 1
-    """
-
-    with driver.session() as session:
-        rec = session.run(query, surat=nama_surat, ayat_ke=ayat_ke).single()
-        return rec.data() if rec else None
+    return get_ayat_many([(nama_surat, ayat_ke)])[0]
 
 
-def graphrag_search(query_embedding, limit: int = 10, score_threshold: float = 0.7) -> List[Dict[str, Any]]:
+def warm_ayat_cache() -> int:
     """
-    Vector search (GraphRAG).
-    Return keys KONSISTEN:
-      nama_surat, ayat_ke, arab_ayat, terjemahan, kategori, tafsir_tahlili, tafsir_wajiz, tafsir_hamka, score
+    Isi AYAT_CACHE dengan record lengkap semua ayat (dataset Juz 30 kecil & tetap).
+    Return jumlah record yang masuk cache.
+    """
+    with read_session() as session:
+        rows = run_read(
+            """
+            MATCH (s:Surat)-[:beradadi|terdapat]-(a:Ayat)
+            WHERE s.Surat IS NOT NULL AND a.AyatKe IS NOT NULL
+            RETURN DISTINCT s.Surat AS nama_surat, toInteger(a.AyatKe) AS ayat_ke
+            ORDER BY nama_surat, ayat_ke
+            """,
+            session=session,
+        )
+        keys = [(r["nama_surat"], r["ayat_ke"]) for r in rows if r.get("nama_surat") and r.get("ayat_ke") is not None]
+        records = get_ayat_many(keys, session=session)
+    AYAT_CACHE.mark_warmed()
+    n = sum(1 for r in records if r)
+    print(f"[CACHE] Ayat cache warm: {n} record (versi {AYAT_CACHE.version})")
+    return n
+
+
+def hydrate_results(rows: List[Dict[str, Any]], session: Optional[Session] = None) -> List[Dict[str, Any]]:
+    """
+    Lengkapi hasil ringan (nama_surat, ayat_ke, score) jadi record penuh lewat get_ayat_many.
+    Dipanggil hanya untuk potongan yang benar-benar ditampilkan / dikirim ke LLM.
+    Urutan dipertahankan; ayat yang tidak ditemukan dibuang (dicatat di log + metrik
+    hydrate_missing) — pemanggil yang menyimpan posisi (cursor/range) harus menghitung
+    dari baris input, bukan dari panjang hasil.
+    """
+    keys = []
+    valid = []
+    for r in rows or []:
+        if not r.get("nama_surat") or r.get("ayat_ke") is None:
+            continue
+        keys.append((r["nama_surat"], r["ayat_ke"]))
+        valid.append(r)
+
+    out: List[Dict[str, Any]] = []
+    missing = []
+    for r, rec in zip(valid, get_ayat_many(keys, session=session)):
+        if not rec:
+            missing.append(f"{r['nama_surat']}:{r['ayat_ke']}")
+            continue
+        if "score" in r:
+            rec["score"] = r["score"]
+        out.append(rec)
+    if missing:
+        _bump("hydrate_missing", len(missing))
+        print(f"[WARN] hydrate: {len(missing)} ayat tidak ditemukan → dilewati ({', '.join(missing[:5])})")
+    return out
+
+
+def graphrag_search_ids(query_embedding, limit: int = 10, score_threshold: float = 0.7,
+                        session: Optional[Session] = None) -> List[Dict[str, Any]]:
+    """
+    Vector search (GraphRAG) tahap 1: hanya id + skor, tanpa payload tafsir.
+    Return keys: nama_surat, ayat_ke, score (urut skor tertinggi).
+    Pakai hydrate_results untuk mengambil isi record halaman yang ditampilkan.
     """
     query = """
     CALL db.index.vector.queryNodes(
@@ -94,42 +417,29 @@ def graphrag_search(query_embedding, limit: int = 10, score_threshold: float = 0
     WHERE score >= $threshold
 
     MATCH (t)-[:untuk|memiliki_arti]-(a:Ayat)-[:beradadi|terdapat]-(s:Surat)
-    OPTIONAL MATCH (a)-[:memiliki_arti|untuk]-(tr:Terjemahan)
-    OPTIONAL MATCH (a)-[:pada|masuk_ke]-(k:Kategori)
-    OPTIONAL MATCH (a)-[:terdapat|memiliki]-(th:TafsirKemenagTahlili)
-    OPTIONAL MATCH (a)-[:terdapat|memiliki]-(wz:TafsirKemenagWajiz)
-    OPTIONAL MATCH (a)-[:terdapat|memiliki]-(bh:TafsirBuyaHamka)
-
-    WITH
-      s.Surat AS nama_surat,
-      toInteger(a.AyatKe) AS ayat_ke,
-      a.Ayat AS arab_ayat,
-      coalesce(t.Terjemahan, tr.Terjemahan) AS terjemahan,
-      collect(DISTINCT k.Kategori) AS kategori,
-      head(collect(DISTINCT th.TafsirKemenagTahlili)) AS tafsir_tahlili,
-      head(collect(DISTINCT wz.TafsirKemenagWajiz)) AS tafsir_wajiz,
-      head(collect(DISTINCT bh.TafsirBuyaHamka)) AS tafsir_hamka,
-      score AS score
-
-    RETURN
-      nama_surat,
-      ayat_ke,
-      arab_ayat,
-      terjemahan,
-      [x IN kategori WHERE x IS NOT NULL AND trim(x) <> ""] AS kategori,
-      tafsir_tahlili,
-      tafsir_wajiz,
-      tafsir_hamka,
-      score
+
+    WITH s.Surat AS nama_surat, toInteger(a.AyatKe) AS ayat_ke, max(score) AS score
+
+    RETURN nama_surat, ayat_ke, score
     ORDER BY score DESC
     LIMIT $limit
     """
 
-    with driver.session() as session:
-        rs = session.run(
-            query,
-            vector=query_embedding,
-            limit=limit,
-            threshold=score_threshold
-        )
-        return [r.data() for r in rs]
+    return run_read(
+        query,
+        session=session,
+        vector=query_embedding,
+        limit=limit,
+        threshold=score_threshold
+    )
+
+
+def graphrag_search(query_embedding, limit: int = 10, score_threshold: float = 0.7) -> List[Dict[str, Any]]:
+    """
+    Vector search (GraphRAG) lengkap = graphrag_search_ids + hydrate_results.
+    Return keys KONSISTEN:
+      nama_surat, ayat_ke, arab_ayat, terjemahan, kategori, tafsir_tahlili, tafsir_wajiz, tafsir_hamka, score
+    """
+    with read_session() as session:
+        ids = graphrag_search_ids(query_embedding, limit=limit, score_threshold=score_threshold, session=session)
+        return hydrate_results(ids, session=session)
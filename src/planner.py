@@ -0,0 +1,177 @@
+# src/planner.py
+from __future__ import annotations
+
+import os
+import re
+import json
+import threading
+import time
+from typing import Any, Dict, Optional
+
+from cache_utils import LRUCache, normalize_cache_text
+from router import fallback_extract_more_n
+
+# =========================
+# Planner bertingkat: aturan → cache → LLM
+# =========================
+PLANNER_RULES_ENABLED = os.getenv("PLANNER_RULES_ENABLED", "1") != "0"
+# tier LLM hanya dipanggil untuk input yang benar-benar ambigu (lihat is_ambiguous)
+PLANNER_LLM_ENABLED = os.getenv("PLANNER_LLM_ENABLED", "1") != "0"
+PLAN_CACHE_ITEMS = int(os.getenv("PLAN_CACHE_ITEMS", "2048"))
+PLAN_CACHE_TTL = float(os.getenv("PLAN_CACHE_TTL", str(24 * 3600)))
+
+_MORE_RE = re.compile(
+    r"^(?:(?:berikan|kasih|tampilkan)\s+)?(?:lanjut(?:kan)?|next|tambah(?:kan)?|lagi)"
+    r"(?:\s+(?:\d+|lagi|dong|ya|aja|ayat))*$"
+    r"|^(?:(?:berikan|kasih|tampilkan)\s+)?\d+\s+(?:ayat\s+)?lagi$"
+)
+_DETAIL_RE = re.compile(r"\b(?:jelaskan|jelasin|tafsir(?:kan)?|detail)\s+ayat\s+(?:ke\s*-?\s*)?(\d{1,3})\b")
+_TOPIC_RE = re.compile(r"\b(?:tentang|mengenai|soal|terkait)\s+(.+)$")
+_COUNT_RE = re.compile(r"\b(\d{1,2})\s+ayat\b")
+# kosakata lanjutan: tanpa salah satu kata ini, input pasti query baru (bukan "more")
+_FOLLOWUP_RE = re.compile(
+    r"\b(?:lanjut\w*|next|tambah\w*|lagi|lebih|berikut\w*|selanjutnya|sisa\w*|terus\w*|more)\b"
+)
+
+
+def _detect_source(text: str) -> str:
+    if "hamka" in text:
+        return "hamka"
+    if "wajiz" in text:
+        return "kemenag_wajiz"
+    if "tahlili" in text:
+        return "kemenag_tahlili"
+    return "all"
+
+
+def _plan(intent: str, query: str, k: int = 5, source: str = "all",
+          ayat_number: Optional[int] = None, clarify_message: Optional[str] = None) -> Dict[str, Any]:
+    return {
+        "intent": intent,
+        "query": query,
+        "k": k,
+        "source": source,
+        "ayat_number": ayat_number,
+        "clarify_message": clarify_message,
+    }
+
+
+def rule_plan(user_text: str) -> Optional[Dict[str, Any]]:
+    """
+    Jalur cepat deterministik untuk kasus yang jelas. Return None kalau ragu → tier berikutnya.
+    - "lanjut", "lanjut 5", "5 lagi", "tambah 3"        → more
+    - "jelaskan ayat 15", "tafsir ayat 20"              → detail
+    - "tafsir hamka tentang tamak", "5 ayat tentang X"  → search (topik setelah "tentang")
+    """
+    text = re.sub(r"\s+", " ", (user_text or "").strip().lower()).rstrip("?.!")
+    if not text:
+        return None
+
+    if _MORE_RE.match(text):
+        return _plan("more", "", k=fallback_extract_more_n(text))
+
+    m = _DETAIL_RE.search(text)
+    if m:
+        return _plan("detail", text, source=_detect_source(text), ayat_number=int(m.group(1)))
+
+    m = _TOPIC_RE.search(text)
+    if m:
+        topic = m.group(1).strip()
+        if len(topic) >= 3 and not re.search(r"\bsurat\b", topic):
+            c = _COUNT_RE.search(text)
+            k = int(c.group(1)) if c else 5
+            return _plan("search", topic, k=k, source=_detect_source(text))
+
+    return None
+
+
+def is_ambiguous(user_text: str) -> bool:
+    """True kalau input mungkin perintah lanjutan yang tidak tertangkap aturan → layak ke LLM."""
+    text = re.sub(r"\s+", " ", (user_text or "").strip().lower())
+    return bool(text) and bool(_FOLLOWUP_RE.search(text))
+
+
+class TieredPlanner:
+    """
+    Pengganti planner_prompt | llm | StrOutputParser() dengan API yang sama:
+    invoke({"user_text": ...}) → string JSON plan.
+    Tier: 1) aturan, 2) cache plan (key = teks ternormalisasi), 3) LLM planner.
+    Tier 3 hanya untuk input ambigu (is_ambiguous); input lain dianggap query baru tanpa panggilan LLM.
+    llm=False (atau llm_chain None) / input tidak ambigu → invoke return "" (caller pakai fallback sendiri).
+    """
+
+    def __init__(self, llm_chain, parse=None, rules: bool = PLANNER_RULES_ENABLED,
+                 llm: bool = PLANNER_LLM_ENABLED,
+                 cache_items: int = PLAN_CACHE_ITEMS, cache_ttl: float = PLAN_CACHE_TTL):
+        self.llm_chain = llm_chain
+        self.parse = parse or (lambda s: json.loads(s))
+        self.rules = rules
+        self.llm = llm and llm_chain is not None
+        self.cache = LRUCache(max_items=cache_items, ttl=cache_ttl)
+        self._lock = threading.Lock()
+        self.metrics = {
+            "requests": 0,
+            "rule_hits": 0,
+            "cache_hits": 0,
+            "misses": 0,
+            "llm_skipped": 0,
+            "llm_calls": 0,
+            "llm_errors": 0,
+            "llm_ms_total": 0.0,
+        }
+
+    def _bump(self, key: str, value: float = 1) -> None:
+        with self._lock:
+            self.metrics[key] += value
+
+    def invoke(self, inputs: Any, config: Optional[Dict[str, Any]] = None) -> str:
+        user_text = inputs.get("user_text", "") if isinstance(inputs, dict) else str(inputs or "")
+        self._bump("requests")
+
+        if self.rules:
+            plan = rule_plan(user_text)
+            if plan is not None:
+                self._bump("rule_hits")
+                return json.dumps(plan, ensure_ascii=False)
+
+        key = normalize_cache_text(user_text)
+        cached = self.cache.get(key)
+        if cached is not None:
+            self._bump("cache_hits")
+            return cached
+
+        if not self.llm:
+            self._bump("misses")
+            return ""
+        if not is_ambiguous(user_text):
+            self._bump("llm_skipped")
+            return ""
+
+        self._bump("llm_calls")
+        t0 = time.perf_counter()
+        try:
+            text = self.llm_chain.invoke({"user_text": user_text}, config=config)
+        except Exception:
+            self._bump("llm_errors")
+            raise
+        finally:
+            self._bump("llm_ms_total", (time.perf_counter() - t0) * 1000)
+
+        # hanya plan yang valid yang di-cache (output rusak dicoba ulang lain kali)
+        try:
+            plan = self.parse(text)
+        except Exception:
+            plan = None
+        if plan:
+            self.cache.set(key, text)
+        return text
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            m = dict(self.metrics)
+        avoided = m["rule_hits"] + m["cache_hits"] + m["llm_skipped"]
+        m["llm_avoided"] = avoided
+        m["avoided_rate"] = round(avoided / m["requests"], 4) if m["requests"] else 0.0
+        m["avg_llm_ms"] = round(m["llm_ms_total"] / m["llm_calls"], 1) if m["llm_calls"] else 0.0
+        m["cache"] = self.cache.stats()
+        return m
@@ -2,7 +2,9 @@
 from __future__ import annotations
 
 import re
-from typing import Optional, Set
+from typing import Dict, Optional, Set
+
+from constants import SURAT_DB_MAP, SURAT_NAME_VARIANTS
 
 
 # =========================
@@ -27,6 +29,102 @@ def normalize_surat_name(name: str) -> str:
     )
 
 
+_ARTICLE_RE = re.compile(r"^A[LNTZSDR]-")
+
+
+def _strip_article(norm: str) -> str:
+    """'AL-INFITAR' → 'INFITAR', 'AN-NABA' → 'NABA' (input sudah ter-normalisasi)."""
+    return _ARTICLE_RE.sub("", norm).strip("-")
+
+
+def _fold_surat_name(norm: str) -> str:
+    """
+    Bentuk lipat untuk ejaan latin yang beragam: tanpa awalan & tanda baca,
+    TH/SY/SH → T/S, huruf ganda dirapatkan. 'AL-MUTHAFFIFIN' → 'MUTAFIFIN'.
+    """
+    s = re.sub(r"[^A-Z]", "", _strip_article(norm))
+    s = s.replace("TH", "T").replace("SY", "S").replace("SH", "S")
+    return re.sub(r"(.)\1+", r"\1", s)
+
+
+def _build_surat_alias_map() -> Dict[str, str]:
+    """
+    Bangun kamus alias: nama surat ter-normalisasi -> key kanonik.
+    Varian dari SURAT_NAME_VARIANTS & SURAT_DB_MAP yang saling terkait digabung jadi 1 grup.
+    Key kanonik = nama di database (SURAT_DB_MAP) kalau ada, kalau tidak nama kanonik varian.
+    Ditambah bentuk tanpa awalan & bentuk lipat ejaan, selama tidak ambigu antar surat.
+    """
+    parent: Dict[str, str] = {}
+
+    def find(x: str) -> str:
+        parent.setdefault(x, x)
+        while parent[x] != x:
+            parent[x] = parent[parent[x]]
+            x = parent[x]
+        return x
+
+    def union(a: str, b: str) -> None:
+        parent[find(a)] = find(b)
+
+    preferred: Dict[str, str] = {}
+    for canonical, variants in SURAT_NAME_VARIANTS.items():
+        c = normalize_surat_name(canonical)
+        preferred.setdefault(c, c)
+        for v in variants:
+            union(normalize_surat_name(v), c)
+
+    db_names = set()
+    for name, db_name in SURAT_DB_MAP.items():
+        d = normalize_surat_name(db_name)
+        db_names.add(d)
+        union(normalize_surat_name(name), d)
+
+    groups: Dict[str, Set[str]] = {}
+    for name in list(parent):
+        groups.setdefault(find(name), set()).add(name)
+
+    aliases: Dict[str, str] = {}
+    folded: Dict[str, Set[str]] = {}
+    for members in groups.values():
+        in_db = sorted(m for m in members if m in db_names)
+        in_variants = sorted(m for m in members if m in preferred)
+        key = (in_db or in_variants or sorted(members))[0]
+        for m in members:
+            aliases[m] = key
+            # bentuk tanpa awalan ("INFITAR", "NABA") & bentuk lipat ejaan ("INFITHAR" → "INFITAR")
+            for extra in (_strip_article(m), _fold_surat_name(m)):
+                if extra:
+                    folded.setdefault(extra, set()).add(key)
+
+    for extra, keys in folded.items():
+        # bentuk yang bisa berarti >1 surat tidak dipakai
+        if len(keys) == 1 and extra not in aliases:
+            aliases[extra] = next(iter(keys))
+    return aliases
+
+
+SURAT_ALIASES: Dict[str, str] = _build_surat_alias_map()
+
+
+def resolve_surat_key(name: str) -> str:
+    """
+    Nama surat (varian apa pun) -> lookup key kanonik yang disimpan di node Surat (SuratKey).
+    Urutan: bentuk ter-normalisasi → tanpa awalan al-/an-/at-/... → bentuk lipat ejaan.
+    Nama yang tidak dikenal dikembalikan dalam bentuk ter-normalisasi.
+    """
+    norm = normalize_surat_name(name)
+    for candidate in (norm, _strip_article(norm), _fold_surat_name(norm)):
+        key = SURAT_ALIASES.get(candidate)
+        if key:
+            return key
+    return norm
+
+
+def ayat_lookup_key(nama_surat: str, ayat_ke: int) -> str:
+    """Lookup key node Ayat (AyatKey), contoh: 'AL-INFITAR:13'."""
+    return f"{resolve_surat_key(nama_surat)}:{int(ayat_ke)}"
+
+
 def detect_sources(text: str) -> Set[str]:
     """
     Deteksi filter tafsir dari input user.
@@ -0,0 +1,100 @@
+# src/ranked_results.py
+from __future__ import annotations
+
+import sys
+from array import array
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Union
+
+
+class RankedResults:
+    """
+    Hasil pencarian ter-ranking yang disimpan di session dalam bentuk ringkas:
+    hanya (nama_surat, ayat_ke, score) per baris, di array biner
+    (index surat uint16, ayat uint16, score float32) + tabel nama surat.
+
+    Berperilaku seperti list baris ringan: len(), iterasi, [i], [a:b], append/extend.
+    Setiap item dikembalikan sebagai dict {"nama_surat", "ayat_ke", "score"}; isi ayat
+    diambil lagi lewat cache record (hydrate_results / get_ayat_many) saat paging.
+    """
+
+    __slots__ = ("_names", "_name_idx", "_surat", "_ayat", "_score")
+
+    def __init__(self, rows: Optional[Iterable[Dict[str, Any]]] = None):
+        self._names: List[str] = []
+        self._name_idx: Dict[str, int] = {}
+        self._surat = array("H")
+        self._ayat = array("H")
+        self._score = array("f")
+        if rows is not None:
+            self.extend(rows)
+
+    # ---------- tulis ----------
+    def append(self, row: Dict[str, Any]) -> None:
+        name = str(row.get("nama_surat", ""))
+        idx = self._name_idx.get(name)
+        if idx is None:
+            idx = len(self._names)
+            self._names.append(name)
+            self._name_idx[name] = idx
+        self._surat.append(idx)
+        self._ayat.append(int(row.get("ayat_ke", row.get("ayat")) or 0))
+        self._score.append(float(row.get("score") or 0.0))
+
+    def extend(self, rows: Iterable[Dict[str, Any]]) -> None:
+        for row in rows:
+            self.append(row)
+
+    # ---------- baca ----------
+    def _row(self, i: int) -> Dict[str, Any]:
+        return {
+            "nama_surat": self._names[self._surat[i]],
+            "ayat_ke": int(self._ayat[i]),
+            "score": round(float(self._score[i]), 6),
+        }
+
+    def __len__(self) -> int:
+        return len(self._ayat)
+
+    def __iter__(self) -> Iterator[Dict[str, Any]]:
+        for i in range(len(self._ayat)):
+            yield self._row(i)
+
+    def __getitem__(self, key: Union[int, slice]):
+        if isinstance(key, slice):
+            return [self._row(i) for i in range(*key.indices(len(self._ayat)))]
+        n = len(self._ayat)
+        if key < 0:
+            key += n
+        if not 0 <= key < n:
+            raise IndexError("RankedResults index out of range")
+        return self._row(key)
+
+    def __sizeof__(self) -> int:
+        return (
+            object.__sizeof__(self)
+            + sys.getsizeof(self._names) + sum(sys.getsizeof(x) for x in self._names)
+            + sys.getsizeof(self._name_idx)
+            + sys.getsizeof(self._surat) + sys.getsizeof(self._ayat) + sys.getsizeof(self._score)
+        )
+
+    def __repr__(self) -> str:
+        return f"RankedResults(n={len(self)})"
+
+    # ---------- serialisasi (session store) ----------
+    def to_dict(self) -> Dict[str, Any]:
+        return {"names": list(self._names), "surat": self._surat, "ayat": self._ayat, "score": self._score}
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "RankedResults":
+        out = cls()
+        out._names = list(data.get("names") or [])
+        out._name_idx = {name: i for i, name in enumerate(out._names)}
+        out._surat = array("H", data.get("surat") or [])
+        out._ayat = array("H", data.get("ayat") or [])
+        out._score = array("f", data.get("score") or [])
+        return out
+
+
+def as_ranked(rows: Optional[Iterable[Dict[str, Any]]]) -> RankedResults:
+    """Bungkus list baris jadi RankedResults (tanpa salinan kalau sudah RankedResults)."""
+    return rows if isinstance(rows, RankedResults) else RankedResults(rows or [])
@@ -0,0 +1,124 @@
+# src/record_cache.py
+from __future__ import annotations
+
+import os
+import sys
+import threading
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+from cache_utils import LRUCache
+from query_utils import resolve_surat_key
+
+# Dataset hanya subset Juz 30 → seluruh record muat di memori dengan budget default.
+AYAT_CACHE_ENABLED = os.getenv("AYAT_CACHE_ENABLED", "1") != "0"
+AYAT_CACHE_MAX_BYTES = int(os.getenv("AYAT_CACHE_MAX_BYTES", str(64 * 1024 * 1024)))
+AYAT_CACHE_MAX_ITEMS = int(os.getenv("AYAT_CACHE_MAX_ITEMS", "10000"))
+AYAT_CACHE_VERSION = os.getenv("AYAT_CACHE_VERSION", "1")
+
+
+def _record_size(rec: Dict[str, Any]) -> int:
+    """Perkiraan ukuran record di memori (didominasi string tafsir)."""
+    total = sys.getsizeof(rec)
+    for k, v in rec.items():
+        total += sys.getsizeof(k)
+        if isinstance(v, list):
+            total += sys.getsizeof(v) + sum(sys.getsizeof(x) for x in v)
+        else:
+            total += sys.getsizeof(v)
+    return total
+
+
+class AyatRecordCache:
+    """
+    Cache record ayat lengkap per (surat_key, ayat_ke).
+    - Budget memori (byte) + LRU.
+    - Version stamp: key ikut versi, jadi invalidate() setelah reload data
+      langsung membuang record lama (termasuk yang sedang di-fetch).
+    """
+
+    def __init__(self, max_bytes: int = AYAT_CACHE_MAX_BYTES, max_items: int = AYAT_CACHE_MAX_ITEMS,
+                 version: str = AYAT_CACHE_VERSION):
+        self._lru = LRUCache(max_items=max_items, max_bytes=max_bytes, sizeof=_record_size)
+        self._lock = threading.Lock()
+        self.version = str(version)
+        self.db_fetches = 0
+        self.db_records = 0
+        self.warmed_at: Optional[float] = None
+
+    @staticmethod
+    def make_key(nama_surat: str, ayat_ke: int) -> Tuple[str, int]:
+        return resolve_surat_key(nama_surat), int(ayat_ke)
+
+    def get(self, nama_surat: str, ayat_ke: int) -> Optional[Dict[str, Any]]:
+        rec = self._lru.get((self.version,) + self.make_key(nama_surat, ayat_ke))
+        return dict(rec) if rec is not None else None
+
+    def put(self, record: Dict[str, Any], version: Optional[str] = None) -> None:
+        if not record or not record.get("nama_surat") or record.get("ayat_ke") is None:
+            return
+        version = self.version if version is None else version
+        if version != self.version:
+            return  # hasil fetch sebelum invalidate → jangan disimpan
+        key = (version,) + self.make_key(record["nama_surat"], record["ayat_ke"])
+        self._lru.set(key, dict(record))
+
+    def record_fetch(self, n_records: int) -> None:
+        with self._lock:
+            self.db_fetches += 1
+            self.db_records += n_records
+
+    def mark_warmed(self) -> None:
+        self.warmed_at = time.time()
+
+    def invalidate(self, version: Optional[str] = None) -> str:
+        """Buang semua record & ganti versi (dipanggil setelah reload data Neo4j)."""
+        with self._lock:
+            if version is None:
+                try:
+                    version = str(int(self.version) + 1)
+                except ValueError:
+                    version = f"{self.version}+1"
+            self.version = str(version)
+            self.warmed_at = None
+        self._lru.clear()
+        return self.version
+
+    def stats(self) -> Dict[str, Any]:
+        out = self._lru.stats()
+        out.update({
+            "version": self.version,
+            "db_fetches": self.db_fetches,
+            "db_records": self.db_records,
+            "warmed_at": self.warmed_at,
+        })
+        return out
+
+
+AYAT_CACHE = AyatRecordCache()
+
+
+def cached_lookup(keys: List[Tuple[str, int]]) -> Tuple[List[Optional[Dict[str, Any]]], List[int]]:
+    """
+    Cek cache untuk list key (nama_surat, ayat_ke).
+    Return: (hasil sepanjang keys dengan None untuk miss, index yang miss).
+    """
+    if not AYAT_CACHE_ENABLED:
+        return [None] * len(keys), list(range(len(keys)))
+
+    out: List[Optional[Dict[str, Any]]] = []
+    missing: List[int] = []
+    for i, (s, a) in enumerate(keys):
+        rec = AYAT_CACHE.get(s, a)
+        out.append(rec)
+        if rec is None:
+            missing.append(i)
+    return out, missing
+
+
+def get_ayat_cache_stats() -> Dict[str, Any]:
+    return AYAT_CACHE.stats()
+
+
+def invalidate_ayat_cache(version: Optional[str] = None) -> str:
+    return AYAT_CACHE.invalidate(version)
@@ -0,0 +1,115 @@
+# src/result_cursor.py
+from __future__ import annotations
+
+import os
+from typing import Any, Callable, Dict, List, Optional
+
+from ranked_results import RankedResults, as_ranked
+
+# fetch kandidat lebih banyak dari yang ditampilkan, supaya "tambah N" tidak perlu query ulang
+CURSOR_OVERFETCH = max(1, int(os.getenv("CURSOR_OVERFETCH", "3")))
+CURSOR_MAX_LIMIT = int(os.getenv("CURSOR_MAX_LIMIT", "200"))
+
+# search_fn(limit) → baris hasil index (boleh dobel per ayat); limit = jumlah hit index, bukan jumlah ayat
+SearchFn = Callable[[int], List[Dict[str, Any]]]
+
+
+def _key(row: Dict[str, Any]):
+    return (str(row.get("nama_surat", "")).strip().upper(), row.get("ayat_ke"))
+
+
+class ResultCursor:
+    """
+    Cursor hasil pencarian: simpan kandidat ter-ranking (nama_surat, ayat_ke, score)
+    dari query pertama, lalu halaman berikutnya cukup diambil dari list ini.
+
+    Refill: kalau kandidat habis dan index belum "exhausted", vector query dijalankan
+    ulang DARI AWAL dengan limit dua kali lipat (index vector tidak punya offset/skip),
+    lalu hanya kandidat baru yang ditambahkan — baris lama ikut terambil lagi dan dilewati.
+    Karena limit tumbuh geometris, jumlah refill logaritmik dan biaya per "tambah 5"
+    tetap konstan (amortized).
+    exhausted dihitung dari ayat unik (nama_surat, ayat_ke), bukan jumlah baris: satu ayat bisa
+    punya beberapa node terjemahan, jadi limit hit index menghasilkan lebih sedikit ayat walau index
+    belum habis. Karena itu kekurangan baris tidak dianggap habis; exhausted = refill tidak
+    menambah ayat unik baru, query pertama kosong, atau limit sudah CURSOR_MAX_LIMIT.
+    Kandidat disimpan ringkas (RankedResults), bukan list dict.
+    """
+
+    def __init__(self, candidates: Optional[List[Dict[str, Any]]] = None, fetched_limit: int = 0,
+                 shown: int = 0, exhausted: bool = False, refills: int = 0):
+        self.candidates: RankedResults = as_ranked(candidates)
+        self.fetched_limit = int(fetched_limit)
+        self.shown = int(shown)
+        self.exhausted = bool(exhausted)
+        self.refills = int(refills)
+
+    @classmethod
+    def open(cls, search_fn: SearchFn, limit: int, show: int) -> "ResultCursor":
+        """Query pertama dengan over-fetch: limit = max(limit, show * CURSOR_OVERFETCH)."""
+        fetch = min(max(int(limit), int(show) * CURSOR_OVERFETCH), CURSOR_MAX_LIMIT)
+        rows = search_fn(fetch)
+        cur = cls(fetched_limit=fetch)
+        added = cur._add_new(rows)
+        cur.exhausted = added == 0 or fetch >= CURSOR_MAX_LIMIT
+        return cur
+
+    @property
+    def remaining(self) -> int:
+        return max(0, len(self.candidates) - self.shown)
+
+    def take(self, n: int, search_fn: Optional[SearchFn] = None) -> List[Dict[str, Any]]:
+        """Ambil n kandidat berikutnya (refill dulu kalau kurang & masih bisa)."""
+        n = max(0, int(n))
+        if self.remaining < n and not self.exhausted and search_fn is not None:
+            self._refill(search_fn, need=self.shown + n)
+
+        batch = self.candidates[self.shown:self.shown + n]
+        self.shown += len(batch)
+        return batch
+
+    def _refill(self, search_fn: SearchFn, need: int) -> None:
+        new_limit = min(max(self.fetched_limit * 2, need * CURSOR_OVERFETCH), CURSOR_MAX_LIMIT)
+        if new_limit <= self.fetched_limit:
+            self.exhausted = True
+            return
+
+        rows = search_fn(new_limit)
+        added = self._add_new(rows)
+
+        self.fetched_limit = new_limit
+        self.refills += 1
+        self.exhausted = added == 0 or new_limit >= CURSOR_MAX_LIMIT
+
+    def _add_new(self, rows: List[Dict[str, Any]]) -> int:
+        """Tambahkan baris yang (nama_surat, ayat_ke)-nya belum ada di kandidat; return jumlah ayat baru."""
+        seen = {_key(r) for r in self.candidates}
+        added = 0
+        for r in rows:
+            k = _key(r)
+            if k not in seen:
+                seen.add(k)
+                self.candidates.append(r)
+                added += 1
+        return added
+
+    def to_dict(self, include_candidates: bool = True) -> Dict[str, Any]:
+        """include_candidates=False kalau kandidat sudah disimpan terpisah (state["last_results"])."""
+        out = {
+            "fetched_limit": self.fetched_limit,
+            "shown": self.shown,
+            "exhausted": self.exhausted,
+            "refills": self.refills,
+        }
+        if include_candidates:
+            out["candidates"] = self.candidates
+        return out
+
+    @classmethod
+    def from_dict(cls, data: Optional[Dict[str, Any]],
+                  candidates: Optional[List[Dict[str, Any]]] = None) -> Optional["ResultCursor"]:
+        if not data:
+            return None
+        data = dict(data)
+        if candidates is not None:
+            data["candidates"] = candidates
+        return cls(**data)
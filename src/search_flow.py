@@ -1,7 +1,7 @@
 # src/search_flow.py
 from typing import List, Dict, Any, Optional, Union
 
-from neo4j_client import get_ayat
+from neo4j_client import get_ayat_many
 from formatter import format_ayat_narasi_chat
 
 
@@ -110,7 +110,7 @@ def apply_source_filter(record: Dict[str, Any], source: str) -> Dict[str, Any]:
 def format_many(results: List[Dict[str, Any]], focus: Union[None, str, List[str]] = None) -> str:
     """
     Ubah list hasil search (yang biasanya cuma punya nama_surat + ayat_ke + score)
-    menjadi narasi lengkap per ayat (ambil full record via get_ayat).
+    menjadi narasi lengkap per ayat (ambil full record via get_ayat_many, 1 query per halaman).
     """
     if not results:
         return "Tidak ditemukan ayat yang relevan."
@@ -118,15 +118,17 @@ def format_many(results: List[Dict[str, Any]], focus: Union[None, str, List[str]
     source = _normalize_focus(focus)
     blocks: List[str] = []
 
+    keys = []
     for it in results:
         nama_surat = it.get("nama_surat")
         ayat_ke = it.get("ayat_ke")
 
         if not nama_surat or ayat_ke is None:
             continue  # skip data rusak
+        keys.append((nama_surat, int(ayat_ke)))
 
-        # Ambil data lengkap ayat dari DB
-        record = get_ayat(nama_surat, int(ayat_ke))
+    # Ambil data lengkap semua ayat dari DB dalam 1 round trip
+    for record in get_ayat_many(keys):
         if not record:
             continue
 
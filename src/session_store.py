@@ -0,0 +1,433 @@
+# src/session_store.py
+from __future__ import annotations
+
+import os
+import sys
+import json
+import time
+import zlib
+import base64
+import sqlite3
+import threading
+from abc import ABC, abstractmethod
+from array import array
+from typing import Any, Dict, Optional
+
+from cache_utils import LRUCache
+from ranked_results import RankedResults
+
+# =========================
+# Konfigurasi
+# =========================
+SESSION_BACKEND = os.getenv("SESSION_BACKEND", "memory").strip().lower()  # memory | sqlite | redis
+SESSION_DB_PATH = os.getenv("SESSION_DB_PATH", ".cache/sessions.sqlite3")
+# server ber-protokol Redis (Redis/Valkey/KeyDB/Dragonfly, atau stand-in lokal); butuh paket redis
+SESSION_REDIS_URL = os.getenv("SESSION_REDIS_URL", "redis://localhost:6379/0")
+SESSION_REDIS_PREFIX = os.getenv("SESSION_REDIS_PREFIX", "tafsir:session:")
+SESSION_MAX_ENTRIES = int(os.getenv("SESSION_MAX_ENTRIES", "1000"))
+SESSION_MAX_BYTES = int(os.getenv("SESSION_MAX_BYTES", str(256 * 1024 * 1024)))
+SESSION_IDLE_TTL = float(os.getenv("SESSION_IDLE_TTL", str(6 * 3600)))
+SESSION_SWEEP_INTERVAL = float(os.getenv("SESSION_SWEEP_INTERVAL", "60"))
+# konflik versi saat save → load ulang + terapkan ulang perubahan, maksimal sekian kali
+SESSION_SAVE_RETRIES = int(os.getenv("SESSION_SAVE_RETRIES", "3"))
+
+# key di dalam state untuk optimistic concurrency (tidak ikut diserialisasi):
+# versi saat load + blob asli saat load (dasar untuk menerapkan ulang perubahan kalau konflik)
+VERSION_KEY = "_version"
+BASE_KEY = "_base"
+_META_KEYS = (VERSION_KEY, BASE_KEY)
+
+
+def _deep_sizeof(obj: Any, seen: set = None) -> int:
+    """Perkiraan ukuran objek beserta isinya (dict/list/tuple/set/array)."""
+    if seen is None:
+        seen = set()
+    if id(obj) in seen:
+        return 0
+    seen.add(id(obj))
+
+    size = sys.getsizeof(obj)
+    if isinstance(obj, dict):
+        size += sum(_deep_sizeof(k, seen) + _deep_sizeof(v, seen) for k, v in obj.items())
+    elif isinstance(obj, (list, tuple, set, frozenset)):
+        size += sum(_deep_sizeof(x, seen) for x in obj)
+    elif isinstance(obj, array):
+        pass  # getsizeof array sudah termasuk buffer
+    return size
+
+
+# =========================
+# Serialisasi ringkas
+# =========================
+def _json_default(obj: Any) -> Any:
+    if isinstance(obj, RankedResults):
+        return {"__ranked__": obj.to_dict()}
+    if isinstance(obj, array):
+        return {"__arr__": obj.typecode, "b64": base64.b64encode(obj.tobytes()).decode("ascii")}
+    if isinstance(obj, (set, frozenset)):
+        return sorted(obj)
+    raise TypeError(f"Tidak bisa diserialisasi: {type(obj).__name__}")
+
+
+def _json_hook(obj: Dict[str, Any]) -> Any:
+    if "__ranked__" in obj:
+        return RankedResults.from_dict(obj["__ranked__"])
+    if "__arr__" in obj and "b64" in obj:
+        arr = array(obj["__arr__"])
+        arr.frombytes(base64.b64decode(obj["b64"]))
+        return arr
+    return obj
+
+
+def _compact_floats(state: Dict[str, Any]) -> Dict[str, Any]:
+    """Embedding (list float 3072) disimpan sebagai float32 biner, bukan teks JSON."""
+    vec = state.get("last_query_embedding")
+    if isinstance(vec, list) and vec and all(isinstance(x, float) for x in vec[:8]):
+        state = dict(state)
+        state["last_query_embedding"] = array("f", vec)
+    return state
+
+
+def encode_state(state: Dict[str, Any]) -> bytes:
+    data = {k: v for k, v in state.items() if k not in _META_KEYS}
+    raw = json.dumps(_compact_floats(data), ensure_ascii=False, separators=(",", ":"), default=_json_default)
+    return zlib.compress(raw.encode("utf-8"), 6)
+
+
+def decode_state(blob: bytes) -> Dict[str, Any]:
+    # embedding tetap array("f"); pemanggil mengubah ke list() sebelum query
+    return json.loads(zlib.decompress(blob).decode("utf-8"), object_hook=_json_hook)
+
+
+def _field_json(state: Dict[str, Any], key: str) -> str:
+    return json.dumps(_compact_floats({key: state[key]}), ensure_ascii=False, sort_keys=True,
+                      default=_json_default)
+
+
+def rebase_state(ours: Dict[str, Any], latest: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+    """
+    Terapkan ulang perubahan `ours` di atas state terbaru `latest` (setelah konflik versi).
+    Field yang diubah request ini (beda dari blob saat load) menang; field lain ikut `latest`,
+    jadi perubahan proses lain pada field yang tidak kita sentuh tidak hilang.
+    latest None (session dihapus/kedaluwarsa) → `ours` ditulis sebagai session baru.
+    """
+    base = decode_state(ours[BASE_KEY]) if ours.get(BASE_KEY) else {}
+    merged = dict(latest) if latest is not None else {}
+    for k in ours:
+        if k in _META_KEYS:
+            continue
+        if k not in base or _field_json(ours, k) != _field_json(base, k):
+            merged[k] = ours[k]
+    return merged
+
+
+# =========================
+# Interface
+# =========================
+class SessionStore(ABC):
+    """
+    Interface penyimpanan state percakapan.
+    - load(session_id) → state atau None
+    - save(session_id, state) → False kalau konflik versi (ditulis proses lain lebih dulu);
+      pemanggil load ulang, rebase_state(), lalu save lagi (lihat state.save_state)
+    """
+
+    name = "base"
+
+    @abstractmethod
+    def load(self, session_id: str) -> Optional[Dict[str, Any]]:
+        ...
+
+    @abstractmethod
+    def save(self, session_id: str, state: Dict[str, Any]) -> bool:
+        ...
+
+    @abstractmethod
+    def delete(self, session_id: str) -> None:
+        ...
+
+    def sweep(self) -> int:
+        return 0
+
+    def stats(self, top: int = 5) -> Dict[str, Any]:
+        return {"backend": self.name}
+
+
+class InMemorySessionStore(SessionStore):
+    """
+    State di memori proses (1 worker). LRU + budget byte + idle TTL.
+    save() dipanggil di akhir tiap request (state.save_state): ukur ulang state yang sudah
+    diubah request itu + refresh idle TTL.
+    """
+
+    name = "memory"
+
+    def __init__(self, max_entries: int = SESSION_MAX_ENTRIES, max_bytes: int = SESSION_MAX_BYTES,
+                 idle_ttl: float = SESSION_IDLE_TTL):
+        self.idle_ttl = idle_ttl
+        self._lru = LRUCache(max_items=max_entries, max_bytes=max_bytes, ttl=idle_ttl, sizeof=_deep_sizeof)
+
+    def load(self, session_id: str) -> Optional[Dict[str, Any]]:
+        return self._lru.get(session_id)
+
+    def save(self, session_id: str, state: Dict[str, Any]) -> bool:
+        self._lru.set(session_id, state)
+        if session_id not in self._lru:
+            print(f"[WARN] Session {session_id} melebihi SESSION_MAX_BYTES → tidak disimpan")
+        return True
+
+    def delete(self, session_id: str) -> None:
+        self._lru.pop(session_id)
+
+    def sweep(self) -> int:
+        return self._lru.purge_expired()
+
+    def stats(self, top: int = 5) -> Dict[str, Any]:
+        out = self._lru.stats()
+        sizes = self._lru.sizes()
+        out["backend"] = self.name
+        out["idle_ttl"] = self.idle_ttl
+        out["avg_bytes"] = round(sum(sizes.values()) / len(sizes), 1) if sizes else 0.0
+        out["largest"] = sorted(
+            ({"session_id": str(k), "bytes": v} for k, v in sizes.items()),
+            key=lambda x: -x["bytes"],
+        )[:top]
+        return out
+
+
+class SQLiteSessionStore(SessionStore):
+    """
+    State bersama antar proses/worker di satu host (SQLite WAL).
+    - Serialisasi ringkas: JSON + float32 biner untuk embedding + zlib.
+    - Optimistic concurrency: kolom version; save hanya berhasil kalau versi di DB
+      masih sama dengan saat load. Kalau tidak → return False (konflik), pemanggil rebase lalu coba lagi.
+    """
+
+    name = "sqlite"
+
+    def __init__(self, path: str = SESSION_DB_PATH, max_entries: int = SESSION_MAX_ENTRIES,
+                 idle_ttl: float = SESSION_IDLE_TTL):
+        self.path = path
+        self.max_entries = max(1, int(max_entries))
+        self.idle_ttl = idle_ttl
+        self._lock = threading.Lock()
+
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None, timeout=10)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS sessions (
+                session_id TEXT PRIMARY KEY,
+                data BLOB NOT NULL,
+                version INTEGER NOT NULL,
+                updated_at REAL NOT NULL
+            )
+            """
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_sessions_updated ON sessions(updated_at)")
+
+        self.loads = 0
+        self.saves = 0
+        self.conflicts = 0
+        self.bytes_written = 0
+
+    def load(self, session_id: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT data, version, updated_at FROM sessions WHERE session_id = ?", (session_id,)
+            ).fetchone()
+            self.loads += 1
+        if row is None:
+            return None
+        data, version, updated_at = row
+        if self.idle_ttl and (time.time() - updated_at) > self.idle_ttl:
+            self.delete(session_id)  # supaya session baru bisa di-INSERT dengan versi 1
+            return None
+        state = decode_state(bytes(data))
+        state[VERSION_KEY] = int(version)
+        state[BASE_KEY] = bytes(data)
+        return state
+
+    def save(self, session_id: str, state: Dict[str, Any]) -> bool:
+        blob = encode_state(state)
+        version = int(state.get(VERSION_KEY) or 0)
+        now = time.time()
+        with self._lock:
+            if version == 0:
+                cur = self._conn.execute(
+                    "INSERT INTO sessions (session_id, data, version, updated_at) VALUES (?, ?, 1, ?) "
+                    "ON CONFLICT(session_id) DO NOTHING",
+                    (session_id, sqlite3.Binary(blob), now),
+                )
+            else:
+                cur = self._conn.execute(
+                    "UPDATE sessions SET data = ?, version = version + 1, updated_at = ? "
+                    "WHERE session_id = ? AND version = ?",
+                    (sqlite3.Binary(blob), now, session_id, version),
+                )
+            if cur.rowcount == 0:
+                self.conflicts += 1
+                print(f"[WARN] Konflik versi session {session_id} (v{version}) → load ulang & terapkan ulang")
+                return False
+            self.saves += 1
+            self.bytes_written += len(blob)
+        state[VERSION_KEY] = version + 1
+        state[BASE_KEY] = blob
+        return True
+
+    def delete(self, session_id: str) -> None:
+        with self._lock:
+            self._conn.execute("DELETE FROM sessions WHERE session_id = ?", (session_id,))
+
+    def sweep(self) -> int:
+        """Hapus session idle + yang paling lama tidak dipakai kalau melebihi max_entries."""
+        with self._lock:
+            removed = 0
+            if self.idle_ttl:
+                cur = self._conn.execute(
+                    "DELETE FROM sessions WHERE updated_at < ?", (time.time() - self.idle_ttl,)
+                )
+                removed += cur.rowcount
+            n = int(self._conn.execute("SELECT COUNT(*) FROM sessions").fetchone()[0])
+            over = n - self.max_entries
+            if over > 0:
+                cur = self._conn.execute(
+                    "DELETE FROM sessions WHERE session_id IN "
+                    "(SELECT session_id FROM sessions ORDER BY updated_at ASC LIMIT ?)",
+                    (over,),
+                )
+                removed += cur.rowcount
+            return removed
+
+    def stats(self, top: int = 5) -> Dict[str, Any]:
+        with self._lock:
+            items, total = self._conn.execute(
+                "SELECT COUNT(*), COALESCE(SUM(LENGTH(data)), 0) FROM sessions"
+            ).fetchone()
+            largest = self._conn.execute(
+                "SELECT session_id, LENGTH(data) FROM sessions ORDER BY LENGTH(data) DESC LIMIT ?",
+                (max(0, int(top)),),
+            ).fetchall()
+        return {
+            "backend": self.name,
+            "path": self.path,
+            "items": int(items),
+            "bytes": int(total),
+            "avg_bytes": round(total / items, 1) if items else 0.0,
+            "max_items": self.max_entries,
+            "idle_ttl": self.idle_ttl,
+            "loads": self.loads,
+            "saves": self.saves,
+            "conflicts": self.conflicts,
+            "bytes_written": self.bytes_written,
+            "largest": [{"session_id": str(k), "bytes": int(v)} for k, v in largest],
+        }
+
+
+class RedisSessionStore(SessionStore):
+    """
+    State bersama antar host lewat server ber-protokol Redis (SESSION_REDIS_URL).
+    - 1 hash per session: data (blob encode_state) + version.
+    - Optimistic concurrency: WATCH key → cek version → MULTI/EXEC; key berubah di tengah → konflik.
+    - Idle TTL pakai EXPIRE (diperpanjang tiap load/save); batas jumlah/byte diserahkan ke
+      maxmemory-policy server, jadi sweep() tidak perlu apa-apa.
+    Paket redis opsional: hanya di-import kalau backend ini dipakai.
+    """
+
+    name = "redis"
+
+    def __init__(self, url: str = SESSION_REDIS_URL, prefix: str = SESSION_REDIS_PREFIX,
+                 idle_ttl: float = SESSION_IDLE_TTL):
+        import redis  # opsional
+
+        self._redis = redis
+        self.url = url
+        self.prefix = prefix
+        self.idle_ttl = idle_ttl
+        self._client = redis.Redis.from_url(url)
+        self._client.ping()
+        self._lock = threading.Lock()
+
+        self.loads = 0
+        self.saves = 0
+        self.conflicts = 0
+        self.bytes_written = 0
+
+    def _key(self, session_id: str) -> str:
+        return f"{self.prefix}{session_id}"
+
+    def _bump(self, name: str, value: int = 1) -> None:
+        with self._lock:
+            setattr(self, name, getattr(self, name) + value)
+
+    def load(self, session_id: str) -> Optional[Dict[str, Any]]:
+        key = self._key(session_id)
+        data, version = self._client.hmget(key, "data", "version")
+        self._bump("loads")
+        if data is None:
+            return None
+        if self.idle_ttl:
+            self._client.expire(key, int(self.idle_ttl))
+        state = decode_state(bytes(data))
+        state[VERSION_KEY] = int(version or 0)
+        state[BASE_KEY] = bytes(data)
+        return state
+
+    def save(self, session_id: str, state: Dict[str, Any]) -> bool:
+        blob = encode_state(state)
+        version = int(state.get(VERSION_KEY) or 0)
+        key = self._key(session_id)
+        with self._client.pipeline() as pipe:
+            try:
+                pipe.watch(key)
+                current = pipe.hget(key, "version")
+                if int(current or 0) != version:
+                    pipe.unwatch()
+                    raise self._redis.WatchError(key)
+                pipe.multi()
+                pipe.hset(key, mapping={"data": blob, "version": version + 1})
+                if self.idle_ttl:
+                    pipe.expire(key, int(self.idle_ttl))
+                pipe.execute()
+            except self._redis.WatchError:
+                self._bump("conflicts")
+                print(f"[WARN] Konflik versi session {session_id} (v{version}) → load ulang & terapkan ulang")
+                return False
+        self._bump("saves")
+        self._bump("bytes_written", len(blob))
+        state[VERSION_KEY] = version + 1
+        state[BASE_KEY] = blob
+        return True
+
+    def delete(self, session_id: str) -> None:
+        self._client.delete(self._key(session_id))
+
+    def stats(self, top: int = 5) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "backend": self.name,
+                "url": self.url.split("@")[-1],  # tanpa kredensial
+                "idle_ttl": self.idle_ttl,
+                "loads": self.loads,
+                "saves": self.saves,
+                "conflicts": self.conflicts,
+                "bytes_written": self.bytes_written,
+            }
+
+
+def create_session_store(backend: str = SESSION_BACKEND) -> SessionStore:
+    if backend == "sqlite":
+        try:
+            return SQLiteSessionStore()
+        except Exception as e:
+            print(f"[WARN] Session store SQLite gagal dibuka ({e}) → pakai memori")
+    elif backend == "redis":
+        try:
+            return RedisSessionStore()
+        except Exception as e:
+            print(f"[WARN] Session store Redis tidak tersedia ({e}) → pakai memori")
+    elif backend not in ("memory", ""):
+        print(f"[WARN] SESSION_BACKEND={backend} tidak dikenal → pakai memori")
+    return InMemorySessionStore()
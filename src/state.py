@@ -1,6 +1,14 @@
+import time
 from typing import Dict, Any
 
-_SESSION_STORE: Dict[str, Dict[str, Any]] = {}
+from session_store import (
+    SESSION_SAVE_RETRIES, SESSION_SWEEP_INTERVAL, SessionStore, create_session_store, rebase_state,
+)
+
+# backend dipilih lewat SESSION_BACKEND (memory | sqlite | redis), lihat session_store.py
+_SESSION_STORE: SessionStore = create_session_store()
+_LAST_SWEEP = 0.0
+_CREATED = 0
 
 def init_state() -> Dict[str, Any]:
     return {
@@ -17,13 +25,51 @@ def init_state() -> Dict[str, Any]:
         "cursor": 0,
         "output_mode": "full",
         "active_tafsir": "all",
-        "score_threshold": 0.70
+        "score_threshold": 0.70,
+        "result_cursor": None,
+        "batch_summaries": [],
     }
 
+def _sweep() -> None:
+    global _LAST_SWEEP
+    now = time.time()
+    if now - _LAST_SWEEP >= SESSION_SWEEP_INTERVAL:
+        _LAST_SWEEP = now
+        _SESSION_STORE.sweep()
+
 def get_state(session_id: str) -> Dict[str, Any]:
-    if session_id not in _SESSION_STORE:
-        _SESSION_STORE[session_id] = init_state()
-    return _SESSION_STORE[session_id]
+    global _CREATED
+    _sweep()
+    state = _SESSION_STORE.load(session_id)
+    if state is None:
+        state = init_state()
+        _CREATED += 1
+    # ukuran & idle TTL diperbarui di save_state, setelah request mengubah state
+    return state
+
+def save_state(session_id: str, state: Dict[str, Any], retries: int = SESSION_SAVE_RETRIES) -> bool:
+    """
+    Simpan state setelah request selesai (wajib untuk semua backend).
+    Backend memori: di sinilah ukuran byte diukur ulang (state sudah berisi hasil request ini)
+    dan idle TTL di-refresh.
+    Konflik versi → load state terbaru, terapkan ulang perubahan request ini (rebase_state), coba lagi.
+    state diperbarui in-place dengan hasil gabungan.
+    """
+    for _ in range(max(0, int(retries)) + 1):
+        if _SESSION_STORE.save(session_id, state):
+            return True
+        merged = rebase_state(state, _SESSION_STORE.load(session_id))
+        state.clear()
+        state.update(merged)
+    print(f"[WARN] Session {session_id} tetap konflik setelah {retries} percobaan → perubahan tidak disimpan")
+    return False
 
 def reset_state(session_id: str) -> None:
-    _SESSION_STORE[session_id] = init_state()
+    _SESSION_STORE.delete(session_id)
+    _SESSION_STORE.save(session_id, init_state())
+
+def get_session_metrics(top: int = 5) -> Dict[str, Any]:
+    """Statistik session store (jumlah, byte, `top` session terbesar / konflik versi)."""
+    stats = _SESSION_STORE.stats(top=top)
+    stats["created"] = _CREATED
+    return stats
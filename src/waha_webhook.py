@@ -1,12 +1,22 @@
 import os
 import re
+import time
+import hashlib
+import threading
+from typing import Iterator
+
 import requests
-from io import StringIO
-from contextlib import redirect_stdout
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 from fastapi import FastAPI, Request, HTTPException
+from fastapi.concurrency import run_in_threadpool
 
 # PASTIKAN import ini sesuai struktur project kamu
-from src.controller import controller
+from src.controller import (
+    controller_stream, get_conclusion_cache_stats, get_context_stats, get_llm_client_metrics,
+    get_neo4j_metrics, get_planner_stats, get_session_metrics, get_stream_metrics, warm_ayat_cache,
+)
+from src.job_queue import JobQueue
 
 app = FastAPI()
 
@@ -15,6 +25,11 @@ WAHA_API_KEY = os.getenv("WAHA_API_KEY", "")
 WAHA_SESSION = os.getenv("WAHA_SESSION", "default")
 WEBHOOK_TOKEN = os.getenv("WEBHOOK_TOKEN", "")  # bebas (buat security)
 MAX_WA_CHARS = int(os.getenv("MAX_WA_CHARS", "3500"))
+AYAT_CACHE_WARM = os.getenv("AYAT_CACHE_WARM", "0") == "1"
+WEBHOOK_WORKERS = int(os.getenv("WEBHOOK_WORKERS", "4"))
+WAHA_TIMEOUT = float(os.getenv("WAHA_TIMEOUT", "60"))
+WAHA_RETRY_TOTAL = int(os.getenv("WAHA_RETRY_TOTAL", "3"))
+WAHA_RETRY_BACKOFF = float(os.getenv("WAHA_RETRY_BACKOFF", "0.5"))
 
 
 def _headers():
@@ -24,6 +39,56 @@ def _headers():
     return h
 
 
+def _build_session() -> requests.Session:
+    """
+    Session bersama ke WAHA: koneksi keep-alive di-pool (1 slot per worker)
+    dan retry dengan backoff untuk 429/5xx (menghormati Retry-After).
+    """
+    retry = Retry(
+        total=WAHA_RETRY_TOTAL,
+        backoff_factor=WAHA_RETRY_BACKOFF,
+        status_forcelist=(429, 500, 502, 503, 504),
+        allowed_methods=frozenset(["POST"]),
+        respect_retry_after_header=True,
+        raise_on_status=False,
+    )
+    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=max(1, WEBHOOK_WORKERS), max_retries=retry)
+    session = requests.Session()
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    session.headers.update(_headers())
+    return session
+
+
+_SESSION = _build_session()
+
+_SEND_LOCK = threading.Lock()
+_SEND_METRICS = {
+    "sends": 0,
+    "errors": 0,
+    "total_ms": 0.0,
+    "max_ms": 0.0,
+    "last_ms": 0.0,
+}
+
+
+def _record_send(ms: float, ok: bool) -> None:
+    with _SEND_LOCK:
+        _SEND_METRICS["sends"] += 1
+        if not ok:
+            _SEND_METRICS["errors"] += 1
+        _SEND_METRICS["total_ms"] += ms
+        _SEND_METRICS["last_ms"] = ms
+        _SEND_METRICS["max_ms"] = max(_SEND_METRICS["max_ms"], ms)
+
+
+def get_send_metrics() -> dict:
+    with _SEND_LOCK:
+        m = dict(_SEND_METRICS)
+    m["avg_ms"] = round(m["total_ms"] / m["sends"], 1) if m["sends"] else 0.0
+    return m
+
+
 def send_text(chat_id: str, text: str):
     """
     WAHA sendText payload:
@@ -31,7 +96,14 @@ def send_text(chat_id: str, text: str):
     """
     url = f"{WAHA_BASE_URL}/api/sendText"
     payload = {"session": WAHA_SESSION, "chatId": chat_id, "text": text}
-    r = requests.post(url, headers=_headers(), json=payload, timeout=60)
+
+    t0 = time.perf_counter()
+    try:
+        r = _SESSION.post(url, json=payload, timeout=WAHA_TIMEOUT)
+    except Exception:
+        _record_send((time.perf_counter() - t0) * 1000, ok=False)
+        raise
+    _record_send((time.perf_counter() - t0) * 1000, ok=r.ok)
 
     # Biar kelihatan jelas kalau WAHA nolak (mis. session belum WORKING)
     try:
@@ -77,11 +149,93 @@ def split_message(s: str, max_len: int):
     return parts
 
 
+@app.on_event("startup")
+def _warm_cache():
+    # opsional: isi cache record ayat sekali di awal supaya request pertama tidak ke DB
+    if AYAT_CACHE_WARM:
+        try:
+            warm_ayat_cache()
+        except Exception as e:
+            print(f"[WARN] Warm ayat cache gagal: {e}")
+
+
+def answer_parts(text: str, chat_id: str) -> Iterator[str]:
+    """
+    Jalankan controller_stream dan yield part pesan WhatsApp begitu tiap blok siap
+    (header, tiap ayat, kesimpulan) — user tidak menunggu kesimpulan LLM untuk melihat ayat.
+    """
+    # pakai chat_id jadi session_id biar state "lanjut" per user WA jalan
+    # (tidak pakai redirect_stdout: itu global per proses dan bocor antar thread worker)
+    n = 0
+    total_len = 0
+    try:
+        for block in controller_stream(text, session_id=str(chat_id)):
+            cleaned = clean_output(block)
+            if not cleaned:
+                continue
+            for part in split_message(cleaned, MAX_WA_CHARS):
+                n += 1
+                total_len += len(part)
+                yield part
+    except Exception as e:
+        n += 1
+        yield f"Maaf, sistem error: {type(e).__name__}: {e}"
+
+    if n == 0:
+        yield "Maaf, aku belum nemu jawaban yang pas. Coba tanya dengan kata lain ya."
+
+    print("DEBUG_REPLY_PARTS:", n, "DEBUG_REPLY_LEN:", total_len)
+
+
+# antrian persisten + worker pool (concurrency = WEBHOOK_WORKERS)
+job_queue = JobQueue(
+    compute=lambda chat_id, text: answer_parts(text, chat_id),
+    send=send_text,
+    workers=WEBHOOK_WORKERS,
+)
+
+
+@app.on_event("startup")
+def _start_job_queue():
+    job_queue.start()
+
+
+@app.on_event("shutdown")
+def _stop_job_queue():
+    job_queue.stop()
+
+
+def _message_id(payload: dict, chat_id: str, text: str) -> str:
+    """ID unik pesan WAHA untuk idempotensi; fallback hash kalau payload tidak punya id."""
+    mid = payload.get("id")
+    if isinstance(mid, dict):
+        mid = mid.get("_serialized") or mid.get("id")
+    if mid:
+        return str(mid)
+    raw = f"{chat_id}|{payload.get('timestamp')}|{text}"
+    return "h:" + hashlib.sha1(raw.encode("utf-8")).hexdigest()
+
+
 @app.get("/health")
 def health():
     return {"ok": True}
 
 
+@app.get("/metrics")
+def metrics():
+    return {
+        "job_queue": job_queue.stats(),
+        "waha_send": get_send_metrics(),
+        "llm_stream": get_stream_metrics(),
+        "conclusion_cache": get_conclusion_cache_stats(),
+        "llm_clients": get_llm_client_metrics(),
+        "context": get_context_stats(),
+        "planner": get_planner_stats(),
+        "sessions": get_session_metrics(),
+        "neo4j": get_neo4j_metrics(),
+    }
+
+
 @app.post("/waha/webhook")
 async def waha_webhook(req: Request):
     # security sederhana: set token di url webhook
@@ -108,27 +262,10 @@ async def waha_webhook(req: Request):
     if not text or not chat_id:
         return {"ok": True}
 
-    # pakai chat_id jadi session_id biar state "lanjut" per user WA jalan
-    try:
-        buf = StringIO()
-        with redirect_stdout(buf):
-            ret = controller(text, session_id=str(chat_id))
-
-        # ✅ PRIORITAS: return string dari controller
-        # ✅ FALLBACK: kalau controller print, ambil dari stdout buffer
-        reply_raw = ret if isinstance(ret, str) and ret.strip() else buf.getvalue()
-        reply = clean_output(reply_raw)
+    # validasi → masuk antrian → langsung balas ke WAHA; jawaban dikirim worker di background
+    # INSERT SQLite bisa menunggu busy timeout → jangan blok event loop
+    queued = await run_in_threadpool(
+        job_queue.enqueue, _message_id(payload, str(chat_id), text), str(chat_id), text
+    )
 
-    except Exception as e:
-        reply = f"Maaf, sistem error: {type(e).__name__}: {e}"
-
-    if not reply:
-        reply = "Maaf, aku belum nemu jawaban yang pas. Coba tanya dengan kata lain ya."
-
-    print("DEBUG_REPLY_LEN:", len(reply))
-    print("DEBUG_REPLY_PREVIEW:", reply[:200])
-
-    for part in split_message(reply, MAX_WA_CHARS):
-        send_text(str(chat_id), part)
-
-    return {"ok": True}
+    return {"ok": True, "queued": queued}
@@ -0,0 +1,8 @@
+# tests/conftest.py
+import os
+import sys
+
+# modul di src/ saling import tanpa prefix "src." (sama seperti saat dijalankan dari src/)
+SRC_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "src"))
+if SRC_DIR not in sys.path:
+    sys.path.insert(0, SRC_DIR)
@@ -0,0 +1,18 @@
+# tests/test_cache_utils.py
+from cache_utils import SQLiteCache
+
+
+def test_sqlite_cache_tracks_count_without_per_set_count_query(tmp_path):
+    cache = SQLiteCache(str(tmp_path / "c.sqlite3"), max_items=3)
+    statements = []
+    cache._conn.set_trace_callback(statements.append)
+
+    for i in range(3):
+        cache.set(f"k{i}", b"x")
+    cache.set("k0", b"y")  # timpa key lama → jumlah tetap
+    assert cache._count == 3
+    assert not any("COUNT(*)" in s for s in statements)
+
+    cache.set("k3", b"z")  # lewat batas → eviksi LRU
+    assert cache.count() == 3 and cache.evictions == 1
+    assert cache.get("k0") == b"y" and cache.get("k1") is None
@@ -0,0 +1,32 @@
+# tests/test_conclusion_cache.py
+from conclusion_cache import ConclusionCache
+
+_VECS = {"gambaran hisab": [1.0, 0.0], "hisab itu apa": [0.99, 0.05], "sifat tamak": [0.0, 1.0]}
+
+
+def _cache(tmp_path, monkeypatch, calls):
+    cache = ConclusionCache(path=str(tmp_path / "c.sqlite3"), near_dup=True, threshold=0.9)
+    monkeypatch.setattr(cache, "_embed", lambda topic: calls.append(topic) or _VECS[topic])
+    return cache
+
+
+def test_near_dup_embeds_only_the_new_topic(tmp_path, monkeypatch):
+    calls = []
+    cache = _cache(tmp_path, monkeypatch, calls)
+    cache.put(("k1", "set", "gambaran hisab"), "kesimpulan hisab")
+    cache.put(("k2", "set", "sifat tamak"), "kesimpulan tamak")
+    calls.clear()
+
+    assert cache.get(("k3", "set", "hisab itu apa")) == "kesimpulan hisab"
+    assert calls == ["hisab itu apa"]  # topik tersimpan tidak di-embed ulang
+    assert cache.near_dup_hits == 1
+
+
+def test_topic_embeddings_survive_restart(tmp_path, monkeypatch):
+    calls = []
+    _cache(tmp_path, monkeypatch, calls).put(("k1", "set", "gambaran hisab"), "kesimpulan hisab")
+
+    again = _cache(tmp_path, monkeypatch, calls)  # memori kosong, index topik dari disk
+    calls.clear()
+    assert again.get(("k3", "set", "hisab itu apa")) == "kesimpulan hisab"
+    assert calls == ["hisab itu apa"]
@@ -0,0 +1,64 @@
+# tests/test_history_store.py
+import os
+import tempfile
+
+import pytest
+
+pytest.importorskip("streamlit")
+
+# store lokal modul ini dibuat saat import → arahkan ke folder sementara, tanpa export ke Sheets
+os.environ.setdefault("HISTORY_DB_PATH", os.path.join(tempfile.mkdtemp(), "history.sqlite3"))
+os.environ.setdefault("HISTORY_SHEETS_EXPORT", "0")
+
+from history_store import SQLiteHistoryStore, _HistoryCache  # noqa: E402
+
+
+def _rows(n, user="u1"):
+    return [{"created_at": f"2026-01-{i:02d}", "user_id": user, "query": f"q{i}"} for i in range(n, 0, -1)]
+
+
+def test_partial_entry_serves_only_smaller_limits():
+    cache = _HistoryCache(max_rows=50)
+    cache.fill("u1", _rows(50), limit=50)  # penuh sampai limit → mungkin masih ada yang lebih lama
+
+    assert len(cache.get("u1", 20)) == 20
+    assert cache.get("u1", 60) is None
+
+
+def test_complete_entry_serves_any_limit():
+    cache = _HistoryCache(max_rows=50)
+    cache.fill("u1", _rows(3), limit=50)
+    assert len(cache.get("u1", 100)) == 3
+
+
+def test_prepend_updates_in_place_and_caps_rows():
+    cache = _HistoryCache(max_rows=3)
+    cache.fill("u1", _rows(3), limit=50)
+    cache.prepend("u1", {"created_at": "2026-02-01", "user_id": "u1", "query": "baru"})
+
+    rows = cache.get("u1", 3)
+    assert rows[0]["query"] == "baru" and len(rows) == 3
+    assert cache.get("u1", 4) is None  # baris terlama terpotong → tidak lagi lengkap
+
+    cache.prepend("u2", {"query": "x"})  # user yang belum di-cache tidak dibuat
+    assert cache.get("u2", 1) is None
+
+
+def test_reset_and_drop():
+    cache = _HistoryCache()
+    cache.fill("u1", _rows(5), limit=50)
+    cache.reset("u1")
+    assert cache.get("u1", 20) == []
+    cache.drop("u1")
+    assert cache.get("u1", 20) is None
+
+
+def test_sqlite_store_loads_newest_first(tmp_path):
+    store = SQLiteHistoryStore(path=str(tmp_path / "h.sqlite3"))
+    for row in reversed(_rows(5)):
+        store.save(row)
+    store.save({"created_at": "2026-01-09", "user_id": "u2", "query": "lain"})
+
+    assert [r["query"] for r in store.load("u1", limit=2)] == ["q5", "q4"]
+    assert store.clear("u1") == 5
+    assert store.load("u1") == []
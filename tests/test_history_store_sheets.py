@@ -0,0 +1,146 @@
+# tests/test_history_store_sheets.py
+import threading
+
+import pytest
+
+pytest.importorskip("streamlit")
+
+import history_store_sheets as sheets  # noqa: E402
+
+
+class _FakeWorksheet:
+    def __init__(self, writer, fail=0):
+        self.writer = writer
+        self.fail = fail
+        self.appended = []
+        self.seen_pending = []
+
+    def append_rows(self, rows, value_input_option=None):
+        self.seen_pending.append(self.writer.pending())
+        if self.fail:
+            self.fail -= 1
+            raise IOError("quota")
+        self.appended.extend(rows)
+
+
+def _writer(monkeypatch):
+    monkeypatch.setattr(sheets, "ensure_header", lambda: None)
+    w = sheets._HistoryWriter()
+    w._thread = threading.current_thread()  # jangan start thread flush di test
+    return w
+
+
+def _row(user, q):
+    return ["2026-01-01T00:00:00", user, "", q, "jawab", ""]
+
+
+def test_inflight_batch_stays_visible_until_appended(monkeypatch):
+    w = _writer(monkeypatch)
+    ws = _FakeWorksheet(w)
+    w.add(ws, _row("u1", "a"))
+    w.add(ws, _row("u2", "b"))
+
+    assert w.flush() == 2
+    assert [r[3] for r in ws.seen_pending[0]] == ["a", "b"]  # terlihat saat append_rows berjalan
+    assert w.pending() == []
+
+
+def test_failed_flush_requeues_and_backoff_suppresses_wakeup(monkeypatch):
+    monkeypatch.setattr(sheets, "HISTORY_FLUSH_BATCH", 2)
+    w = _writer(monkeypatch)
+    ws = _FakeWorksheet(w, fail=1)
+    w.add(ws, _row("u1", "a"))
+
+    assert w.flush() == 0
+    assert w.stats()["backoff"] > 0
+    assert [r[3] for r in w.pending("u1")] == ["a"]
+
+    w._wakeup.clear()
+    w.add(ws, _row("u1", "b"))  # buffer penuh, tapi sedang backoff
+    assert not w._wakeup.is_set()
+
+    assert w.flush() == 2
+    assert [r[3] for r in ws.appended] == ["a", "b"]
+    assert w.stats()["backoff"] == 0
+
+
+def test_discard_only_removes_that_user(monkeypatch):
+    w = _writer(monkeypatch)
+    ws = _FakeWorksheet(w)
+    w.add(ws, _row("u1", "a"))
+    w.add(ws, _row("u2", "b"))
+    assert w.discard("u1") == 1
+    assert [r[1] for r in w.pending()] == ["u2"]
+
+
+def test_row_ranges_groups_consecutive_rows():
+    assert sheets._row_ranges([9, 2, 3, 4, 7, 10]) == [(2, 4), (7, 7), (9, 10)]
+    assert sheets._row_ranges([]) == []
+
+
+def test_hold_blocks_flush_until_released(monkeypatch):
+    w = _writer(monkeypatch)
+    ws = _FakeWorksheet(w)
+    w.add(ws, _row("u1", "a"))
+
+    done = []
+    with w.hold():
+        t = threading.Thread(target=lambda: done.append(w.flush()))
+        t.start()
+        t.join(timeout=0.2)
+        assert not done and ws.appended == []
+    t.join(timeout=2)
+    assert done == [1]
+
+
+class _SheetWs:
+    """Worksheet palsu berisi kolom user_id; deleteDimension benar-benar menggeser baris."""
+
+    id = 7
+
+    def __init__(self, col):
+        self.col = list(col)
+        self.deleted = []
+        self.spreadsheet = self
+        self.before_get = None
+
+    def col_values(self, col):
+        return list(self.col)
+
+    def get(self, a1):
+        if self.before_get:
+            hook, self.before_get = self.before_get, None
+            hook()
+        start, end = (int(x[1:]) for x in a1.split(":"))
+        return [[v] for v in self.col[start - 1:end]]
+
+    def batch_update(self, body):
+        for req in body["requests"]:
+            r = req["deleteDimension"]["range"]
+            self.deleted.append((r["startIndex"], r["endIndex"]))
+            del self.col[r["startIndex"]:r["endIndex"]]
+
+
+def _clear_setup(monkeypatch, ws):
+    monkeypatch.setattr(sheets, "ensure_header", lambda: None)
+    monkeypatch.setattr(sheets, "_get_worksheet", lambda: ws)
+    monkeypatch.setattr(sheets, "_WRITER", sheets._HistoryWriter())
+
+
+def test_clear_history_deletes_user_ranges_bottom_up(monkeypatch):
+    ws = _SheetWs(["user_id", "u1", "u1", "u2", "u1"])
+    _clear_setup(monkeypatch, ws)
+
+    assert sheets.clear_history("u1") == 3
+    assert ws.deleted == [(4, 5), (1, 3)]
+    assert ws.col == ["user_id", "u2"]
+
+
+def test_clear_history_rescans_when_rows_shift(monkeypatch):
+    ws = _SheetWs(["user_id", "u3", "u2", "u1"])
+    _clear_setup(monkeypatch, ws)
+    # replica lain menghapus baris 2 di antara scan dan delete → index 4 sudah basi
+    ws.before_get = lambda: ws.col.pop(1)
+
+    assert sheets.clear_history("u1") == 1
+    assert ws.col == ["user_id", "u2"]  # baris u2 tidak ikut terhapus
@@ -0,0 +1,171 @@
+# tests/test_job_queue.py
+import threading
+import time
+
+from job_queue import JobQueue
+
+
+def _queue(path, compute=None, send=None, **kw):
+    return JobQueue(
+        compute=compute or (lambda chat_id, text: [f"jawab {text}"]),
+        send=send or (lambda chat_id, part: None),
+        workers=1,
+        path=str(path),
+        **kw,
+    )
+
+
+def _row(q, job_id):
+    return q._conn.execute(
+        "SELECT status, owner, attempts, not_before, sent_parts FROM jobs WHERE id = ?", (job_id,)
+    ).fetchone()
+
+
+def test_claim_is_exclusive_across_processes(tmp_path):
+    db = tmp_path / "jobs.sqlite3"
+    a, b = _queue(db), _queue(db)
+    a.enqueue("m1", "chat-1", "halo")
+
+    job = a._claim()
+    assert job is not None and job["message_id"] == "m1"
+    assert b._claim() is None  # sudah 'running' milik a, lease masih berlaku
+    assert _row(a, job["id"])[1] == a.owner
+
+
+def test_per_chat_order_enforced_in_sql(tmp_path):
+    db = tmp_path / "jobs.sqlite3"
+    a, b = _queue(db), _queue(db)
+    a.enqueue("m1", "chat-1", "satu")
+    a.enqueue("m2", "chat-1", "dua")
+    a.enqueue("m3", "chat-2", "tiga")
+
+    first = a._claim()
+    second = b._claim()
+    assert first["message_id"] == "m1"
+    assert second["message_id"] == "m3"  # m2 menunggu m1 selesai walau beda proses
+    assert b._claim() is None
+
+
+def test_expired_lease_is_recovered(tmp_path):
+    db = tmp_path / "jobs.sqlite3"
+    a, b = _queue(db, lease_seconds=1), _queue(db)
+    a.enqueue("m1", "chat-1", "halo")
+    job = a._claim()
+    a._conn.execute("UPDATE jobs SET lease_until = ? WHERE id = ?", (time.time() - 1, job["id"]))
+
+    again = b._claim()
+    assert again is not None and again["id"] == job["id"]
+    assert again["attempts"] == 2
+
+
+def test_retry_uses_not_before_instead_of_sleeping(tmp_path):
+    def boom(chat_id, part):
+        raise IOError("WAHA down")
+
+    q = _queue(tmp_path / "jobs.sqlite3", send=boom, max_attempts=3)
+    q.enqueue("m1", "chat-1", "halo")
+    job = q._claim()
+
+    t0 = time.perf_counter()
+    q._process(job)
+    assert time.perf_counter() - t0 < 1.0
+
+    status, owner, attempts, not_before, _ = _row(q, job["id"])
+    assert (status, owner, attempts) == ("pending", None, 1)
+    assert not_before > time.time()
+    assert q._claim() is None  # belum lewat backoff
+
+
+def test_retry_resends_only_unsent_parts_without_recompute(tmp_path):
+    calls = {"compute": 0}
+    sent = []
+    fail = {"n": 1}
+
+    def compute(chat_id, text):
+        calls["compute"] += 1
+        yield "p1"
+        yield "p2"
+
+    def send(chat_id, part):
+        if part == "p2" and fail["n"]:
+            fail["n"] -= 1
+            raise IOError("timeout")
+        sent.append(part)
+
+    q = _queue(tmp_path / "jobs.sqlite3", compute=compute, send=send)
+    q.enqueue("m1", "chat-1", "halo")
+    q._process(q._claim())
+    q._conn.execute("UPDATE jobs SET not_before = 0")
+    q._process(q._claim())
+
+    assert sent == ["p1", "p2"]
+    assert calls["compute"] == 1
+    assert _row(q, 1)[0] == "done"
+
+
+def test_retry_after_crash_skips_parts_already_sent(tmp_path):
+    sent = []
+    q = _queue(tmp_path / "jobs.sqlite3", compute=lambda c, t: iter(["p1", "p2", "p3"]),
+               send=lambda c, part: sent.append(part))
+    q.enqueue("m1", "chat-1", "halo")
+    job = q._claim()
+    # simulasi proses mati setelah 2 part terkirim: reply belum tersimpan
+    q._conn.execute("UPDATE jobs SET sent_parts = 2, lease_until = 0 WHERE id = ?", (job["id"],))
+
+    q._process(q._claim())
+    assert sent == ["p3"]
+
+
+def test_compute_error_keeps_partial_reply_for_retry(tmp_path):
+    calls = {"compute": 0}
+    sent = []
+
+    def compute(chat_id, text):
+        calls["compute"] += 1
+        yield "p1"
+        raise RuntimeError("LLM putus")
+
+    fail = {"n": 1}
+
+    def send(chat_id, part):
+        if fail["n"]:
+            fail["n"] -= 1
+            raise IOError("timeout")
+        sent.append(part)
+
+    q = _queue(tmp_path / "jobs.sqlite3", compute=compute, send=send)
+    q.enqueue("m1", "chat-1", "halo")
+    q._process(q._claim())
+    q._conn.execute("UPDATE jobs SET not_before = 0")
+    q._process(q._claim())
+
+    assert sent == ["p1"]
+    assert calls["compute"] == 1
+
+
+def test_worker_claims_outside_inprocess_lock(tmp_path):
+    q = _queue(tmp_path / "jobs.sqlite3")
+    q.enqueue("m1", "chat-1", "halo")
+    with q._lock:  # lock hanya menjaga counter/_wakeup, bukan transaksi SQLite
+        t = threading.Thread(target=q._worker, daemon=True)
+        t.start()
+        deadline = time.time() + 3
+        while _row(q, 1)[0] == "pending" and time.time() < deadline:
+            time.sleep(0.05)
+        assert _row(q, 1)[0] == "running"
+        q._stop.set()
+    t.join(timeout=3)
+
+
+def test_heartbeat_purges_old_jobs(tmp_path):
+    q = _queue(tmp_path / "jobs.sqlite3", lease_seconds=1, purge_interval=0.1)
+    q.enqueue("m1", "chat-1", "halo")
+    q._conn.execute("UPDATE jobs SET status = 'done', updated_at = 0")
+    t = threading.Thread(target=q._heartbeat, daemon=True)
+    t.start()
+    deadline = time.time() + 3
+    while q.stats()["purged"] == 0 and time.time() < deadline:
+        time.sleep(0.05)
+    q._stop.set()
+    t.join(timeout=2)
+    assert q._conn.execute("SELECT COUNT(*) FROM jobs").fetchone()[0] == 0
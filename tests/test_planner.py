@@ -0,0 +1,69 @@
+# tests/test_planner.py
+import json
+
+from planner import TieredPlanner, rule_plan
+
+
+class _FakeChain:
+    def __init__(self, text):
+        self.text = text
+        self.calls = 0
+
+    def invoke(self, inputs, config=None):
+        self.calls += 1
+        return self.text
+
+
+def test_rule_plan_more():
+    assert rule_plan("lanjut")["intent"] == "more"
+    assert rule_plan("5 lagi")["k"] == 5
+    assert rule_plan("tambah 3")["k"] == 3
+    assert (rule_plan("lanjut 5 ayat")["intent"], rule_plan("lanjut 5 ayat")["k"]) == ("more", 5)
+
+
+def test_rule_plan_detail_and_search():
+    plan = rule_plan("Jelaskan ayat 15 menurut hamka?")
+    assert (plan["intent"], plan["ayat_number"], plan["source"]) == ("detail", 15, "hamka")
+
+    plan = rule_plan("3 ayat tentang sifat tamak")
+    assert (plan["intent"], plan["query"], plan["k"]) == ("search", "sifat tamak", 3)
+
+
+def test_rule_plan_unsure_returns_none():
+    assert rule_plan("") is None
+    assert rule_plan("gambaran hisab") is None
+    assert rule_plan("ayat tentang surat al-baqarah") is None  # di luar dataset → biar LLM/clarify
+
+
+def test_tiered_planner_skips_llm_when_rules_hit():
+    chain = _FakeChain('{"intent": "search", "query": "x"}')
+    planner = TieredPlanner(chain, llm=True)
+    assert json.loads(planner.invoke({"user_text": "lanjut"}))["intent"] == "more"
+    assert chain.calls == 0
+    assert planner.stats()["rule_hits"] == 1
+
+
+def test_tiered_planner_caches_valid_llm_plan():
+    chain = _FakeChain('{"intent": "search", "query": "hisab"}')
+    planner = TieredPlanner(chain, llm=True)
+    planner.invoke({"user_text": "yang berikutnya gimana"})
+    planner.invoke({"user_text": "Yang  BERIKUTNYA gimana"})
+    assert chain.calls == 1
+    assert planner.stats()["cache_hits"] == 1
+
+
+def test_tiered_planner_skips_llm_for_unambiguous_query():
+    chain = _FakeChain('{"intent": "search"}')
+    planner = TieredPlanner(chain)  # tier LLM aktif secara default
+    assert planner.llm
+    assert planner.invoke({"user_text": "gambaran hisab"}) == ""
+    assert chain.calls == 0
+    assert planner.stats()["llm_skipped"] == 1
+
+
+def test_tiered_planner_without_llm_tier_returns_empty():
+    chain = _FakeChain('{"intent": "search"}')
+    planner = TieredPlanner(chain, llm=False)
+    assert planner.invoke({"user_text": "gambaran hisab"}) == ""
+    assert chain.calls == 0
+    assert planner.stats()["misses"] == 1
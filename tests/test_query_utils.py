@@ -0,0 +1,19 @@
+# tests/test_query_utils.py
+from query_utils import ayat_lookup_key, resolve_surat_key
+
+
+def test_variants_resolve_to_one_key():
+    assert resolve_surat_key("Al-Infithar") == resolve_surat_key("AL-INFITAR") == "AL-INFITAR"
+    assert resolve_surat_key("Al-Muthaffifin") == resolve_surat_key("al mutaffifin")
+
+
+def test_unprefixed_and_folded_forms_resolve():
+    assert resolve_surat_key("infitar") == "AL-INFITAR"
+    assert resolve_surat_key("infithar") == "AL-INFITAR"
+    assert resolve_surat_key("naba") == resolve_surat_key("An-Naba'")
+    assert resolve_surat_key("ghashiyah") == resolve_surat_key("Al-Ghasyiyah")
+    assert ayat_lookup_key("zalzalah", 7) == "AZ-ZALZALAH:7"
+
+
+def test_unknown_name_is_normalized():
+    assert resolve_surat_key("At-Tariq") == "AT-TARIQ"
@@ -0,0 +1,47 @@
+# tests/test_ranked_results.py
+import sys
+
+from ranked_results import RankedResults, as_ranked
+
+
+def _rows(n):
+    return [{"nama_surat": "Al-Infitar" if i % 2 else "An-Naba'", "ayat_ke": i, "score": 0.5 + i / 100}
+            for i in range(1, n + 1)]
+
+
+def test_behaves_like_list_of_light_rows():
+    rr = RankedResults(_rows(5))
+
+    assert len(rr) == 5
+    assert rr[0] == {"nama_surat": "Al-Infitar", "ayat_ke": 1, "score": 0.51}
+    assert rr[-1]["ayat_ke"] == 5
+    assert [r["ayat_ke"] for r in rr[1:3]] == [2, 3]
+    assert [r["ayat_ke"] for r in rr] == [1, 2, 3, 4, 5]
+    assert rr._names == ["Al-Infitar", "An-Naba'"]  # nama surat disimpan sekali
+
+
+def test_append_accepts_ayat_alias_and_missing_score():
+    rr = RankedResults()
+    rr.append({"nama_surat": "Abasa", "ayat": 7})
+    assert rr[0] == {"nama_surat": "Abasa", "ayat_ke": 7, "score": 0.0}
+
+
+def test_dict_roundtrip():
+    rr = RankedResults(_rows(4))
+    again = RankedResults.from_dict(rr.to_dict())
+    assert list(again) == list(rr)
+    again.append({"nama_surat": "Abasa", "ayat_ke": 1, "score": 1.0})
+    assert len(again) == 5 and len(rr) == 4
+
+
+def test_smaller_than_list_of_dicts():
+    rows = _rows(200)
+    rr = RankedResults(rows)
+    as_list = sys.getsizeof(rows) + sum(sys.getsizeof(r) for r in rows)
+    assert sys.getsizeof(rr) < as_list / 4
+
+
+def test_as_ranked_does_not_copy():
+    rr = RankedResults(_rows(2))
+    assert as_ranked(rr) is rr
+    assert len(as_ranked(None)) == 0
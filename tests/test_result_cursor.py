@@ -0,0 +1,79 @@
+# tests/test_result_cursor.py
+from result_cursor import CURSOR_OVERFETCH, ResultCursor
+
+
+def _index(n, dup_every=0):
+    """search_fn palsu: n baris terurut skor; dup_every>0 → ada baris duplikat (sebelum dedup)."""
+    rows = []
+    for i in range(n):
+        rows.append({"nama_surat": "An-Naba'", "ayat_ke": i + 1, "score": 1.0 - i / 1000})
+        if dup_every and i % dup_every == 0:
+            rows.append(dict(rows[-1]))
+    calls = []
+
+    def search(limit):
+        calls.append(limit)
+        return rows[:limit]
+
+    return search, calls
+
+
+def test_take_pages_without_requery():
+    search, calls = _index(100)
+    cur = ResultCursor.open(search, limit=5, show=5)
+    first, second = cur.take(5), cur.take(5)
+
+    assert [r["ayat_ke"] for r in first] == [1, 2, 3, 4, 5]
+    assert [r["ayat_ke"] for r in second] == [6, 7, 8, 9, 10]
+    assert calls == [5 * CURSOR_OVERFETCH]
+
+
+def test_refill_doubles_limit_and_skips_known_rows():
+    search, calls = _index(100)
+    cur = ResultCursor.open(search, limit=5, show=5)
+    cur.take(cur.remaining)
+    batch = cur.take(5, search_fn=search)
+
+    assert [r["ayat_ke"] for r in batch] == [16, 17, 18, 19, 20]
+    assert calls[1] >= calls[0] * 2
+    assert cur.refills == 1 and len(cur.candidates) == calls[1]
+
+
+def test_duplicates_do_not_mark_exhausted():
+    search, _ = _index(100, dup_every=2)
+    cur = ResultCursor.open(search, limit=10, show=10)
+    assert len(cur.candidates) < cur.fetched_limit  # ada duplikat yang dibuang
+    assert not cur.exhausted  # index masih mengembalikan limit penuh
+
+
+def test_small_index_is_exhausted_after_empty_refill():
+    search, calls = _index(7)
+    cur = ResultCursor.open(search, limit=5, show=5)
+    cur.take(5)
+    assert len(cur.take(5, search_fn=search)) == 2
+    assert len(cur.take(5, search_fn=search)) == 0
+    assert cur.exhausted and len(calls) == 2  # refill tanpa ayat baru → habis, tidak query lagi
+
+
+def test_multi_row_ayat_does_not_end_pagination_early():
+    # tiap ayat punya 2 node terjemahan → limit hit index hanya menghasilkan limit/2 ayat (teragregasi)
+    calls = []
+
+    def search(limit):
+        calls.append(limit)
+        return [{"nama_surat": "An-Naba'", "ayat_ke": i + 1, "score": 1.0 - i / 1000}
+                for i in range(min(limit // 2, 100))]
+
+    cur = ResultCursor.open(search, limit=5, show=5)
+    cur.take(cur.remaining)
+    assert not cur.exhausted
+    assert len(cur.take(5, search_fn=search)) == 5
+    assert len(calls) == 2
+
+
+def test_roundtrip_dict():
+    search, _ = _index(50)
+    cur = ResultCursor.open(search, limit=5, show=5)
+    cur.take(5)
+    again = ResultCursor.from_dict(cur.to_dict(include_candidates=False), candidates=cur.candidates)
+    assert [r["ayat_ke"] for r in again.take(2)] == [6, 7]
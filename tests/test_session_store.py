@@ -0,0 +1,83 @@
+# tests/test_session_store.py
+from array import array
+
+import state as state_mod
+from ranked_results import RankedResults
+from session_store import (
+    BASE_KEY, VERSION_KEY, InMemorySessionStore, SQLiteSessionStore, decode_state, encode_state,
+)
+
+
+def test_encode_decode_roundtrip_is_compact():
+    vec = [0.1 * i for i in range(64)]
+    state = {
+        "active_topic": "hari hisab",
+        "last_query_embedding": vec,
+        "last_results": RankedResults([{"nama_surat": "An-Naba'", "ayat_ke": 1, "score": 0.9}]),
+        "last_focus": {"hamka"},
+        VERSION_KEY: 3,
+        BASE_KEY: b"lama",
+    }
+    out = decode_state(encode_state(state))
+
+    assert VERSION_KEY not in out and BASE_KEY not in out
+    assert out["active_topic"] == "hari hisab"
+    assert isinstance(out["last_query_embedding"], array)  # float32 biner, bukan teks
+    assert list(out["last_query_embedding"]) == list(array("f", vec))
+    assert out["last_results"][0] == {"nama_surat": "An-Naba'", "ayat_ke": 1, "score": 0.9}
+    assert out["last_focus"] == ["hamka"]
+
+
+def test_sqlite_save_rejects_stale_version(tmp_path):
+    store = SQLiteSessionStore(path=str(tmp_path / "s.sqlite3"))
+    assert store.save("s1", {"cursor": 0})
+
+    a, b = store.load("s1"), store.load("s1")
+    a["cursor"] = 5
+    assert store.save("s1", a)
+    b["cursor"] = 10
+    assert not store.save("s1", b)
+    assert store.load("s1")["cursor"] == 5
+    assert store.stats()["conflicts"] == 1
+
+
+def test_save_state_reapplies_changes_on_conflict(tmp_path, monkeypatch):
+    store = SQLiteSessionStore(path=str(tmp_path / "s.sqlite3"))
+    monkeypatch.setattr(state_mod, "_SESSION_STORE", store)
+    store.save("s1", {"cursor": 0, "active_topic": "hisab"})
+
+    a, b = store.load("s1"), store.load("s1")
+    a["active_topic"] = "mizan"
+    assert state_mod.save_state("s1", a)
+    b["cursor"] = 5
+    assert state_mod.save_state("s1", b)  # konflik → rebase → tersimpan
+
+    final = store.load("s1")
+    assert (final["cursor"], final["active_topic"]) == (5, "mizan")
+    assert b["active_topic"] == "mizan"  # state pemanggil ikut diperbarui
+
+
+def test_memory_stats_respects_top():
+    store = InMemorySessionStore()
+    for i in range(4):
+        store.save(f"s{i}", {"history": ["x" * (i * 100)]})
+    assert len(store.stats(top=2)["largest"]) == 2
+
+
+def test_memory_size_measured_once_at_save(monkeypatch):
+    measured = []
+    store = InMemorySessionStore()
+    real_sizeof = store._lru._sizeof
+    monkeypatch.setattr(store._lru, "_sizeof", lambda v: measured.append(len(v["history"])) or real_sizeof(v))
+    monkeypatch.setattr(state_mod, "_SESSION_STORE", store)
+
+    st = state_mod.get_state("s1")
+    st["history"].extend(f"{i}" * 1000 for i in range(10))
+    state_mod.save_state("s1", st)
+
+    st = state_mod.get_state("s1")
+    st["history"].append("lagi")
+    state_mod.save_state("s1", st)
+
+    # 1 pengukuran per request, selalu setelah request mengubah state
+    assert measured == [10, 11]